@@ -0,0 +1,191 @@
+/*
+ * Licensed to the Apache Software Foundation (ASF) under one
+ * or more contributor license agreements.  See the NOTICE file
+ * distributed with this work for additional information
+ * regarding copyright ownership.  The ASF licenses this file
+ * to you under the Apache License, Version 2.0 (the
+ * "License"); you may not use this file except in compliance
+ * with the License.  You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+package org.apache.ratis.examples.counter.server;
+
+import org.apache.ratis.protocol.RaftGroup;
+import org.apache.ratis.protocol.RaftGroupId;
+import org.apache.ratis.protocol.RaftPeer;
+
+import java.io.BufferedReader;
+import java.io.File;
+import java.io.InputStreamReader;
+import java.io.OutputStreamWriter;
+import java.io.PrintWriter;
+import java.net.Socket;
+import java.util.ArrayList;
+import java.util.Collections;
+import java.util.HashMap;
+import java.util.List;
+import java.util.Map;
+import java.util.UUID;
+import java.util.concurrent.TimeUnit;
+
+import static java.nio.charset.StandardCharsets.UTF_8;
+
+/**
+ * Hosts every {@link CounterServer} of a cluster in one JVM, so that a cluster
+ * pays for one heap and one JIT warmup instead of one per peer.
+ * <p>
+ * The fuzzer listens on a control port and this host connects to it. Commands
+ * are lines on that connection:
+ * <ul>
+ *   <li>{@code start <peerIndex> <restart>} builds and starts the peer's server</li>
+ *   <li>{@code crash <peerIndex>} closes it, its storage directory is kept for a restart</li>
+ * </ul>
+ * and the host answers with {@code exited <peerIndex> <code>} once a server stopped,
+ * 0 after a shutdown, -9 after a crash and 1 on an exception, which is also sent as
+ * {@code error <peerIndex> <message>}. The host exits when the connection closes.
+ * <p>
+ * A crash is a graceful {@code RaftServer.close()}: the server stops its
+ * threads and closes its log in order. A peer in its own JVM is killed with SIGKILL instead, so
+ * crashes here cannot reveal bugs in recovering from an abrupt stop, such as a torn log write.
+ */
+public final class CounterClusterHost {
+  private static final int CRASHED = -9;
+
+  private final int runId;
+  private final int fuzzerPort;
+  private final int[] listenerPorts;
+  private final List<RaftPeer> peers;
+  private final RaftGroup group;
+  private final PrintWriter out;
+  private final Map<Integer, Node> nodes = new HashMap<>();
+
+  private static final class Node {
+    private Thread thread;
+    private volatile boolean crashed = false;
+  }
+
+  private CounterClusterHost(int runId, int fuzzerPort, int[] listenerPorts, List<RaftPeer> peers, RaftGroup group,
+                             PrintWriter out) {
+    this.runId = runId;
+    this.fuzzerPort = fuzzerPort;
+    this.listenerPorts = listenerPorts;
+    this.peers = peers;
+    this.group = group;
+    this.out = out;
+  }
+
+  private void send(String line) {
+    synchronized (out) {
+      out.println(line);
+    }
+  }
+
+  private void start(int peerIndex, int restart) {
+    final Node running = nodes.get(peerIndex);
+    if (running != null && running.thread.isAlive()) {
+      return;
+    }
+    final Node node = new Node();
+    node.thread = new Thread(() -> runNode(node, peerIndex, restart), "node-" + peerIndex);
+    nodes.put(peerIndex, node);
+    node.thread.start();
+  }
+
+  private void crash(int peerIndex) throws InterruptedException {
+    // Waits for the server to close, so that a restart can bind its ports again
+    final Node node = nodes.get(peerIndex);
+    if (node == null || !node.thread.isAlive()) {
+      return;
+    }
+    node.crashed = true;
+    node.thread.join();
+  }
+
+  private void closeAll() throws InterruptedException {
+    for (int peerIndex : new ArrayList<>(nodes.keySet())) {
+      crash(peerIndex);
+    }
+  }
+
+  private void runNode(Node node, int peerIndex, int restart) {
+    final RaftPeer peer = peers.get(peerIndex-1);
+    final File storageDir = new File("./data/" + runId + "/" + peer.getId());
+    int code = 0;
+    try(CounterServer counterServer = new CounterServer(peer, storageDir, group, fuzzerPort,
+        listenerPorts[peerIndex-1], restart, runId)) {
+      counterServer.start();
+
+      while(!node.crashed && !counterServer.getServerRpc().getParam("Shutdown")) {
+        TimeUnit.MILLISECONDS.sleep(1);
+      }
+
+      if (!node.crashed) {
+        HashMap<String, Object> eventParams = new HashMap<>();
+        eventParams.put("type", "ShutdownReady");
+        counterServer.getServerRpc().sendEvent(eventParams);
+      }
+    } catch(Throwable e) {
+      if (!node.crashed) {
+        e.printStackTrace();
+        send("error " + peerIndex + " " + String.valueOf(e).replace('\n', ' '));
+        code = 1;
+      }
+    }
+    send("exited " + peerIndex + " " + (node.crashed ? CRASHED : code));
+  }
+
+  public static void main(String[] args) {
+    // java -Dlog4j.configuration=file:ratis-examples/src/main/resources/log4j.properties -cp ratis-examples/target/ratis-examples-2.5.1.jar org.apache.ratis.examples.counter.server.CounterClusterHost 0 7073 40000 6002,6003,6004 127.0.0.1:10000,127.0.0.1:10001,127.0.0.1:10002 02511d47-d67c-49a3-9011-abb3109a44c1
+    try {
+      int run_id = Integer.parseInt(args[0]);
+      int fuzzerPort = Integer.parseInt(args[1]);
+      int controlPort = Integer.parseInt(args[2]);
+
+      String[] ports = args[3].split(",");
+      int[] listenerPorts = new int[ports.length];
+      for (int i = 0; i < ports.length; i++) {
+        listenerPorts[i] = Integer.parseInt(ports[i]);
+      }
+
+      String[] addresses = args[4].split(",");
+      final List<RaftPeer> peers = new ArrayList<>(addresses.length);
+      final int priority = 0;
+      for (int i = 0; i < addresses.length; i++) {
+        peers.add(RaftPeer.newBuilder().setId(Integer.toString(i+1)).setAddress(addresses[i]).setPriority(priority).build());
+      }
+
+      final List<RaftPeer> PEERS = Collections.unmodifiableList(peers);
+      final UUID GROUP_ID = UUID.fromString(args[5]);
+      final RaftGroup RAFT_GROUP = RaftGroup.valueOf(RaftGroupId.valueOf(GROUP_ID), PEERS);
+
+      System.setProperty("exp.build.data", "./data");
+      try(Socket control = new Socket("127.0.0.1", controlPort)) {
+        BufferedReader in = new BufferedReader(new InputStreamReader(control.getInputStream(), UTF_8));
+        PrintWriter out = new PrintWriter(new OutputStreamWriter(control.getOutputStream(), UTF_8), true);
+        CounterClusterHost host = new CounterClusterHost(run_id, fuzzerPort, listenerPorts, PEERS, RAFT_GROUP, out);
+
+        String line;
+        while ((line = in.readLine()) != null) {
+          String[] command = line.trim().split(" ");
+          if (command[0].equals("start")) {
+            host.start(Integer.parseInt(command[1]), Integer.parseInt(command[2]));
+          } else if (command[0].equals("crash")) {
+            host.crash(Integer.parseInt(command[1]));
+          }
+        }
+        host.closeAll();
+      }
+      System.exit(0);
+    } catch(Throwable e) {
+      e.printStackTrace();
+      System.exit(1);
+    }
+  }
+}
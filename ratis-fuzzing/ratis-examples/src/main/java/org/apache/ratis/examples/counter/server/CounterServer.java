@@ -67,7 +67,7 @@ import static java.nio.charset.StandardCharsets.UTF_8;
 public final class CounterServer implements Closeable {
   private final RaftServer server;
 
-  public CounterServer(RaftPeer peer, File storageDir, RaftGroup RAFT_GROUP, int fuzzerPort, int interceptorListenerPort, int restart) throws IOException {
+  public CounterServer(RaftPeer peer, File storageDir, RaftGroup RAFT_GROUP, int fuzzerPort, int interceptorListenerPort, int restart, int runId) throws IOException {
     //create a property object
     final RaftProperties properties = new RaftProperties();
 
@@ -91,6 +91,7 @@ public final class CounterServer implements Closeable {
     InterceptorConfigKeys.InterceptorListener.setPort(properties, interceptorListenerPort);
     InterceptorConfigKeys.setEnabled(properties, true);
     InterceptorConfigKeys.setEnableRegister(properties, restart == 0);
+    InterceptorConfigKeys.setRunId(properties, Integer.toString(runId));
     RaftServerConfigKeys.Rpc.setFirstElectionTimeoutMin(properties, TimeDuration.valueOf(5, TimeUnit.SECONDS));
     RaftServerConfigKeys.Rpc.setFirstElectionTimeoutMax(properties, TimeDuration.valueOf(5, TimeUnit.SECONDS));
     RaftServerConfigKeys.Rpc.setTimeoutMin(properties, TimeDuration.valueOf(2, TimeUnit.SECONDS));
@@ -172,7 +173,7 @@ public final class CounterServer implements Closeable {
     //   while(true){}
     // }
     
-    try(CounterServer counterServer = new CounterServer(currentPeer, storageDir, RAFT_GROUP, fuzzerPort, interceptorListenerPort, restart)) {
+    try(CounterServer counterServer = new CounterServer(currentPeer, storageDir, RAFT_GROUP, fuzzerPort, interceptorListenerPort, restart, runId)) {
       counterServer.start();
 
       // boolean crashFlag;
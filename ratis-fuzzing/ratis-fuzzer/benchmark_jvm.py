@@ -0,0 +1,66 @@
+import json
+import time
+import argparse
+import statistics
+
+from modelfuzz.jvm import JVM_PROFILES, StandaloneNodes, get_jvm_args
+
+# Measures launch-to-registration latency of a cluster's nodes per JVM profile
+
+def measure(name, args, jvm_args) -> dict:
+    latencies = []
+    timeouts = 0
+    for r in range(args.rounds):
+        nodes = StandaloneNodes(args.jar_path, args.nodes, jvm_args, run_id=r, fuzzer_port=args.fuzzer_port,
+                                base_node_port=args.base_node_port, base_listener_port=args.base_listener_port,
+                                data_dir=args.ratis_data_dir)
+        try:
+            elapsed = nodes.start(args.timeout)
+        finally:
+            nodes.stop()
+        if elapsed is None:
+            timeouts += 1
+        else:
+            latencies.append(elapsed)
+        # Let the ports of the killed nodes free up
+        time.sleep(1)
+    result = {'name': name, 'jvm_args': jvm_args, 'latencies': latencies, 'timeouts': timeouts}
+    if len(latencies) > 0:
+        result['mean'] = statistics.mean(latencies)
+        result['median'] = statistics.median(latencies)
+        result['min'] = min(latencies)
+        print(f'{name}: median {result["median"]*1000:.0f} ms, mean {result["mean"]*1000:.0f} ms, '
+              f'min {result["min"]*1000:.0f} ms over {len(latencies)} launches ({timeouts} timeouts)')
+    else:
+        print(f'{name}: no launch registered ({timeouts} timeouts)')
+    return result
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-jp', '--jar-path', type=str, default='../ratis-examples/target/ratis-examples-2.5.1.jar')
+    parser.add_argument('-p', '--profiles', nargs='+', type=str, choices=list(JVM_PROFILES), default=list(JVM_PROFILES))
+    parser.add_argument('-jvc', '--jvm-cds-archive', type=str, default=None) # Also measures every profile with this archive
+    parser.add_argument('-n', '--nodes', type=int, default=3)
+    parser.add_argument('-r', '--rounds', type=int, default=5)
+    parser.add_argument('-bfp', '--fuzzer-port', type=int, default=7070)
+    parser.add_argument('-bpp', '--base-node-port', type=int, default=6500)
+    parser.add_argument('-blp', '--base-listener-port', type=int, default=10500)
+    parser.add_argument('-rdd', '--ratis-data-dir', type=str, default='./data')
+    parser.add_argument('-to', '--timeout', type=int, default=60)
+    parser.add_argument('-o', '--output', type=str, default=None)
+    return parser.parse_args()
+
+def main() -> None:
+    args = parse_args()
+    results = []
+    for profile in args.profiles:
+        results.append(measure(profile, args, get_jvm_args(profile)))
+        if args.jvm_cds_archive is not None:
+            results.append(measure(f'{profile}, cds', args, get_jvm_args(profile, cds_archive=args.jvm_cds_archive)))
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent='\t')
+
+if __name__ == '__main__':
+    main()
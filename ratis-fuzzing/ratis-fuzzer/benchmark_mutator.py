@@ -0,0 +1,77 @@
+import copy
+import json
+import time
+import random
+import argparse
+import importlib.util
+
+from modelfuzz.fuzzer import Fuzzer
+from modelfuzz.mutator import MutatorFactory, MutatorType
+from modelfuzz.schedule import Steps
+
+# Compares generating mutants from lists, from one indexed schedule, and with
+# the mutator of an older tree given by --baseline, e.g.
+#   git show 3d1266d5:ratis-fuzzing/ratis-fuzzer/modelfuzz/mutator.py > /tmp/baseline_mutator.py
+
+def measure(name, fn, schedules, rounds) -> dict:
+    start = time.time()
+    mutants = 0
+    for _ in range(rounds):
+        for schedule in schedules:
+            mutants += len(fn(schedule))
+    elapsed = time.time() - start
+    print(f'{name}: {mutants / elapsed:.0f} mutants per second')
+    return {'name': name, 'seconds': elapsed, 'mutants': mutants}
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--nodes', type=int, default=3)
+    parser.add_argument('-st', '--steps', type=int, default=500)
+    parser.add_argument('-cq', '--crash-quota', type=int, default=5)
+    parser.add_argument('-fq', '--fault-quota', type=int, default=5)
+    parser.add_argument('-cr', '--client-requests', type=int, default=5)
+    parser.add_argument('-mm', '--max-messages', type=int, default=5)
+    parser.add_argument('-mc', '--mutation-count', type=int, default=10)
+    parser.add_argument('-mt', '--mutator-type', type=MutatorType, default=MutatorType.ALL)
+    parser.add_argument('-m', '--mutants', type=int, default=20) # Mutants per schedule
+    parser.add_argument('-sc', '--schedules', type=int, default=20)
+    parser.add_argument('-r', '--rounds', type=int, default=5)
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', type=str, default=None)
+    parser.add_argument('-bl', '--baseline', type=str, default=None) # mutator.py of an older tree
+    return parser.parse_args()
+
+def main() -> None:
+    args = parse_args()
+    random.seed(args.seed)
+    fuzzer = Fuzzer(args)
+    fuzzer.generate_schedules(args.schedules)
+    schedules = [sch for (_, sch) in fuzzer.sch_pool]
+
+    mutator = MutatorFactory.get_mutator(args.mutator_type, args)
+    results = []
+    results.append(measure('one at a time', lambda sch: [mutator.mutate(sch) for _ in range(args.mutants)],
+                           schedules, args.rounds))
+    results.append(measure('one at a time, shared index', lambda sch: [mutator.mutate(s) for s in [Steps(sch)] for _ in range(args.mutants)],
+                           schedules, args.rounds))
+    if args.baseline is not None:
+        spec = importlib.util.spec_from_file_location('baseline_mutator', args.baseline)
+        baseline = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(baseline)
+        old = baseline.MutatorFactory.get_mutator(baseline.MutatorType(args.mutator_type.value), args)
+        # Older mutators change the list and its step dicts in place, each mutant gets its own copy
+        results.append(measure('baseline', lambda sch: [old.mutate(copy.deepcopy(list(sch))) for _ in range(args.mutants)],
+                               schedules, args.rounds))
+
+    # Same seed, same mutants
+    first = MutatorFactory.get_mutator(args.mutator_type, args)
+    second = MutatorFactory.get_mutator(args.mutator_type, args)
+    deterministic = all(list(first.mutate(schedules[0])) == list(second.mutate(schedules[0])) for _ in range(args.mutants))
+    print(f'Deterministic under seed {args.seed}: {deterministic}')
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({'results': results, 'deterministic': deterministic}, f, indent='\t')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import subprocess
+
+from modelfuzz.tlc import TLCClient
+
+# Compares one request per trace with batched evaluation against local_tlc_server.py
+
+def generate_trace(rng, nodes, length) -> list[dict]:
+    trace = []
+    for _ in range(length):
+        node = rng.randint(1, nodes)
+        other = rng.choice([n for n in range(1, nodes+1, 1) if n != node])
+        name = rng.choice(['SendMessage', 'DeliverMessage', 'DeliverMessage', 'Timeout', 'BecomeLeader', 'ClientRequest'])
+        if name == 'DeliverMessage':
+            params = {'type': rng.choice(['MsgVote', 'MsgVoteResp', 'MsgApp', 'MsgAppResp']), 'term': rng.randint(0, 3),
+                      'from': other, 'to': node, 'log_term': 0, 'index': 0, 'commit': 0, 'entries': [],
+                      'reject': rng.random() < 0.2, 'node': node}
+        elif name == 'BecomeLeader':
+            params = {'node': node, 'term': rng.randint(1, 3)}
+        elif name == 'ClientRequest':
+            params = {'leader': node, 'request': rng.randint(1, 10), 'node': node}
+        else:
+            params = {'node': node}
+        trace.append({'name': name, 'params': params})
+    return trace
+
+def wait_for_port(port, timeout=30) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f'Stand-in TLC server did not open port {port}')
+
+def start_server(args, port, batch) -> subprocess.Popen:
+    cmd = [sys.executable, 'local_tlc_server.py', '-p', str(port), '-n', str(args.nodes),
+           '-rl', str(args.request_latency), '-tl', str(args.trace_latency)]
+    if not batch:
+        cmd.append('-nb')
+    server = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+    wait_for_port(port)
+    return server
+
+def measure(name, fn, traces, rounds) -> dict:
+    start = time.time()
+    for _ in range(rounds):
+        results = fn(traces)
+    elapsed = (time.time() - start) / rounds
+    print(f'{name}: {elapsed*1000:.1f} ms per batch of {len(traces)} traces')
+    return {'name': name, 'seconds': elapsed, 'states': sum(len(r) for r in results)}
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-p', '--port', type=int, default=2099)
+    parser.add_argument('-n', '--nodes', type=int, default=3)
+    parser.add_argument('-b', '--batch-size', type=int, default=5)
+    parser.add_argument('-tl', '--trace-length', type=int, default=1000)
+    parser.add_argument('-r', '--rounds', type=int, default=10)
+    parser.add_argument('-rl', '--request-latency', type=float, default=20)
+    parser.add_argument('-ttl', '--trace-latency', type=float, default=5)
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', type=str, default=None)
+    return parser.parse_args()
+
+def main() -> None:
+    args = parse_args()
+    rng = random.Random(args.seed)
+    traces = [generate_trace(rng, args.nodes, args.trace_length) for _ in range(args.batch_size)]
+
+    results = []
+    server = start_server(args, args.port, True)
+    client = TLCClient([f'127.0.0.1:{args.port}'])
+    try:
+        results.append(measure('sequential', lambda ts: [client.execute(t) for t in ts], traces, args.rounds))
+        results.append(measure('batched', client.execute_batch, traces, args.rounds))
+    finally:
+        client.close()
+        server.terminate()
+        server.wait()
+
+    server = start_server(args, args.port, False)
+    client = TLCClient([f'127.0.0.1:{args.port}'])
+    try:
+        results.append(measure('batched, fallback', client.execute_batch, traces, args.rounds))
+    finally:
+        client.close()
+        server.terminate()
+        server.wait()
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent='\t')
+
+if __name__ == '__main__':
+    main()
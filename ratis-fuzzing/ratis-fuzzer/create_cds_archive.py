@@ -0,0 +1,54 @@
+import os
+import argparse
+
+from modelfuzz.jvm import JVM_PROFILES, GC_FLAGS, StandaloneNodes, get_jvm_args
+
+# One-time step: records the classes a Ratis node loads during a training run
+# into a dynamic AppCDS archive (JDK 13+), for --jvm-cds-archive. Node 1 runs
+# with -XX:ArchiveClassesAtExit and is stopped with SIGTERM, so that the JVM
+# exits normally and writes the archive. Re-create it when the jar or the JDK
+# changes, a mismatching archive is ignored by the JVM.
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-jp', '--jar-path', type=str, default='../ratis-examples/target/ratis-examples-2.5.1.jar')
+    parser.add_argument('-o', '--output', type=str, default='./ratis-examples.jsa')
+    parser.add_argument('-n', '--nodes', type=int, default=3)
+    parser.add_argument('-d', '--duration', type=float, default=10) # Seconds of message delivery after registration
+    parser.add_argument('-jvp', '--jvm-profile', type=str, choices=list(JVM_PROFILES), default='default') # Train with the flags the fuzzer uses
+    parser.add_argument('-jvh', '--jvm-heap', type=str, default=None)
+    parser.add_argument('-jvg', '--jvm-gc', type=str, choices=list(GC_FLAGS), default=None)
+    parser.add_argument('-bfp', '--fuzzer-port', type=int, default=7070)
+    parser.add_argument('-bpp', '--base-node-port', type=int, default=6500)
+    parser.add_argument('-blp', '--base-listener-port', type=int, default=10500)
+    parser.add_argument('-rdd', '--ratis-data-dir', type=str, default='./data')
+    parser.add_argument('-to', '--timeout', type=int, default=60)
+    return parser.parse_args()
+
+def main() -> None:
+    args = parse_args()
+    output = os.path.abspath(args.output)
+    if os.path.exists(output):
+        os.remove(output)
+    jvm_args = get_jvm_args(args.jvm_profile, args.jvm_heap, args.jvm_gc)
+    nodes = StandaloneNodes(args.jar_path, args.nodes, jvm_args, fuzzer_port=args.fuzzer_port,
+                            base_node_port=args.base_node_port, base_listener_port=args.base_listener_port,
+                            data_dir=args.ratis_data_dir, node_jvm_args={1: [f'-XX:ArchiveClassesAtExit={output}']})
+    try:
+        elapsed = nodes.start(args.timeout)
+        if elapsed is None:
+            print(f'Nodes did not register within {args.timeout}s, see the node logs')
+            return
+        print(f'Nodes registered after {elapsed:.2f}s, training for {args.duration}s')
+        nodes.drive(args.duration)
+        if not nodes.terminate(1, args.timeout):
+            print('Node 1 did not exit, no archive was written')
+    finally:
+        nodes.stop()
+    if os.path.exists(output):
+        print(f'CDS archive written to {output} ({os.path.getsize(output) // 1024} KiB)')
+    else:
+        print('No CDS archive was written, a JDK 13 or newer is needed')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import time
+import json
+import argparse
+
+from aiohttp import web
+from modelfuzz.evaluator import RaftEvaluator
+
+# Stand-in for tla2tools_server.jar. It answers /execute and /execute_batch like
+# TLCServer, but evaluates traces with the embedded evaluator. Requests are
+# handled one at a time like the real server, with configurable latencies.
+class LocalTLCServer():
+    def __init__(self, nodes=3, request_latency=0, trace_latency=0, batch=True) -> None:
+        self.evaluator = RaftEvaluator(nodes)
+        self.request_latency = request_latency
+        self.trace_latency = trace_latency
+        self.batch = batch
+        self.requests = 0
+        self.traces = 0
+
+    def split_traces(self, events) -> list[list[dict]]:
+        traces = [[]]
+        for e in events:
+            if 'reset' in e:
+                traces.append([])
+            else:
+                traces[-1].append(e)
+        if len(traces) > 1 and len(traces[-1]) == 0:
+            traces.pop()
+        return traces
+
+    def simulate(self, events) -> dict:
+        self.traces += 1
+        time.sleep(self.trace_latency / 1000)
+        states = self.evaluator.execute(events)
+        return {'states': [s['state'] for s in states], 'keys': [s['key'] for s in states]}
+
+    async def read_events(self, request) -> list[dict]:
+        # aiohttp already inflates gzip request bodies
+        body = await request.read()
+        self.requests += 1
+        # Blocking on purpose, the real server does not overlap requests either
+        time.sleep(self.request_latency / 1000)
+        return json.loads(body)
+
+    async def execute(self, request) -> web.Response:
+        try:
+            events = await self.read_events(request)
+            return web.json_response(self.simulate(self.split_traces(events)[0]))
+        except Exception as e:
+            return web.Response(status=500, text=str(e))
+
+    async def execute_batch(self, request) -> web.Response:
+        try:
+            events = await self.read_events(request)
+            return web.json_response({'traces': [self.simulate(trace) for trace in self.split_traces(events)]})
+        except Exception as e:
+            return web.Response(status=500, text=str(e))
+
+    def get_app(self) -> web.Application:
+        app = web.Application(client_max_size=1024**3)
+        app.add_routes([web.post('/execute', self.execute)])
+        if self.batch:
+            app.add_routes([web.post('/execute_batch', self.execute_batch)])
+        return app
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-p', '--port', type=int, default=2023)
+    parser.add_argument('-n', '--nodes', type=int, default=3)
+    parser.add_argument('-rl', '--request-latency', type=float, default=0) # ms per HTTP request
+    parser.add_argument('-tl', '--trace-latency', type=float, default=0) # ms per simulated trace
+    parser.add_argument('-nb', '--no-batch', action='store_true') # Serve /execute only, like older servers
+    return parser.parse_args()
+
+def main() -> None:
+    args = parse_args()
+    server = LocalTLCServer(args.nodes, args.request_latency, args.trace_latency, not args.no_batch)
+    print(f'Server starts listening on port: {args.port}')
+    web.run_app(server.get_app(), host='127.0.0.1', port=args.port, print=None)
+
+if __name__ == '__main__':
+    main()
@@ -4,8 +4,10 @@ import random
 import argparse
 
 from modelfuzz.fuzzer import Fuzzer
+from modelfuzz.minimizer import Minimizer
 from modelfuzz.mutator import MutatorType
 from modelfuzz.fuzzer_type import FuzzerType
+from modelfuzz.jvm import JVM_PROFILES, GC_FLAGS
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser()
@@ -13,8 +15,17 @@ def parse_args() -> argparse.Namespace:
     # Run parameters
     parser.add_argument('-ct', '--control', type=str) # For replication
     parser.add_argument('-w', '--workers', type=int, default=5)
+    parser.add_argument('-eqs', '--evaluation-queue-size', type=int, default=2) # Executed batches waiting for coverage evaluation
     parser.add_argument('-to', '--timeout', type=int, default=60)
     parser.add_argument('-jp', '--jar-path', type=str, default='../ratis-examples/target/ratis-examples-2.5.1.jar')
+    parser.add_argument('-jvp', '--jvm-profile', type=str, choices=list(JVM_PROFILES), default='default') # Flag set of the server and client JVMs
+    parser.add_argument('-jvh', '--jvm-heap', type=str, default=None) # e.g. 256m, sets -Xms and -Xmx
+    parser.add_argument('-jvg', '--jvm-gc', type=str, choices=list(GC_FLAGS), default=None)
+    parser.add_argument('-jvc', '--jvm-cds-archive', type=str, default=None) # AppCDS archive from create_cds_archive.py
+    parser.add_argument('-jvf', '--jvm-flags', type=str, default=None) # More JVM flags, e.g. --jvm-flags="-Xss1m -XX:+UseNUMA"
+    parser.add_argument('-chm', '--cluster-host', action='store_true',
+                        help='Run all nodes of a cluster in one JVM. Needs --crash-quota 0, a crash would close the node\'s '
+                             'RaftServer gracefully instead of killing its JVM') # Clients keep their own JVMs
     parser.add_argument('-td', '--tlc-dir', type=str, default='../../tlc-controlled-with-benchmarks/tlc-controlled')
 
     # Files
@@ -38,17 +49,43 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument('-sp', '--seed-population', type=int, default=20)
     parser.add_argument('-sf', '--seed-frequency', type=int, default=200)
     parser.add_argument('-cq', '--crash-quota', type=int, default=5)
+    parser.add_argument('-fq', '--fault-quota', type=int, default=0) # Drop/Duplicate/Reorder/Partition steps
     parser.add_argument('-st', '--steps', type=int, default=500)
     parser.add_argument('-mm', '--max-messages', type=int, default=5)
     parser.add_argument('-mc', '--mutation-count', type=int, default=10)
     parser.add_argument('-mps', '--mutations-per-schedule', type=int, default=5)
+    parser.add_argument('-k', '--kpath-length', type=int, default=2) # Window length of the k-path guider
+    parser.add_argument('-ns', '--novelty-scoring', action='store_true') # Weight mutants by the rarity of the new states
     parser.add_argument('-mt','--mutator-type', type=MutatorType, default=MutatorType.ALL)
+    parser.add_argument('-ndd', '--no-dedup', action='store_true') # Run schedules even if one with the same effect ran before
+    parser.add_argument('-dda', '--dedup-attempts', type=int, default=3) # Re-mutations of a duplicate mutant before it is dropped
+    parser.add_argument('-der', '--dedup-error-rate', type=float, default=0.001) # False positive rate of the executed schedule filter
+
+    # Network parameters
+    parser.add_argument('-mbc', '--mailbox-capacity', type=int, default=0) # 0 is unbounded
+    parser.add_argument('-ch', '--coalesce-heartbeats', action='store_true')
 
     parser.add_argument('-bfp', '--base-network-port', type=int, default=7071)
     parser.add_argument('-blp', '--base-listener-port', type=int, default=10000)
     parser.add_argument('-bpp', '--base-node-port', type=int, default=6000)
     parser.add_argument('-btp', '--base-tlc-port', type=int, default=2023)
+    parser.add_argument('-te', '--tlc-endpoints', nargs='+', type=str, default=None) # host:port, defaults to the base TLC port
+    parser.add_argument('-nts', '--tlc-servers', type=int, default=0) # Launch this many TLC servers on ports from the base TLC port
+    parser.add_argument('-tj', '--tlc-jar', type=str, default='dist/tla2tools_server.jar') # Relative to the TLC dir
+    parser.add_argument('-tsp', '--tlc-spec', type=str, default='../tla-benchmarks/Raft/model/RAFT_3_3.tla') # The .cfg next to it is used
+    parser.add_argument('-tmp', '--tlc-mapper-params', type=str, default='name=raft')
+    parser.add_argument('-tst', '--tlc-startup-timeout', type=int, default=120)
+    parser.add_argument('-tto', '--tlc-timeout', type=int, default=60) # Seconds TLC gets per request before its traces are lost
+    parser.add_argument('-tcs', '--tlc-cache-size', type=int, default=0) # Whole-trace TLC states to cache, 0 disables the cache
+    parser.add_argument('-tcd', '--tlc-cache-dir', type=str, default=None)
+    parser.add_argument('-rpd', '--repr-dir', type=str, default=None) # On-disk store of TLC state reprs, defaults to the temp dir
+    parser.add_argument('-cct', '--cross-check-tlc', action='store_true') # Compare the embedded evaluator against TLC
     
+    # Minimizer parameters
+    parser.add_argument('-min', '--minimize', type=str, default=None) # Error JSON whose schedule is shrunk instead of fuzzing
+    parser.add_argument('-mrp', '--minimize-repetitions', type=int, default=3) # Runs per candidate schedule
+    parser.add_argument('-mrd', '--minimize-reproductions', type=int, default=1) # Runs out of those that must hit the error
+
     # parser.add_argument('-rs', '--replica-script', type=str, default='../ratis-examples/target/ratis-examples-2.5.1.jar')
     # parser.add_argument('-se', '--save-every', type=int, default=100)
 
@@ -59,9 +96,15 @@ def main() -> None:
     if args.seed_frequency % args.workers != 0:
         print('Seed frequency must be divisible by the number of workers!')
         return
+    if args.cluster_host and args.crash_quota > 0:
+        print('Crashes of hosted nodes would close their servers gracefully, run --cluster-host with --crash-quota 0!')
+        return
     print('Setting seed')
     random.seed(args.seed.__hash__())
     args.seed = args.seed.__hash__()
+    if args.minimize is not None:
+        minimize(args)
+        return
     exp_stats = {}
     for i in range(args.experiments):
         print('Starting fuzzer')
@@ -78,5 +121,24 @@ def main() -> None:
             json.dump(exp_stats, f, indent='\t')
         print(exp_stats)
 
+def minimize(args) -> None:
+    with open(args.minimize) as f:
+        error = json.load(f)
+    if not error.get('schedule'):
+        # Errors raised before the first step (e.g. NodeRegisterTimeout) log no schedule
+        print(f'{args.minimize} has no schedule to minimize, the {error.get("name")} error happened before any step ran')
+        return
+    minimizer = Minimizer(args, error)
+    schedule = minimizer.run()
+    output = os.path.splitext(args.minimize)[0] + '.min.json'
+    with open(output, 'w') as f:
+        json.dump({'name': error['name'],
+                   'fuzzer': error['fuzzer'],
+                   'run_id': error['run_id'],
+                   'original_steps': len(error['schedule']),
+                   'runs': minimizer.runs,
+                   'schedule': schedule}, f, indent='\t')
+    print(f'Minimized schedule written to {output}')
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,74 @@
+import queue
+import traceback
+
+from threading import Thread
+
+class Evaluation():
+    def __init__(self, iteration, schedule, errors, new_states, coverage) -> None:
+        self.iteration = iteration
+        self.schedule = schedule
+        self.errors = errors
+        self.new_states = new_states
+        self.coverage = coverage
+
+class BackgroundEvaluator(Thread):
+    # Feeds executed batches to the guider on its own thread so the workers can
+    # run the next batch meanwhile. Only this thread touches the guider until stop().
+    def __init__(self, guider, max_pending=2, working_dir=None) -> None:
+        Thread.__init__(self, daemon=True)
+        self.guider = guider
+        self.working_dir = working_dir
+        # Bounded, submit() blocks once max_pending batches wait for evaluation
+        self.pending = queue.Queue(maxsize=max(1, max_pending))
+        self.done = queue.Queue()
+
+    def submit(self, iteration, results) -> None:
+        self.pending.put((iteration, results))
+
+    def run(self) -> None:
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+            iteration, results = item
+            try:
+                evaluations = self.evaluate(iteration, results)
+            except Exception:
+                traceback.print_exc()
+                evaluations = [Evaluation(iteration + j, schedule, errors, None, self.guider.get_coverage())
+                               for j, (schedule, _, errors, _, _) in enumerate(results)]
+            for evaluation in evaluations:
+                self.done.put(evaluation)
+            self.pending.task_done()
+
+    def evaluate(self, iteration, results) -> list[Evaluation]:
+        evaluations = []
+        new_states_batch = self.guider.add_and_get_new_states_batch([event_trace for (_, event_trace, _, _, _) in results],
+                                                                    [states for (_, _, _, _, states) in results])
+        for j, (schedule, event_trace, errors, _, states) in enumerate(results):
+            for error in errors:
+                error.states = states if states is not None else self.guider.get_states(event_trace)
+            # Coverage is read right after this trace was added, so it belongs to its iteration
+            evaluations.append(Evaluation(iteration + j, schedule, errors, new_states_batch[j], self.guider.get_coverage()))
+        if self.working_dir is not None:
+            self.guider.save(self.working_dir)
+        return evaluations
+
+    def poll(self) -> list[Evaluation]:
+        evaluations = []
+        while True:
+            try:
+                evaluations.append(self.done.get_nowait())
+            except queue.Empty:
+                return evaluations
+
+    def wait(self) -> list[Evaluation]:
+        # Waits for the submitted batches and returns the evaluations not polled yet
+        self.pending.join()
+        return self.poll()
+
+    def stop(self) -> list[Evaluation]:
+        # Waits for the remaining batches and returns their evaluations
+        self.pending.put(None)
+        self.join()
+        return self.poll()
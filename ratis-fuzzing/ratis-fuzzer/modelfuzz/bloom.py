@@ -0,0 +1,55 @@
+import math
+
+from modelfuzz.coverage import MASK_64
+
+class BloomFilter():
+    # Fixed-size Bloom filter of 128-bit keys, the bit positions come from
+    # double hashing with the two halves of the key
+    def __init__(self, capacity, error_rate) -> None:
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, key) -> list[int]:
+        first, second = key & MASK_64, ((key >> 64) & MASK_64) | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key) -> None:
+        for p in self.positions(key):
+            self.bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def __contains__(self, key) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self.positions(key))
+
+class ScalableBloomFilter():
+    # Grows by adding filters (Almeida et al., Scalable Bloom Filters): each new
+    # one is bigger and has a tighter error rate, so the overall false positive
+    # rate stays below error_rate however many keys arrive
+    def __init__(self, capacity=4096, error_rate=0.001, growth=2, tightening=0.5) -> None:
+        self.growth = growth
+        self.tightening = tightening
+        self.filters = [BloomFilter(capacity, error_rate * (1 - tightening))]
+
+    def add(self, key) -> bool:
+        # False if the key was (probably) added before
+        if key in self:
+            return False
+        last = self.filters[-1]
+        if last.count >= last.capacity:
+            last = BloomFilter(last.capacity * self.growth, last.error_rate * self.tightening)
+            self.filters.append(last)
+        last.add(key)
+        return True
+
+    def __contains__(self, key) -> bool:
+        return any(key in f for f in self.filters)
+
+    def __len__(self) -> int:
+        return sum(f.count for f in self.filters)
+
+    def get_stats(self) -> dict:
+        return {'keys': len(self), 'filters': len(self.filters), 'bytes': sum(len(f.bits) for f in self.filters)}
@@ -0,0 +1,83 @@
+import os
+import json
+import shelve
+
+from hashlib import blake2b
+from collections import OrderedDict
+from modelfuzz.trace import EventTrace
+
+class TLCTraceCache():
+    # Caches the TLC states of whole event traces. Prefixes are not cached:
+    # TLC replays a trace from Init and cannot resume from a cached state, and
+    # events TLC maps to no action make state positions unrelated to event
+    # positions, so a prefix entry could not save any TLC work.
+    def __init__(self, max_entries=10000, spill_dir=None) -> None:
+        # Resolves a known TLC state key to its state dict, set by the owning guider
+        self.get_state = None
+        self.max_entries = max_entries
+        # hash of a whole trace -> tuple of TLC state keys
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.spilled = 0
+
+        self.spill = None
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+            self.spill = shelve.open(os.path.join(spill_dir, 'tlc_trace_cache'))
+
+    def trace_hash(self, event_trace) -> bytes:
+        h = blake2b(digest_size=16)
+        if isinstance(event_trace, EventTrace):
+            event_trace.update_hash(h)
+            return h.digest()
+        for e in event_trace:
+            h.update(json.dumps(e, sort_keys=True).encode('utf-8'))
+            h.update(b'\n')
+        return h.digest()
+
+    def get(self, trace_hash) -> list[dict]:
+        if trace_hash in self.entries:
+            self.entries.move_to_end(trace_hash)
+            self.hits += 1
+            return [self.get_state(key) for key in self.entries[trace_hash]]
+        if self.spill is not None and trace_hash.hex() in self.spill:
+            # Spilled entries carry their full states so they survive restarts
+            tla_states = self.spill[trace_hash.hex()]
+            self.hits += 1
+            return tla_states
+        self.misses += 1
+        return None
+
+    def put(self, trace_hash, tla_states) -> None:
+        if self.max_entries <= 0:
+            return
+        self.entries[trace_hash] = tuple(s['key'] for s in tla_states)
+        self.entries.move_to_end(trace_hash)
+        while len(self.entries) > self.max_entries:
+            evicted_hash, keys = self.entries.popitem(last=False)
+            self.spill_entry(evicted_hash, keys)
+
+    def spill_entry(self, trace_hash, keys) -> None:
+        if self.spill is None:
+            return
+        self.spill[trace_hash.hex()] = [self.get_state(key) for key in keys]
+        self.spilled += 1
+
+    def get_stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups > 0 else 0,
+            'entries': len(self.entries),
+            'spilled': self.spilled
+        }
+
+    def close(self) -> None:
+        if self.spill is None:
+            return
+        for trace_hash, keys in self.entries.items():
+            self.spill_entry(trace_hash, keys)
+        self.spill.close()
+        self.spill = None
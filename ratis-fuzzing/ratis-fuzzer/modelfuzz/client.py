@@ -7,6 +7,7 @@ import time
 import asyncio
 import traceback
 from threading import Thread
+from modelfuzz.process import processes
 
 class RatisClient(Thread):
     def __init__(self, config) -> None:
@@ -21,13 +22,11 @@ class RatisClient(Thread):
         self.stderr = self.config['stderr']
 
         self.log4j_config = '-Dlog4j.configuration=file:../ratis-examples/src/main/resources/log4j.properties'
-        self.cmd = 'java {} -cp {} org.apache.ratis.examples.counter.client.CounterClient {} {} {}'.format(
-            self.log4j_config,
-            self.config['jar_path'],
-            self.config['request'],
-            self.config['peer_addresses'],
-            self.config['group_id']
-        )
+        self.cmd = ['java'] + self.config['jvm_args'] + [self.log4j_config, '-cp', self.config['jar_path'],
+                    'org.apache.ratis.examples.counter.client.CounterClient',
+                    str(self.config['request']),
+                    self.config['peer_addresses'],
+                    self.config['group_id']]
     
     def run(self) -> None:
         asyncio.run(self.run_client())
@@ -36,7 +35,7 @@ class RatisClient(Thread):
 
     
     async def run_client(self,) -> None:
-        self.process = await asyncio.create_subprocess_shell(self.cmd, stdout=self.stdout, stderr=self.stderr)
+        self.process = await processes.spawn(self.cmd, self.config['owner'], stdout=self.stdout, stderr=self.stderr)
         try:
             await asyncio.wait_for(self.process.wait(), self.config['timeout'] + 10)
             self.returncode = self.process.returncode
@@ -58,10 +57,7 @@ class RatisClient(Thread):
         # print(f'Ratis server subprocess: {self.process}')
             
     def kill(self) -> None:
-        try:
-            self.process.kill()
-        except ProcessLookupError as e:
-            pass
+        processes.kill(self.process)
         if not self.error_flg:
             self.returncode=0
     
@@ -5,10 +5,14 @@ import shutil
 
 from collections import deque
 from dataclasses import dataclass
-from modelfuzz.network import Network
+from modelfuzz.network import Network, MailboxPolicy
+from modelfuzz.trace import EventTrace
 from modelfuzz.server import RatisServer
+from modelfuzz.host import ClusterHost
 from modelfuzz.client import RatisClient
 from modelfuzz.fuzzer_type import FuzzerType
+from modelfuzz.process import processes
+from modelfuzz.jvm import get_params_jvm_args
 
 @dataclass
 class Error:
@@ -37,7 +41,9 @@ class Error:
         self.stdout = stdout
     
     def log_error(self, log_dir):
-        log = self.__dict__
+        log = dict(self.__dict__)
+        if isinstance(self.event_trace, EventTrace):
+            log['event_trace'] = self.event_trace.to_list()
         print(log_dir)
         with open(os.path.join(log_dir, f'{self.fuzzer}_{self.run_id}_{self.name}.json'), 'w') as f:
             json.dump(log, f, indent='\t')
@@ -54,9 +60,13 @@ class Cluster():
         self.event_trace = []
         self.error = None
 
-        self.network = Network(self.config['fuzzer_port'])
+        mailbox_policy = MailboxPolicy(self.params.mailbox_capacity, self.params.coalesce_heartbeats)
+        self.network = Network(self.config['fuzzer_port'], self.config['run_id'], mailbox_policy)
 
         self.servers: list[RatisServer] = []
+        # Every JVM of this cluster is killed with it, see ProcessRegistry
+        self.owner = processes.new_owner()
+        self.jvm_args = get_params_jvm_args(self.params)
         self.peer_addresses = ','.join([f'127.0.0.1:{self.config["node_ports"][i]}' for i in range(self.params.nodes)])
 
         self.tmp_dir = f'./tmp/{self.config["fuzzer"].value}_{self.config["run_id"]}'
@@ -64,9 +74,26 @@ class Cluster():
         self.stdouts = [open(os.path.join(self.tmp_dir, f'stdout_{i+1}.log'), mode='w+') for i in range(self.params.nodes)]
         self.stderrs = [open(os.path.join(self.tmp_dir, f'stderr_{i+1}.log'), mode='w+') for i in range(self.params.nodes)]
 
+        self.host = None
+        if self.params.cluster_host:
+            self.host = ClusterHost({
+                'jar_path': self.params.jar_path,
+                'jvm_args': self.jvm_args,
+                'run_id': self.config['run_id'],
+                'fuzzer_port': self.config['fuzzer_port'],
+                'listener_ports': self.config['listener_ports'][:self.params.nodes],
+                'peer_addresses': self.peer_addresses,
+                'group_id': self.config['group_id'],
+                'timeout': self.params.timeout,
+                'owner': self.owner,
+                'stdout': open(os.path.join(self.tmp_dir, 'host_stdout.log'), mode='w+'),
+                'stderr': open(os.path.join(self.tmp_dir, 'host_stderr.log'), mode='w+')
+            })
+
         for i in range(self.params.nodes):
             server_config = {
                 'jar_path': self.params.jar_path,
+                'jvm_args': self.jvm_args,
                 'run_id': self.config['run_id'],
                 'fuzzer_port': self.config['fuzzer_port'],
                 'listener_port': self.config['listener_ports'][i],
@@ -74,8 +101,10 @@ class Cluster():
                 'peer_addresses': self.peer_addresses,
                 'group_id': self.config['group_id'],
                 'timeout': self.params.timeout,
+                'owner': self.owner,
                 'stdout': self.stdouts[i],
-                'stderr': self.stderrs[i]
+                'stderr': self.stderrs[i],
+                'host': self.host
             }
             self.servers.append(RatisServer(server_config))
         
@@ -86,13 +115,17 @@ class Cluster():
     def cluster_init(self) -> None:
         # print('Starting cluster')
         self.network.start()
+        if self.host is not None:
+            self.host.start()
         for i, server in enumerate(self.servers):
             server.start()
 
     def cluster_stop(self) -> None:
         # print('Stopping cluster')
         self.network.stop()
-        self.network.join()
+        # The nodes go down with the host JVM
+        if self.host is not None:
+            self.host.close()
 
         for server in self.servers:
             server.close()
@@ -101,20 +134,26 @@ class Cluster():
         for client in self.clients:
             client.close()
             client.join()
+        if self.host is not None:
+            self.host.join()
+        processes.release(self.owner)
 
         shutil.rmtree(self.tmp_dir)
         ratis_data_path = os.path.join(self.params.ratis_data_dir, f'{self.config["run_id"]}')
         if os.path.exists(ratis_data_path):
             shutil.rmtree(ratis_data_path)
         
-    def run(self) -> tuple[list, list, list[Error]]:
+    def run(self) -> tuple[list, list, list[Error], dict]:
         self.cluster_init()
         # print('Waiting for server registers')
         timeout = time.time() + self.params.timeout 
         while self.network.get_num_replicas() != self.params.nodes:
             if time.time() > timeout:
                 print(f'Timeout at cluster {self.config["run_id"]} while waiting for nodes to register!')
-                return (None, (None, None, Error('NodeRegisterTimeout', self.config['run_id'], self.config['fuzzer'])))
+                self.cluster_stop()
+                return (self.executed_schedule, self.network.get_event_trace(),
+                        [Error('NodeRegisterTimeout', self.config['run_id'], self.config['fuzzer'])],
+                        self.network.get_mailbox_stats())
             time.sleep(0.01)
 
         steps = self.schedule
@@ -148,11 +187,13 @@ class Cluster():
                 if leader_id > 0 and leader_id not in crashed:
                     client_config = {
                         'jar_path': self.params.jar_path,
+                        'jvm_args': self.jvm_args,
                         'request': self.client_request,
                         'peer_addresses': self.peer_addresses,
                         'group_id': self.config['group_id'],
                         'timeout': self.params.timeout,
                         'run_id': self.config['run_id'],
+                        'owner': self.owner,
                         'stdout': open(os.path.join(self.tmp_dir, f'client_stdout_{self.client_request}.log'), mode='w+'),
                         'stderr': open(os.path.join(self.tmp_dir, f'client_stderr_{self.client_request}.log'), mode='w+')
                     }
@@ -168,6 +209,16 @@ class Cluster():
                 if node not in crashed:
                     scheduled_msgs = self.network.schedule_node(node, to, max_msgs, to in crashed)
                     # step['max_msgs'] = scheduled_msgs 
+            elif step['type'] == 'Drop':
+                self.network.drop_messages(step['node'], step['to'], step['count'])
+            elif step['type'] == 'Duplicate':
+                self.network.duplicate_message(step['node'], step['to'])
+            elif step['type'] == 'Reorder':
+                self.network.reorder_messages(step['node'], step['to'], step['count'], step['seed'])
+            elif step['type'] == 'Partition':
+                self.network.partition(step['nodes'], step.get('partition_id', 0))
+            elif step['type'] == 'Heal':
+                self.network.heal(step.get('partition_id'))
             else:
                 pass
 
@@ -181,7 +232,7 @@ class Cluster():
         self.cluster_stop()
 
         self.event_trace = self.network.get_event_trace()
-        return (self.executed_schedule, self.event_trace, errors)
+        return (self.executed_schedule, self.event_trace, errors, self.network.get_mailbox_stats())
 
 
 
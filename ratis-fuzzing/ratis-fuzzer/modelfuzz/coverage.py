@@ -0,0 +1,117 @@
+import os
+import mmap
+import tempfile
+
+from array import array
+
+MASK_64 = (1 << 64) - 1
+
+class KeySet():
+    # Open-addressing hash set of int64 keys. Keys are kept in insertion order
+    # in a flat array and the table holds their ordinal + 1 (0 is an empty slot).
+    def __init__(self, capacity=1024) -> None:
+        self.keys = array('q')
+        self.bits = max(4, (capacity - 1).bit_length())
+        self.slots = array('q', bytes(8 << self.bits))
+
+    def probe(self, key) -> int:
+        mask = (1 << self.bits) - 1
+        i = (((key & MASK_64) * 0x9e3779b97f4a7c15) & MASK_64) >> (64 - self.bits)
+        while True:
+            ordinal = self.slots[i]
+            if ordinal == 0 or self.keys[ordinal-1] == key:
+                return i
+            i = (i + 1) & mask
+
+    def index(self, key) -> int:
+        return self.slots[self.probe(key)] - 1
+
+    def add(self, key) -> tuple[int, bool]:
+        i = self.probe(key)
+        if self.slots[i] != 0:
+            return (self.slots[i] - 1, False)
+        self.keys.append(key)
+        self.slots[i] = len(self.keys)
+        if len(self.keys) * 2 > len(self.slots):
+            self.grow()
+        return (len(self.keys) - 1, True)
+
+    def grow(self) -> None:
+        self.bits += 1
+        self.slots = array('q', bytes(8 << self.bits))
+        for ordinal, key in enumerate(self.keys):
+            self.slots[self.probe(key)] = ordinal + 1
+
+    def __contains__(self, key) -> bool:
+        return self.index(key) >= 0
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+class ReprStore():
+    # Append-only file of state reprs, read back through a memory map
+    def __init__(self, directory=None) -> None:
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(prefix='reprs-', dir=directory)
+        self.file = os.fdopen(fd, 'w+b')
+        self.offsets = array('q', [0])
+        self.map = None
+
+    def append(self, repr) -> int:
+        data = repr.encode('utf-8')
+        self.file.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+        return len(self.offsets) - 2
+
+    def get(self, ordinal) -> str:
+        start, end = self.offsets[ordinal], self.offsets[ordinal+1]
+        if start == end:
+            return ''
+        if self.map is None or len(self.map) < end:
+            # Remap only once reads reach past what is already mapped
+            self.file.flush()
+            if self.map is not None:
+                self.map.close()
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.map[start:end].decode('utf-8')
+
+    def close(self) -> None:
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if not self.file.closed:
+            self.file.close()
+            os.remove(self.path)
+
+class CoverageMap():
+    # Known TLC states: keys stay in memory, reprs live on disk until asked for
+    def __init__(self, repr_dir=None) -> None:
+        self.keys = KeySet()
+        self.reprs = ReprStore(repr_dir)
+
+    def add(self, tla_state) -> bool:
+        _, new = self.keys.add(tla_state['key'])
+        if new:
+            self.reprs.append(tla_state['state'])
+        return new
+
+    def get_state(self, key) -> dict:
+        ordinal = self.keys.index(key)
+        if ordinal < 0:
+            raise KeyError(key)
+        return {'state': self.reprs.get(ordinal), 'key': key}
+
+    def get_states(self, start=0, end=None) -> list[dict]:
+        # States in the order they were first seen
+        end = len(self) if end is None else end
+        return [{'state': self.reprs.get(i), 'key': self.keys.keys[i]} for i in range(start, end)]
+
+    def __contains__(self, key) -> bool:
+        return key in self.keys
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def close(self) -> None:
+        self.reprs.close()
@@ -0,0 +1,330 @@
+from hashlib import blake2b
+from modelfuzz.tlc import TLCError, parse_tlc_state, split_state_parts
+
+FOLLOWER = 'follower'
+CANDIDATE = 'candidate'
+LEADER = 'leader'
+
+# Variables of the abstraction, in the order TLC prints them for raft_crashes
+ABSTRACT_VARS = ['currentActive', 'state', 'leaderTerm', 'lastLog', 'commitIndex', 'snapshotIndex']
+
+class RaftState():
+    # Concrete per-server state following raft_enhanced.tla
+    def __init__(self, nodes) -> None:
+        self.servers = list(range(1, nodes+1, 1))
+        self.current_active = set(self.servers)
+        self.current_term = {i: 0 for i in self.servers}
+        self.state = {i: FOLLOWER for i in self.servers}
+        self.voted_for = {i: 0 for i in self.servers}
+        self.votes_granted = {i: set() for i in self.servers}
+        self.log = {i: [] for i in self.servers}
+        self.commit_index = {i: 0 for i in self.servers}
+        self.snapshot_index = {i: 0 for i in self.servers}
+        self.match_index = {i: {j: 0 for j in self.servers} for i in self.servers}
+        self.leader_term = 0
+
+    def is_quorum(self, nodes) -> bool:
+        return len(nodes) * 2 > len(self.servers)
+
+    def last_term(self, i) -> int:
+        return self.log[i][-1][0] if len(self.log[i]) > 0 else 0
+
+    def update_term(self, i, term) -> None:
+        if term > self.current_term[i]:
+            self.current_term[i] = term
+            self.state[i] = FOLLOWER
+            self.voted_for[i] = 0
+
+    def restart(self, i) -> None:
+        # Logs and indexes are kept, Add leaves them unchanged in raft_crashes.tla
+        self.state[i] = FOLLOWER
+        self.votes_granted[i] = set()
+        self.match_index[i] = {j: 0 for j in self.servers}
+
+    def timeout(self, i) -> bool:
+        if i not in self.current_active or self.state[i] not in (FOLLOWER, CANDIDATE):
+            return False
+        self.state[i] = CANDIDATE
+        self.current_term[i] += 1
+        self.voted_for[i] = i
+        self.votes_granted[i] = {i}
+        return True
+
+    def become_leader(self, i, term) -> bool:
+        # The implementation reports elections it has won, so the vote
+        # quorum is not re-checked here (ElectLeader in the spec)
+        if i not in self.current_active:
+            return False
+        self.current_term[i] = max(self.current_term[i], term)
+        self.state[i] = LEADER
+        self.match_index[i] = {j: 0 for j in self.servers}
+        self.leader_term = term
+        return True
+
+    def client_request(self, i, value) -> bool:
+        if i not in self.state or self.state[i] != LEADER:
+            return False
+        self.log[i].append((self.current_term[i], value))
+        return True
+
+    def advance_commit_index(self, i) -> bool:
+        if self.state[i] != LEADER:
+            return False
+        agree = [index for index in range(1, len(self.log[i])+1, 1)
+                 if self.is_quorum({i} | {k for k in self.servers if self.match_index[i][k] >= index})]
+        if len(agree) > 0 and self.log[i][max(agree)-1][0] == self.current_term[i]:
+            self.commit_index[i] = max(agree)
+        return True
+
+    def update_snapshot(self, i, si) -> bool:
+        if i not in self.current_active or len(self.log[i]) == 0 or si > len(self.log[i]):
+            return False
+        self.snapshot_index[i] = si
+        return True
+
+    def handle_request_vote_request(self, i, j, l_term, l_index, term) -> bool:
+        if i not in self.current_active:
+            return False
+        self.update_term(i, term)
+        if term < self.current_term[i]:
+            return True
+        log_ok = l_term > self.last_term(i) or (l_term == self.last_term(i) and l_index >= len(self.log[i]))
+        if log_ok and self.voted_for[i] in (0, j):
+            self.voted_for[i] = j
+        return True
+
+    def handle_request_vote_response(self, i, j, term, grant) -> bool:
+        if i not in self.current_active:
+            return False
+        self.update_term(i, term)
+        if term == self.current_term[i] and grant:
+            self.votes_granted[i].add(j)
+        return True
+
+    def handle_append_entries_request(self, i, j, p_log_index, p_log_term, term, entry, c_index) -> bool:
+        if i not in self.current_active or i == j:
+            return False
+        self.update_term(i, term)
+        if term < self.current_term[i]:
+            return True
+        if self.state[i] == CANDIDATE:
+            self.state[i] = FOLLOWER
+            return True
+        log_ok = p_log_index == 0 or (0 < p_log_index <= len(self.log[i]) and self.log[i][p_log_index-1][0] == p_log_term)
+        if not log_ok or self.state[i] != FOLLOWER:
+            return True
+        if entry is None:
+            self.commit_index[i] = c_index
+            return True
+        index = p_log_index + 1
+        if len(self.log[i]) >= index:
+            if self.log[i][index-1][0] == entry[0]:
+                self.commit_index[i] = c_index
+            else:
+                self.log[i].pop()
+        elif len(self.log[i]) == p_log_index:
+            self.log[i].append(entry)
+        return True
+
+    def handle_append_entries_response(self, i, j, term, success, m_index) -> bool:
+        if i not in self.current_active:
+            return False
+        self.update_term(i, term)
+        if term != self.current_term[i]:
+            return True
+        if success:
+            self.match_index[i][j] = m_index
+        if self.state[i] == LEADER:
+            self.advance_commit_index(i)
+        return True
+
+    def abstract(self) -> tuple:
+        active = sorted(self.current_active)
+        return (
+            tuple(active),
+            tuple(self.state[i] for i in active),
+            self.leader_term,
+            tuple(len(self.log[i]) for i in self.servers),
+            tuple(self.commit_index[i] for i in self.servers),
+            tuple(self.snapshot_index[i] for i in self.servers)
+        )
+
+class RaftEvaluator():
+    # Drop-in replacement for TLCClient that evaluates traces in-process
+    def __init__(self, nodes) -> None:
+        self.nodes = nodes
+
+    def apply(self, raft, e) -> bool:
+        name = e.get('name')
+        params = e.get('params') or {}
+        if name == 'Timeout':
+            return raft.timeout(int(params['node']))
+        elif name == 'BecomeLeader':
+            return raft.become_leader(int(params['node']), int(params['term']))
+        elif name == 'ClientRequest':
+            return raft.client_request(int(params['leader']), int(params['request']))
+        elif name == 'AdvanceCommitIndex':
+            return raft.advance_commit_index(int(params['i']))
+        elif name == 'UpdateSnapshot':
+            return raft.update_snapshot(int(params['node']), int(params['snapshot_index']))
+        elif name == 'Remove' or (name == 'MembershipChange' and params.get('action') == 'Remove'):
+            i = int(params.get('i', params.get('node')))
+            raft.current_active.discard(i)
+            return True
+        elif name == 'Add' or (name == 'MembershipChange' and params.get('action') == 'Add'):
+            i = int(params.get('i', params.get('node')))
+            raft.current_active.add(i)
+            raft.restart(i)
+            return True
+        elif name == 'DeliverMessage':
+            return self.apply_message(raft, params)
+        # SendMessage and network faults do not change the server states
+        return False
+
+    def apply_message(self, raft, params) -> bool:
+        i = int(params['to'])
+        j = int(params['from'])
+        term = int(params['term'])
+        if params.get('type') == 'MsgVote':
+            return raft.handle_request_vote_request(i, j, int(params['log_term']), int(params['index']), term)
+        elif params.get('type') == 'MsgVoteResp':
+            return raft.handle_request_vote_response(i, j, term, not params['reject'])
+        elif params.get('type') == 'MsgApp':
+            entry = None
+            if len(params['entries']) > 0:
+                entry = (int(params['entries'][0]['Term']), int(params['entries'][0]['Data']))
+            return raft.handle_append_entries_request(i, j, int(params['index']), int(params['log_term']), term, entry, int(params['commit']))
+        elif params.get('type') == 'MsgAppResp':
+            return raft.handle_append_entries_response(i, j, term, not params['reject'], int(params['index']))
+        return False
+
+    def evaluate(self, event_trace) -> list[tuple]:
+        raft = RaftState(self.nodes)
+        states = [raft.abstract()]
+        for e in event_trace:
+            if 'reset' in e:
+                break
+            try:
+                changed = self.apply(raft, e)
+            except (KeyError, ValueError, TypeError, IndexError):
+                continue
+            if changed:
+                state = raft.abstract()
+                # Consecutive identical abstract states collapse, as in RaftStateAbstractor
+                if state != states[-1]:
+                    states.append(state)
+        return states
+
+    def execute(self, event_trace) -> list[dict]:
+        return [{'state': to_repr(s), 'key': to_key(s)} for s in self.evaluate(event_trace)]
+
+    def execute_many(self, event_traces, concurrency=None) -> list:
+        return [self.execute(event_trace) for event_trace in event_traces]
+
+    def execute_batch(self, event_traces) -> list:
+        return self.execute_many(event_traces)
+
+    def close(self) -> None:
+        pass
+
+class CrossCheckClient():
+    # Evaluates traces in-process and compares the abstract states against TLC
+    def __init__(self, evaluator, tlc_client) -> None:
+        self.evaluator = evaluator
+        self.tlc_client = tlc_client
+        self.matches = 0
+        self.mismatches = 0
+        self.unchecked = 0
+
+    def compare(self, states, tlc_states) -> None:
+        if isinstance(tlc_states, TLCError):
+            self.unchecked += 1
+            return
+        tlc_keys = []
+        for tlc_state in tlc_states:
+            abstract = from_repr(tlc_state['state'])
+            if abstract is None:
+                self.unchecked += 1
+                return
+            tlc_keys.append(to_key(abstract))
+        if tlc_keys == [s['key'] for s in states]:
+            self.matches += 1
+        else:
+            self.mismatches += 1
+
+    def execute(self, event_trace) -> list[dict]:
+        states = self.evaluator.execute(event_trace)
+        try:
+            self.compare(states, self.tlc_client.execute(event_trace))
+        except TLCError as e:
+            self.compare(states, e)
+        return states
+
+    def execute_many(self, event_traces, concurrency=None) -> list:
+        states = self.evaluator.execute_many(event_traces)
+        for s, tlc_states in zip(states, self.tlc_client.execute_many(event_traces, concurrency)):
+            self.compare(s, tlc_states)
+        return states
+
+    def execute_batch(self, event_traces) -> list:
+        states = self.evaluator.execute_batch(event_traces)
+        self.compare_batch(event_traces, states)
+        return states
+
+    def compare_batch(self, event_traces, states) -> None:
+        # states were evaluated elsewhere, usually by the workers
+        try:
+            tlc_states = self.tlc_client.execute_batch(event_traces)
+        except TLCError as e:
+            tlc_states = [e for _ in event_traces]
+        for s, t in zip(states, tlc_states):
+            self.compare(s, t)
+
+    def get_stats(self) -> dict:
+        return {'matches': self.matches, 'mismatches': self.mismatches, 'unchecked': self.unchecked}
+
+    def close(self) -> None:
+        self.tlc_client.close()
+
+def to_repr(state) -> str:
+    active, states, leader_term, last_log, commit_index, snapshot_index = state
+    if list(active) == list(range(1, len(active)+1, 1)):
+        state_repr = '[{}]'.format(', '.join(f'"{s}"' for s in states))
+    else:
+        # TLC prints functions over a domain other than 1..n with :> and @@
+        state_repr = '({})'.format(' @@ '.join(f'{i} :> "{s}"' for i, s in zip(active, states)))
+    return ' currentActive = {{{}}}, state = {}, leaderTerm = {}, lastLog = [{}], commitIndex = [{}], snapshotIndex = [{}],'.format(
+        ', '.join(str(i) for i in active),
+        state_repr,
+        leader_term,
+        ', '.join(str(v) for v in last_log),
+        ', '.join(str(v) for v in commit_index),
+        ', '.join(str(v) for v in snapshot_index)
+    )
+
+def to_key(state) -> int:
+    # Not a TLC fingerprint, TLC does not expose how it computes those. The key
+    # hashes the abstraction as TLC prints it, so TLC states parsed with
+    # from_repr get the same key as the evaluated state they correspond to.
+    return int.from_bytes(blake2b(to_repr(state).encode('utf-8'), digest_size=8).digest(), 'little', signed=True)
+
+def from_repr(s) -> tuple:
+    # Parses the raft_crashes variables out of a TLC state repr
+    parts = {}
+    for part in split_state_parts(parse_tlc_state(s)):
+        if '=' not in part:
+            continue
+        key, value = map(str.strip, part.split('=', 1))
+        parts[key] = value
+    if any(v not in parts for v in ABSTRACT_VARS):
+        return None
+    try:
+        active = tuple(int(i) for i in parts['currentActive'].strip('{}').split(',') if i.strip() != '')
+        state_values = [p.split(':>')[1].strip().strip('"') for p in parts['state'].strip('()').split('@@') if ':>' in p]
+        if ':>' not in parts['state']:
+            state_values = [v.strip().strip('"') for v in parts['state'].strip('[]<>').split(',') if v.strip() != '']
+        as_ints = lambda v: tuple(int(i) for i in v.strip('[]<>').split(',') if i.strip() != '')
+        return (active, tuple(state_values), int(parts['leaderTerm']), as_ints(parts['lastLog']),
+                as_ints(parts['commitIndex']), as_ints(parts['snapshotIndex']))
+    except (ValueError, IndexError):
+        return None
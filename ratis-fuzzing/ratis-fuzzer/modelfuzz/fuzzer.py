@@ -1,22 +1,42 @@
 
 import os
+import json
+import math
 import time
 import random
 import traceback
+import multiprocessing
+import multiprocessing.util
 import concurrent.futures
 
 from itertools import cycle
 from modelfuzz.cluster import Error
 from modelfuzz.cluster import Cluster
+from modelfuzz.process import processes
+from modelfuzz.tlc import TLCBackendPool
 from modelfuzz.guider import GuiderFactory
+from modelfuzz.evaluator import RaftEvaluator
+from modelfuzz.background import BackgroundEvaluator
 from modelfuzz.fuzzer_type import FuzzerType
 from modelfuzz.mutator import MutatorFactory
+from modelfuzz.schedule import Steps, schedule_key
+from modelfuzz.bloom import ScalableBloomFilter
+
+_worker_slot = 0
+
+def init_worker(slots) -> None:
+    global _worker_slot
+    _worker_slot = slots.get()
+    # Kill the JVMs of this worker when it exits, atexit does not run in pool workers
+    multiprocessing.util.Finalize(None, processes.close, exitpriority=10)
 
 class Fuzzer():
     def __init__(self, params) -> None:
         self.params = params
         self.sch_pool = []
         self.stats = {}
+        # run_id -> (Steps.origin, seconds the cluster ran) until the run is evaluated
+        self.origins = {}
 
         self.mutator = MutatorFactory.get_mutator(self.params.mutator_type, self.params)
 
@@ -44,17 +64,47 @@ class Fuzzer():
 # task: <Task pending name='Task-32' coro=<RequestHandler.start() running at /Users/berkay/Library/Python/3.9/lib/python/site-packages/aiohttp/web_protocol.py:505> wait_for=<Future pending cb=[<TaskWakeupMethWrapper object at 0x103a53e20>()]>>
 
     def run(self) -> dict:
+        # Kept out of self, the fuzzer is pickled for the worker processes
+        tlc_pool = self.create_tlc_pool()
+        try:
+            self.run_fuzzers(tlc_pool)
+        finally:
+            tlc_pool.close()
+        return self.stats
+
+    def create_tlc_pool(self) -> TLCBackendPool:
+        if self.params.tlc_servers > 0 and not self.params.tlc_endpoints:
+            print(f'Launching {self.params.tlc_servers} TLC servers from port {self.params.base_tlc_port}')
+            return TLCBackendPool.launch(self.params, self.params.tlc_servers)
+        return TLCBackendPool(GuiderFactory.get_tlc_endpoints(self.params))
+
+    def run_fuzzers(self, tlc_pool) -> None:
         for fuzzer in self.params.fuzzers:
             self.stats[fuzzer.value] = {
                 'coverage': [],
                 'random_schedules': 0,
                 'mutated_schedules': 0,
                 'bugs': [],
+                'coalesced_messages': 0,
+                'dropped_messages': 0,
+                'rejected_requests': 0,
+                'lost_traces': 0,
+                'duplicate_schedules': 0,
+                'dropped_schedules': 0,
                 'runtime': time.time()
             }
 
             print('Instantiating ', fuzzer.value)
-            guider = GuiderFactory.get_guider(fuzzer)
+            # Fresh per fuzzer so that adaptive mutators do not carry over what they learned
+            self.mutator = MutatorFactory.get_mutator(self.params.mutator_type, self.params)
+            guider = GuiderFactory.get_guider(fuzzer, self.params, tlc_pool)
+            executor = self.create_executor()
+            working_dir = os.path.join(self.params.result_dir, fuzzer.value)
+            # Coverage is evaluated in the background while the workers run the next batch
+            evaluator = BackgroundEvaluator(guider, self.params.evaluation_queue_size, working_dir)
+            evaluator.start()
+            # Schedules already run, kept out of self like the other per-fuzzer state
+            executed = None if self.params.no_dedup else ScalableBloomFilter(error_rate=self.params.dedup_error_rate)
 
             for i in range(0, self.params.iterations, self.params.workers):
                 if self.params.workers > 1:
@@ -65,77 +115,167 @@ class Fuzzer():
                     self.sch_pool.clear()
                     self.generate_schedules(self.params.seed_population)
 
+                # Mutants of schedules whose evaluation finished in the meantime
+                evaluations = evaluator.poll()
+                if fuzzer != FuzzerType.RANDOM and not any(is_mutated for is_mutated, _ in self.sch_pool):
+                    # With no mutants left the next batch would be all random, so the
+                    # last batch's evaluation is awaited for its mutants to run next
+                    evaluations.extend(evaluator.wait())
+                self.process_evaluations(fuzzer, evaluations)
+
                 if len(self.sch_pool) < self.params.workers:
                     self.generate_schedules(self.params.workers - len(self.sch_pool))
 
-                mutated_count, random_count, run_configs = self.get_configs(fuzzer, i)
+                mutated_count, random_count, run_configs = self.get_configs(fuzzer, i, executed)
                 self.stats[fuzzer.value]['mutated_schedules'] += mutated_count
                 self.stats[fuzzer.value]['random_schedules'] += random_count
-                results = self.run_batch(run_configs)
-                for j, (schedule, event_trace, errors) in enumerate(results):
-                    # Add new states
-                    new_states = guider.add_and_get_new_states(event_trace)
-                    # print('New states: ',  new_states)
-                    # Check if erroneous
-                    if len(errors) > 0:
-                        self.stats[fuzzer.value]['bugs'].append((fuzzer, i+j))
-                        os.makedirs(os.path.join(self.params.errors_dir, f'{fuzzer.value}_{i+j}'), exist_ok=True)
-                        for error in errors:
-                            error.states = guider.get_states(event_trace)
-                            error.log_error(os.path.join(self.params.errors_dir, f'{fuzzer.value}_{i+j}'))
-                        print(f'{fuzzer.name} found error(s) at iteration: {i+j}')
-                    else:
-                        if new_states > 0 and fuzzer != FuzzerType.RANDOM:
-                            for _ in range(self.params.mutations_per_schedule * new_states):
-                                new_sch = self.mutator.mutate(schedule)
-                                self.sch_pool.append((True, new_sch))
-                    
-                    self.stats[fuzzer.value]['coverage'].append(guider.get_coverage())
+                results = self.run_batch(executor, run_configs)
+                for run_config, (_, _, _, mailbox_stats, _) in zip(run_configs, results):
+                    self.stats[fuzzer.value]['coalesced_messages'] += mailbox_stats['coalesced']
+                    self.stats[fuzzer.value]['dropped_messages'] += mailbox_stats['dropped']
+                    self.stats[fuzzer.value]['rejected_requests'] += mailbox_stats['rejected']
+                    self.origins[run_config['run_id']] = (run_config['origin'], mailbox_stats['runtime'])
+                # Blocks only when evaluation has fallen behind by the whole queue
+                evaluator.submit(i, results)
+                self.save_stats(fuzzer)
 
+            executor.shutdown()
+            self.process_evaluations(fuzzer, evaluator.stop())
+            self.save_stats(fuzzer)
+            self.stats[fuzzer.value]['guider'] = guider.get_stats()
+            cache = self.stats[fuzzer.value]['guider'].get('tlc_cache')
+            if cache is not None:
+                print(f'TLC trace cache hit rate {cache["hit_rate"]:.1%} ({cache["hits"]} of {cache["hits"] + cache["misses"]} traces)')
+            self.stats[fuzzer.value]['mutator'] = self.mutator.get_stats()
+            if executed is not None:
+                self.stats[fuzzer.value]['dedup'] = executed.get_stats()
+                duplicates = self.stats[fuzzer.value]['duplicate_schedules']
+                print(f'Skipped {duplicates} duplicate schedules ({duplicates / max(1, duplicates + len(executed)):.1%})')
+            guider.close()
             self.stats[fuzzer.value]['runtime'] = time.time() - self.stats[fuzzer.value]['runtime']
             print(self.stats)
             self.sch_pool.clear()
-        return self.stats
+            self.origins.clear()
+
+    def process_evaluations(self, fuzzer, evaluations) -> None:
+        for evaluation in evaluations:
+            if evaluation.new_states is None:
+                # TLC never answered for this trace, its novelty is unknown rather than zero
+                self.stats[fuzzer.value]['lost_traces'] += 1
+                print(f'Coverage of iteration {evaluation.iteration} was lost, no TLC backend answered')
+            # print('New states: ',  evaluation.new_states)
+            origin, runtime = self.origins.pop(evaluation.iteration, (None, 0))
+            self.mutator.update(origin, evaluation.new_states, runtime)
+            # Check if erroneous
+            if len(evaluation.errors) > 0:
+                self.stats[fuzzer.value]['bugs'].append((fuzzer, evaluation.iteration))
+                errors_dir = os.path.join(self.params.errors_dir, f'{fuzzer.value}_{evaluation.iteration}')
+                os.makedirs(errors_dir, exist_ok=True)
+                for error in evaluation.errors:
+                    error.log_error(errors_dir)
+                print(f'{fuzzer.name} found error(s) at iteration: {evaluation.iteration}')
+            else:
+                if evaluation.new_states is not None and evaluation.new_states > 0 and fuzzer != FuzzerType.RANDOM:
+                    # Novelty is a new state count, or their summed rarity with --novelty-scoring
+                    # Indexed once, the mutants share it and the steps they leave unchanged
+                    schedule = Steps(evaluation.schedule)
+                    self.mutator.add_parent(schedule, evaluation.new_states)
+                    for _ in range(math.ceil(self.params.mutations_per_schedule * evaluation.new_states)):
+                        new_sch = self.mutator.mutate(schedule)
+                        self.sch_pool.append((True, new_sch))
 
+            self.stats[fuzzer.value]['coverage'].append(evaluation.coverage)
 
-    def get_configs(self, fuzzer, iteration) -> tuple[int, int, list]:
+    def save_stats(self, fuzzer) -> None:
+        # Same shape as the Go fuzzer's stats.json, read by analysis/coverage_plot.py
+        working_dir = os.path.join(self.params.result_dir, fuzzer.value)
+        os.makedirs(working_dir, exist_ok=True)
+        stats = {
+            'Coverages': self.stats[fuzzer.value]['coverage'],
+            'RandomTraces': self.stats[fuzzer.value]['random_schedules'],
+            'MutatedTraces': self.stats[fuzzer.value]['mutated_schedules']
+        }
+        with open(os.path.join(working_dir, 'stats.json'), 'w') as f:
+            json.dump(stats, f, indent='\t')
+
+    def get_configs(self, fuzzer, iteration, executed=None) -> tuple[int, int, list]:
         # print('Generating configs')
         run_configs = []
         random_count = 0
         mutated_count = 0
         for i in range(self.params.workers):
-            is_mutated, sch = self.sch_pool.pop(0)
+            is_mutated, sch = self.next_schedule(fuzzer, executed)
             if is_mutated:
                 mutated_count += 1
             else:
                 random_count += 1
 
-            run_configs.append({'run_id': i + iteration,
-                                'fuzzer': fuzzer,
-                                'group_id': next(self.group_ids),
-                                'node_ports': [self.params.base_node_port + (self.params.nodes * i) + j for j in range(self.params.nodes)],
-                                'listener_ports': [self.params.base_listener_port + (self.params.nodes * i) + j for j in range(self.params.nodes)],
-                                'fuzzer_port': self.params.base_network_port + i,
-                                'schedule': sch})
+            run_configs.append(self.create_config(fuzzer, i + iteration, i, sch, sch.origin if is_mutated else None))
         return (mutated_count, random_count, run_configs)
 
-    def run_batch(self, run_configs) -> list[tuple[list, tuple[list, list, list[Error]]]]:
+    def create_config(self, fuzzer, run_id, slot, schedule, origin=None) -> dict:
+        # Runs of one batch need distinct slots (below the number of workers) for their ports
+        return {'run_id': run_id,
+                'fuzzer': fuzzer,
+                'group_id': next(self.group_ids),
+                'node_ports': [self.params.base_node_port + (self.params.nodes * slot) + j for j in range(self.params.nodes)],
+                'listener_ports': [self.params.base_listener_port + (self.params.nodes * slot) + j for j in range(self.params.nodes)],
+                'schedule': schedule,
+                'origin': origin}
+
+    def next_schedule(self, fuzzer, executed) -> tuple[bool, list]:
+        # Pops the next schedule whose effect was not run yet. A duplicate mutant
+        # is mutated again a few times, other duplicates are dropped.
+        while True:
+            if len(self.sch_pool) == 0:
+                self.generate_schedules(1)
+            is_mutated, sch = self.sch_pool.pop(0)
+            if executed is None:
+                return (is_mutated, sch)
+            for attempt in range(self.params.dedup_attempts + 1):
+                if executed.add(schedule_key(sch)):
+                    return (is_mutated, sch)
+                self.stats[fuzzer.value]['duplicate_schedules'] += 1
+                if not is_mutated or attempt == self.params.dedup_attempts:
+                    break
+                sch = self.mutator.mutate(sch)
+            self.stats[fuzzer.value]['dropped_schedules'] += 1
+
+    def create_executor(self) -> concurrent.futures.ProcessPoolExecutor:
+        # Worker processes live for the whole campaign so that each one keeps its
+        # network hub (and the hub's port) across iterations.
+        slots = multiprocessing.Queue()
+        for i in range(self.params.workers):
+            slots.put(i)
+        return concurrent.futures.ProcessPoolExecutor(max_workers=self.params.workers,
+                                                      initializer=init_worker,
+                                                      initargs=(slots,))
+
+    def run_batch(self, executor, run_configs) -> list[tuple[list, list, list[Error], dict, list[dict]]]:
         # print('Running batch')
         results = None
-        with concurrent.futures.ProcessPoolExecutor(max_workers=self.params.workers) as executor:
-            try:
-                results = list(executor.map(self.run_instance, run_configs))
-            except Exception as e:
-                traceback.print_exc()
-            finally:
-                pass
+        try:
+            results = list(executor.map(self.run_instance, run_configs))
+        except Exception as e:
+            traceback.print_exc()
+        finally:
+            pass
         return results
 
 
     def run_instance(self, run_config) -> tuple:
         # print('Running instance')
+        run_config['fuzzer_port'] = self.params.base_network_port + _worker_slot
+        start = time.time()
         cluster = Cluster(self.params, run_config)
-        return cluster.run()
+        schedule, event_trace, errors, run_stats = cluster.run()
+        run_stats['runtime'] = time.time() - start
+        # The embedded evaluator runs here so the workers share its cost, the
+        # states travel back with the results. None leaves them to the guider.
+        states = None
+        if run_config['fuzzer'] == FuzzerType.EMBEDDED:
+            states = RaftEvaluator(self.params.nodes).execute(event_trace)
+        return (schedule, event_trace, errors, run_stats, states)
 
     def generate_schedules(self, num=1) -> None:
         # print(f'Generating schedules: {num}')
@@ -197,6 +337,32 @@ class Fuzzer():
 
             # assert(len(crashed) == 0)
 
+            # Add network fault steps
+            partitions = 0
+            for i in range(self.params.fault_quota):
+                index = random.randint(0, len(schedule))
+                node = random.sample(nodes, 1)[0]
+                to = random.sample([n for n in nodes if n != node], 1)[0]
+                fault_type = random.choice(['Drop', 'Duplicate', 'Reorder', 'Partition'])
+                if fault_type == 'Drop':
+                    step = {'type': 'Drop', 'node': node, 'to': to, 'count': random.randint(1, self.params.max_messages)}
+                elif fault_type == 'Duplicate':
+                    step = {'type': 'Duplicate', 'node': node, 'to': to}
+                elif fault_type == 'Reorder':
+                    step = {'type': 'Reorder', 'node': node, 'to': to,
+                            'count': random.randint(2, max(2, self.params.max_messages)), 'seed': random.randint(0, 2**31)}
+                else:
+                    side = random.sample(nodes, random.randint(1, len(nodes)-1))
+                    step = {'type': 'Partition', 'nodes': sorted(side), 'partition_id': partitions}
+                    partitions += 1
+                schedule.insert(index, step)
+
+            # Add 'Heal' steps after their 'Partition'
+            for i in range(partitions):
+                partition_index = [k for k, s in enumerate(schedule) if s['type'] == 'Partition' and s['partition_id'] == i][0]
+                index = random.randint(partition_index+1, len(schedule))
+                schedule.insert(index, {'type': 'Heal', 'partition_id': i})
+
             # Add 'ClientRequest' type steps
             for i in range(self.params.client_requests):
                 index = random.randint(0, len(schedule))
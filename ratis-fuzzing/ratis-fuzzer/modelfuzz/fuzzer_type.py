@@ -3,4 +3,6 @@ from enum import Enum
 class FuzzerType(Enum):
     MODELFUZZ='modelfuzz'
     RANDOM='random'
-    TRACE='trace'
\ No newline at end of file
+    TRACE='trace'
+    EMBEDDED='embedded'
+    KPATH='k-path'
@@ -1,22 +1,77 @@
+import os
 import json
-import requests
+import struct
 
-from hashlib import sha256
+from hashlib import blake2b
 from threading import Thread
+from modelfuzz.tlc import TLCClient, TLCError, parse_tlc_state
+from modelfuzz.cache import TLCTraceCache
+from modelfuzz.coverage import CoverageMap, MASK_64
+from modelfuzz.novelty import NoveltyScorer
+from modelfuzz.evaluator import RaftEvaluator, CrossCheckClient
 from modelfuzz.fuzzer_type import FuzzerType
 
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
 class GuiderFactory():
     @staticmethod
-    def get_guider(guider_type):
+    def get_guider(guider_type, params, tlc_pool=None):
+        # tlc_pool is shared between guiders, without one the endpoints come from params
+        backends = tlc_pool if tlc_pool is not None else GuiderFactory.get_tlc_endpoints(params)
+        if guider_type == FuzzerType.EMBEDDED:
+            # The workers evaluate their traces and return the states with the
+            # results, the evaluator here only serves traces that came without.
+            # A cache would cost more than evaluating again.
+            evaluator = RaftEvaluator(params.nodes)
+            if params.cross_check_tlc:
+                evaluator = CrossCheckClient(evaluator, TLCClient(backends, timeout=params.tlc_timeout))
+            return TLCGuider(evaluator, repr_dir=GuiderFactory.get_repr_dir(guider_type, params),
+                             scorer=GuiderFactory.get_scorer(params))
+        tlc_client = TLCClient(backends, timeout=params.tlc_timeout)
+        cache = GuiderFactory.get_cache(guider_type, params)
+        repr_dir = GuiderFactory.get_repr_dir(guider_type, params)
         if guider_type == FuzzerType.MODELFUZZ:
-            return TLCGuider()
+            return TLCGuider(tlc_client, cache, repr_dir, GuiderFactory.get_scorer(params))
         elif guider_type == FuzzerType.RANDOM:
-            return TLCGuider()
+            return TLCGuider(tlc_client, cache, repr_dir)
         elif guider_type == FuzzerType.TRACE:
-            return TraceGuider()
+            return TraceGuider(tlc_client, cache, repr_dir)
+        elif guider_type == FuzzerType.KPATH:
+            return KPathGuider(tlc_client, params.kpath_length, cache, repr_dir)
         else:
             return None
 
+    @staticmethod
+    def get_tlc_endpoints(params) -> list[str]:
+        if params.tlc_endpoints:
+            return params.tlc_endpoints
+        return [f'127.0.0.1:{params.base_tlc_port + i}' for i in range(max(1, params.tlc_servers))]
+
+    @staticmethod
+    def get_cache(guider_type, params):
+        if params.tlc_cache_size <= 0:
+            return None
+        spill_dir = None
+        if params.tlc_cache_dir is not None:
+            spill_dir = os.path.join(params.tlc_cache_dir, guider_type.value)
+        return TLCTraceCache(params.tlc_cache_size, spill_dir)
+
+    @staticmethod
+    def get_scorer(params):
+        if not params.novelty_scoring:
+            return None
+        return NoveltyScorer()
+
+    @staticmethod
+    def get_repr_dir(guider_type, params):
+        # None keeps the state reprs in the system temp directory
+        if params.repr_dir is None:
+            return None
+        return os.path.join(params.repr_dir, guider_type.value)
+
 class Guider():
     def __init__(self) -> None:
         pass
@@ -26,54 +81,275 @@ class Guider():
     
     def add_and_get_new_states(self, event_trace) -> int:
         return 0
+
+    def add_and_get_new_states_batch(self, event_traces, states_batch=None) -> list[int]:
+        # states_batch holds the states the workers evaluated, None where they did not
+        return [self.add_and_get_new_states(event_trace) for event_trace in event_traces]
     
     def get_coverage(self) -> int:
         return 0
+
+    def get_stats(self) -> dict:
+        return {}
+
+    def save(self, working_dir) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
         
 class TLCGuider(Guider):
-    def __init__(self):
-        self.states = {}
+    def __init__(self, tlc_client, cache=None, repr_dir=None, scorer=None):
+        self.tlc_client = tlc_client
+        self.states = CoverageMap(repr_dir)
+        # With a scorer, novelty is the summed rarity of the new states instead of their count
+        self.scorer = scorer
+        # Traces whose states never came back from TLC
+        self.lost_traces = 0
+        self.cache = cache
+        if self.cache is not None:
+            self.cache.get_state = self.get_known_state
+
+    def lookup(self, event_trace) -> tuple[bytes, list[dict]]:
+        if self.cache is None:
+            return (None, None)
+        trace_hash = self.cache.trace_hash(event_trace)
+        return (trace_hash, self.cache.get(trace_hash))
 
     def get_states(self, event_trace) -> list[dict]:
-        trace_to_send = event_trace
-        trace_to_send.append({"reset": True})
+        _, states = self.lookup(event_trace)
+        if states is None:
+            states = self.fetch_states(event_trace)
+        return states if states is not None else []
+
+    def fetch_states(self, event_trace) -> list[dict]:
+        # None means the evaluation was lost, not that the trace has no states
         try:
-            r = requests.post(f'http://127.0.0.1:2023/execute', json=trace_to_send)
-            if r.ok:
-                response = r.json() 
-                return [{"state": response['states'][i], 'key' : response['keys'][i]} for i in range(len(response['states']))]              
-            else:
-                print(f'Received error response from TLC, code {r.status_code}, text: {r.content}')
+            return self.tlc_client.execute(event_trace)
         except Exception as e:
             print(f'Error received from TLC: {e}')
-        return []
+        return None
+
+    def fetch_states_batch(self, event_traces) -> list[list[dict]]:
+        if len(event_traces) == 0:
+            return []
+        try:
+            results = self.tlc_client.execute_batch(event_traces)
+        except Exception as e:
+            print(f'Error received from TLC: {e}')
+            return [None for _ in event_traces]
+        states = []
+        for result in results:
+            if isinstance(result, TLCError):
+                print(f'Error received from TLC: {result}')
+                result = None
+            states.append(result)
+        return states
     
+    def lookup_or_fetch(self, event_trace) -> tuple[bytes, list[dict]]:
+        trace_hash, states = self.lookup(event_trace)
+        if states is None:
+            states = self.fetch_states(event_trace)
+        return (trace_hash, states)
+
+    def lookup_or_fetch_batch(self, event_traces, states_batch=None) -> list[tuple[bytes, list[dict]]]:
+        if states_batch is None:
+            states_batch = [None for _ in event_traces]
+        evaluated = [i for i, states in enumerate(states_batch) if states is not None]
+        if isinstance(self.tlc_client, CrossCheckClient) and len(evaluated) > 0:
+            self.tlc_client.compare_batch([event_traces[i] for i in evaluated], [states_batch[i] for i in evaluated])
+        lookups = [(None, states) if states is not None else self.lookup(event_trace)
+                   for event_trace, states in zip(event_traces, states_batch)]
+        missing = [i for i, (_, states) in enumerate(lookups) if states is None]
+        fetched = self.fetch_states_batch([event_traces[i] for i in missing])
+        for i, tla_states in zip(missing, fetched):
+            lookups[i] = (lookups[i][0], tla_states)
+        return lookups
+
     def add_and_get_new_states(self, event_trace) -> int:
-        states = self.get_states(event_trace)
+        return self.add_and_cache_states(*self.lookup_or_fetch(event_trace))
+
+    def add_and_get_new_states_batch(self, event_traces, states_batch=None) -> list[int]:
+        # Traces are evaluated concurrently but added in order, so coverage
+        # accounting is the same as adding them one by one
+        return [self.add_and_cache_states(trace_hash, states) for trace_hash, states in self.lookup_or_fetch_batch(event_traces, states_batch)]
+
+    def add_and_cache_states(self, trace_hash, states) -> int:
+        if states is None:
+            self.lost_traces += 1
+            return None
+        new_states = self.add_states(states)
+        if self.cache is not None and trace_hash is not None and len(states) > 0:
+            self.cache.put(trace_hash, states)
+        return new_states
+
+    def add_states(self, states) -> float:
         new_states = 0
         for tla_state in states:
-            if tla_state['key'] not in self.states:
-                self.states[tla_state['key']] = tla_state
-                new_states += 1
+            if self.states.add(tla_state):
+                new_states += 1 if self.scorer is None else self.scorer.score(tla_state)
         return new_states
 
+    def get_known_state(self, key) -> dict:
+        return self.states.get_state(key)
+
     def get_coverage(self) -> int:
         return len(self.states)
+
+    def get_stats(self) -> dict:
+        stats = {'lost_traces': self.lost_traces}
+        if isinstance(self.tlc_client, TLCClient):
+            stats['tlc_backends'] = self.tlc_client.get_stats()
+        if self.cache is not None:
+            stats['tlc_cache'] = self.cache.get_stats()
+        if isinstance(self.tlc_client, CrossCheckClient):
+            stats['cross_check'] = self.tlc_client.get_stats()
+        if self.scorer is not None:
+            stats['novelty'] = self.scorer.get_stats()
+        return stats
+
+    def close(self) -> None:
+        if self.cache is not None:
+            self.cache.close()
+        self.states.close()
+        self.tlc_client.close()
     
+# Odd multiplier for the rolling hash (the 64-bit FNV prime)
+KPATH_BASE = 0x100000001b3
+# Closes the iterations list of unique_states.json
+KPATH_STATES_TRAILER = b'\n]}\n'
+
+class KPathGuider(Guider):
+    def __init__(self, tlc_client, k, cache=None, repr_dir=None) -> None:
+        self.k = k
+        self.tlc_guider = TLCGuider(tlc_client, cache, repr_dir)
+        self.paths = set()
+        # Per added trace: number of unique k-paths and of known states
+        self.coverages = []
+        self.iterations = []
+        # Iterations already appended to unique_states.json
+        self.saved_iterations = 0
+        self.base_power = pow(KPATH_BASE, max(k-1, 0), 1 << 64)
+
+    def get_states(self, event_trace) -> list[dict]:
+        return self.tlc_guider.get_states(event_trace)
+
+    def add_and_get_new_states(self, event_trace) -> int:
+        trace_hash, states = self.tlc_guider.lookup_or_fetch(event_trace)
+        self.tlc_guider.add_and_cache_states(trace_hash, states)
+        new_paths = self.add_paths(states)
+        self.record_iteration()
+        return new_paths
+
+    def add_and_get_new_states_batch(self, event_traces, states_batch=None) -> list[int]:
+        new_paths = []
+        for trace_hash, states in self.tlc_guider.lookup_or_fetch_batch(event_traces, states_batch):
+            self.tlc_guider.add_and_cache_states(trace_hash, states)
+            new_paths.append(self.add_paths(states))
+            self.record_iteration()
+        return new_paths
+
+    def record_iteration(self) -> None:
+        # One entry per trace, as Coverage() is called once per iteration in the Go fuzzer
+        self.coverages.append(len(self.paths))
+        self.iterations.append(self.tlc_guider.get_coverage())
+
+    def add_paths(self, states) -> int:
+        if states is None:
+            return None
+        new = 0
+        for path in self.path_hashes([s['key'] for s in states]):
+            if path not in self.paths:
+                self.paths.add(path)
+                new += 1
+        return new
+
+    def path_hashes(self, keys):
+        # Polynomial rolling hash over the window of k state keys: each step
+        # drops the oldest key and adds the newest one in O(1). Like the Go
+        # guider, a trace shorter than k is a single window.
+        if len(keys) == 0:
+            return
+        w = min(self.k, len(keys))
+        base_power = self.base_power if w == self.k else pow(KPATH_BASE, w-1, 1 << 64)
+        h = 0
+        for key in keys[:w]:
+            h = (h * KPATH_BASE + (key & MASK_64)) & MASK_64
+        yield self.finalize(h, w)
+        for i in range(w, len(keys)):
+            h = ((h - (keys[i-w] & MASK_64) * base_power) * KPATH_BASE + (keys[i] & MASK_64)) & MASK_64
+            yield self.finalize(h, w)
+
+    def finalize(self, h, length) -> int:
+        # splitmix64 finalizer, the window length keeps short traces apart from full windows
+        z = (h ^ (length * 0x9e3779b97f4a7c15)) & MASK_64
+        z = ((z ^ (z >> 30)) * 0xbf58476d1ce4e5b9) & MASK_64
+        z = ((z ^ (z >> 27)) * 0x94d049bb133111eb) & MASK_64
+        return z ^ (z >> 31)
+
+    def get_coverage(self) -> int:
+        return self.tlc_guider.get_coverage()
+
+    def get_stats(self) -> dict:
+        stats = self.tlc_guider.get_stats()
+        stats['kpaths'] = len(self.paths)
+        return stats
+
+    def save(self, working_dir) -> None:
+        os.makedirs(working_dir, exist_ok=True)
+        with open(os.path.join(working_dir, 'kpath_stats.json'), 'w') as f:
+            json.dump({'coverages': self.coverages}, f, indent=2)
+
+        self.append_unique_states(os.path.join(working_dir, 'unique_states.json'))
+
+    def append_unique_states(self, path) -> None:
+        # Only the iterations since the last save are written: the closing
+        # brackets are overwritten by the new entries and written again after
+        # them, so the file stays valid JSON in the Go guider's shape.
+        if self.saved_iterations == 0:
+            with open(path, 'wb') as f:
+                f.write(b'{"iterations": [' + KPATH_STATES_TRAILER)
+        with open(path, 'r+b') as f:
+            f.seek(-len(KPATH_STATES_TRAILER), os.SEEK_END)
+            for i in range(self.saved_iterations, len(self.iterations)):
+                start = self.iterations[i-1] if i > 0 else 0
+                end = self.iterations[i]
+                iteration = {
+                    'iteration': i,
+                    'number': end - start,
+                    'states': [{'Repr': parse_tlc_state(s['state']), 'Key': s['key']} for s in self.tlc_guider.states.get_states(start, end)]
+                }
+                f.write((',' if i > 0 else '').encode('utf-8') + b'\n' + json.dumps(iteration).encode('utf-8'))
+            f.write(KPATH_STATES_TRAILER)
+            f.truncate()
+        self.saved_iterations = len(self.iterations)
+
+    def close(self) -> None:
+        self.tlc_guider.close()
+
 # TODO - Check event keys    
 class TraceGuider(Guider):
-    def __init__(self) -> None:
+    def __init__(self, tlc_client, cache=None, repr_dir=None) -> None:
         self.traces = {}
-        self.tlc_guider = TLCGuider()
+        self.tlc_guider = TLCGuider(tlc_client, cache, repr_dir)
     
     def get_states(self, event_trace):
         return self.tlc_guider.get_states(event_trace)
 
     def add_and_get_new_states(self, event_trace) -> int:
+        if self.tlc_guider.add_and_get_new_states(event_trace) is None:
+            return None
+        return self.add_trace(event_trace)
+
+    def add_and_get_new_states_batch(self, event_traces, states_batch=None) -> list[int]:
+        # A trace TLC lost stays None, like in TLCGuider, and its graph is not added
+        new_states = self.tlc_guider.add_and_get_new_states_batch(event_traces, states_batch)
+        return [self.add_trace(event_trace) if new is not None else None for event_trace, new in zip(event_traces, new_states)]
+
+    def add_trace(self, event_trace) -> int:
         new = 0
-        self.tlc_guider.add_and_get_new_states(event_trace)
         event_graph = self.create_event_graph(event_trace)
-        event_graph_id = sha256(json.dumps(event_graph, sort_keys=True).encode('utf-8')).hexdigest()
+        event_graph_id = get_graph_id(event_graph)
 
         if event_graph_id not in self.traces:
             self.traces[event_graph_id] = True
@@ -81,23 +357,21 @@ class TraceGuider(Guider):
 
         return new
 
-    def create_event_graph(self, event_trace) -> dict:
+    def create_event_graph(self, event_trace) -> set[bytes]:
+        # Each node hash chains the previous event of the same node, so a node
+        # hash identifies the node's whole history up to that event
         cur_event = {}
-        nodes = {}
+        nodes = set()
 
         for e in event_trace:
             try:
                 if 'reset' in e.keys():
                     continue
                 node = e['params']['node']
-                node_ = {'name': e['name'], 'params': e['params'], 'node': node}
-                if node in cur_event:
-                    node_['prev'] = cur_event[node]['id']
-                id = sha256(json.dumps(node_, sort_keys=True).encode('utf-8')).hexdigest()
-                node_['id'] = id
-
-                cur_event[node] = node_
-                nodes[id] = node_
+                id = hash_128(cur_event.get(node, b'') + encode_value(node) + encode_event(e['name'], e['params']))
+
+                cur_event[node] = id
+                nodes.add(id)
             except:
                 print(f'Event cannot be added to the trace: {e}')
                 # logging.error(f'Event cannot be added to the trace: {e}')
@@ -108,4 +382,62 @@ class TraceGuider(Guider):
     
     def get_coverage(self) -> int:
         return self.tlc_guider.get_coverage()
-    
\ No newline at end of file
+
+    def get_stats(self) -> dict:
+        return self.tlc_guider.get_stats()
+
+    def close(self) -> None:
+        self.tlc_guider.close()
+
+def hash_128(data) -> bytes:
+    if xxhash is not None:
+        return xxhash.xxh3_128_digest(data)
+    return blake2b(data, digest_size=16).digest()
+
+# Encodings of repeated strings (event names, param keys, message types) and
+# of the sorted key order for each params layout
+ENCODING_CACHE_SIZE = 4096
+encoded_strings = {}
+key_orders = {}
+pack_int = struct.Struct('<q').pack
+
+def encode_value(value) -> bytes:
+    # Type-tagged and length-prefixed so different values never share an encoding
+    t = type(value)
+    if t is int:
+        if -(1 << 63) <= value < (1 << 63):
+            return b'i' + pack_int(value)
+    elif t is str:
+        encoded = encoded_strings.get(value)
+        if encoded is None:
+            data = value.encode('utf-8')
+            encoded = b's' + len(data).to_bytes(4, 'little') + data
+            if len(encoded_strings) < ENCODING_CACHE_SIZE:
+                encoded_strings[value] = encoded
+        return encoded
+    elif t is bool:
+        return b't' if value else b'f'
+    elif value is None:
+        return b'n'
+    data = json.dumps(value, sort_keys=True).encode('utf-8')
+    return b'j' + len(data).to_bytes(4, 'little') + data
+
+def encode_event(name, params) -> bytes:
+    keys = tuple(params)
+    order = key_orders.get(keys)
+    if order is None:
+        order = [(key, encode_value(key)) for key in sorted(keys)]
+        if len(key_orders) < ENCODING_CACHE_SIZE:
+            key_orders[keys] = order
+    parts = [encode_value(name)]
+    for key, encoded_key in order:
+        parts.append(encoded_key)
+        parts.append(encode_value(params[key]))
+    return b''.join(parts)
+
+def get_graph_id(nodes) -> bytes:
+    # Sum of the distinct node hashes, independent of the order events were seen in
+    total = 0
+    for id in nodes:
+        total += int.from_bytes(id, 'little')
+    return hash_128((total & ((1 << 128) - 1)).to_bytes(16, 'little') + len(nodes).to_bytes(8, 'little'))
@@ -0,0 +1,126 @@
+import socket
+import asyncio
+import threading
+import traceback
+from threading import Thread
+from modelfuzz.process import processes
+
+class ClusterHost(Thread):
+    # One JVM (CounterClusterHost) running every node of a cluster. The JVM
+    # connects to a control socket opened here, takes 'start <node> <restart>'
+    # and 'crash <node>' lines and reports 'exited <node> <code>' when a node's
+    # server stopped. The RatisServers of the cluster proxy to it.
+    # A crash closes the node's RaftServer, which flushes and shuts down in
+    # order, unlike the SIGKILL a node in its own JVM gets.
+    def __init__(self, config) -> None:
+        Thread.__init__(self)
+        self.config = config
+        self.process = None
+        self.returncode = None
+        self.stdout = self.config['stdout']
+        self.stderr = self.config['stderr']
+
+        self.listener = socket.create_server(('127.0.0.1', 0))
+        self.listener.settimeout(self.config['timeout'])
+        self.conn = None
+        self.lock = threading.Lock()
+        self.connected = threading.Event()
+        self.stopped = threading.Event()
+        # node -> exit code of its last server, and whether it is set
+        self.codes = {}
+        self.exited = {i+1: threading.Event() for i in range(len(self.config['listener_ports']))}
+        # node -> file its errors are written to
+        self.node_stderrs = {}
+
+        self.log4j_config = '-Dlog4j.configuration=file:../ratis-examples/src/main/resources/log4j.properties'
+        self.cmd = ['java'] + self.config['jvm_args'] + [self.log4j_config, '-cp', self.config['jar_path'],
+                    'org.apache.ratis.examples.counter.server.CounterClusterHost',
+                    str(self.config['run_id']),
+                    str(self.config['fuzzer_port']),
+                    str(self.listener.getsockname()[1]),
+                    ','.join([str(p) for p in self.config['listener_ports']]),
+                    self.config['peer_addresses'],
+                    self.config['group_id']]
+        self.reader = Thread(target=self.read_events, daemon=True)
+
+    def run(self) -> None:
+        self.reader.start()
+        asyncio.run(self.run_host())
+
+    async def run_host(self) -> None:
+        try:
+            self.process = await processes.spawn(self.cmd, self.config['owner'], stdout=self.stdout, stderr=self.stderr)
+            await self.process.wait()
+            self.returncode = self.process.returncode
+        except Exception as e:
+            print(f'Error on cluster host: {self.config["run_id"]}')
+            traceback.print_exc()
+            self.returncode = self.process.returncode if self.process is not None and self.process.returncode is not None else -1
+        finally:
+            self.host_stopped()
+
+    def read_events(self) -> None:
+        try:
+            conn, _ = self.listener.accept()
+        except OSError:
+            self.host_stopped()
+            return
+        self.conn = conn
+        self.connected.set()
+        try:
+            for line in conn.makefile('r', encoding='utf-8'):
+                event = line.rstrip('\n').split(' ', 2)
+                if event[0] == 'exited':
+                    node = int(event[1])
+                    self.codes[node] = int(event[2])
+                    self.exited[node].set()
+                elif event[0] == 'error' and int(event[1]) in self.node_stderrs:
+                    self.node_stderrs[int(event[1])].write(event[2] + '\n')
+                    self.node_stderrs[int(event[1])].flush()
+        except OSError:
+            pass
+
+    def host_stopped(self) -> None:
+        # Nodes still running went down with the JVM
+        if self.stopped.is_set():
+            return
+        self.stopped.set()
+        self.connected.set()
+        code = self.returncode if self.returncode is not None else -1
+        for node, exited in self.exited.items():
+            if not exited.is_set():
+                self.codes[node] = code
+                exited.set()
+
+    def send(self, command) -> bool:
+        if not self.connected.wait(self.config['timeout']) or self.stopped.is_set() or self.conn is None:
+            return False
+        try:
+            with self.lock:
+                self.conn.sendall(f'{command}\n'.encode())
+        except OSError:
+            return False
+        return True
+
+    def run_node(self, node, restart, stderr, timeout) -> int:
+        # Runs the node's server until it stops, its exit code or None on timeout
+        self.node_stderrs[node] = stderr
+        exited = self.exited[node]
+        exited.clear()
+        if not self.send(f'start {node} {1 if restart else 0}'):
+            return self.returncode if self.returncode is not None else -1
+        if not exited.wait(timeout):
+            return None
+        return self.codes[node]
+
+    def crash_node(self, node) -> None:
+        # The host closes the server before it takes the next command
+        self.send(f'crash {node}')
+
+    def close(self) -> None:
+        # Killing the group takes the nodes still running with it, their
+        # proxies see the JVM's exit code once it is reaped
+        processes.kill(self.process)
+        if self.conn is not None:
+            self.conn.close()
+        self.listener.close()
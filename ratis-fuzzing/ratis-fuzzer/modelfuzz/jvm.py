@@ -0,0 +1,121 @@
+import os
+import time
+import shlex
+import random
+import signal
+import shutil
+import tempfile
+
+from modelfuzz.network import Network
+from modelfuzz.server import RatisServer
+from modelfuzz.process import processes
+
+JVM_PROFILES = {
+    # JVM defaults
+    'default': [],
+    # C1 only and a single-threaded GC, nodes live for seconds and never reach C2 anyway
+    'fast-start': ['-XX:TieredStopAtLevel=1', '-XX:+UseSerialGC', '-Xshare:auto', '-XX:-UsePerfData'],
+    # fast-start with a small fixed heap, for many clusters per host
+    'small': ['-XX:TieredStopAtLevel=1', '-XX:+UseSerialGC', '-Xshare:auto', '-XX:-UsePerfData',
+              '-Xms64m', '-Xmx256m', '-Xss512k'],
+}
+
+GC_FLAGS = {
+    'serial': '-XX:+UseSerialGC',
+    'parallel': '-XX:+UseParallelGC',
+    'g1': '-XX:+UseG1GC',
+}
+
+def get_jvm_args(profile='default', heap=None, gc=None, cds_archive=None, flags=None) -> list[str]:
+    # Flags for the server and client JVMs, the options override the profile
+    args = list(JVM_PROFILES[profile])
+    if heap is not None:
+        args = [a for a in args if not a.startswith('-Xms') and not a.startswith('-Xmx')] + [f'-Xms{heap}', f'-Xmx{heap}']
+    if gc is not None:
+        args = [a for a in args if a not in GC_FLAGS.values()] + [GC_FLAGS[gc]]
+    if cds_archive is not None:
+        # With -Xshare:auto a JVM that cannot map the archive starts without it
+        args = [a for a in args if not a.startswith('-Xshare')] + [f'-XX:SharedArchiveFile={cds_archive}', '-Xshare:auto']
+    if flags is not None:
+        args += shlex.split(flags)
+    return args
+
+def get_params_jvm_args(params) -> list[str]:
+    return get_jvm_args(params.jvm_profile, params.jvm_heap, params.jvm_gc, params.jvm_cds_archive, params.jvm_flags)
+
+class StandaloneNodes():
+    # Ratis nodes started outside a Cluster against a network of their own, to
+    # train CDS archives and to time startup
+    def __init__(self, jar_path, nodes, jvm_args, run_id=0, fuzzer_port=7070, base_node_port=6500,
+                 base_listener_port=10500, data_dir='./data', node_jvm_args=None) -> None:
+        self.nodes = nodes
+        self.run_id = run_id
+        self.data_dir = data_dir
+        self.owner = processes.new_owner()
+        self.network = Network(fuzzer_port, f'standalone_{run_id}', run_id=run_id)
+        self.log_dir = tempfile.mkdtemp(prefix='nodes-')
+        peer_addresses = ','.join([f'127.0.0.1:{base_node_port + i}' for i in range(nodes)])
+        node_jvm_args = node_jvm_args if node_jvm_args is not None else {}
+        self.servers: list[RatisServer] = []
+        for i in range(nodes):
+            self.servers.append(RatisServer({
+                'jar_path': jar_path,
+                'jvm_args': jvm_args + node_jvm_args.get(i+1, []),
+                'run_id': run_id,
+                'fuzzer_port': fuzzer_port,
+                'listener_port': base_listener_port + i,
+                'peer_index': i+1,
+                'peer_addresses': peer_addresses,
+                'group_id': '02511d47-d67c-49a3-9011-abb3109a44c0',
+                'timeout': 600,
+                'owner': self.owner,
+                'stdout': open(os.path.join(self.log_dir, f'stdout_{i+1}.log'), mode='w+'),
+                'stderr': open(os.path.join(self.log_dir, f'stderr_{i+1}.log'), mode='w+')
+            }))
+
+    def start(self, timeout=60) -> float:
+        # Seconds from launch until every node registered with the network, None on timeout
+        self.network.start()
+        start = time.time()
+        for server in self.servers:
+            server.start()
+        while self.network.get_num_replicas() != self.nodes:
+            if time.time() - start > timeout:
+                return None
+            time.sleep(0.005)
+        return time.time() - start
+
+    def drive(self, duration, max_msgs=5) -> None:
+        # Delivers messages between random nodes, like 'Schedule' steps do
+        end = time.time() + duration
+        while time.time() < end:
+            node = random.randint(1, self.nodes)
+            to = random.choice([n for n in range(1, self.nodes+1, 1) if n != node])
+            self.network.schedule_node(node, to, random.randint(1, max_msgs), False)
+            time.sleep(3e-2)
+
+    def terminate(self, node, timeout=60) -> bool:
+        # Lets the node's JVM exit normally, so that exit-time dumps are written
+        server = self.servers[node-1]
+        if server.process is None:
+            return False
+        try:
+            os.kill(server.process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            return False
+        end = time.time() + timeout
+        while server.process.returncode is None and time.time() < end:
+            time.sleep(0.1)
+        return server.process.returncode is not None
+
+    def stop(self) -> None:
+        self.network.stop()
+        for server in self.servers:
+            server.close()
+            server.join()
+        processes.release(self.owner)
+        for server in self.servers:
+            server.stdout.close()
+            server.stderr.close()
+        shutil.rmtree(self.log_dir, ignore_errors=True)
+        shutil.rmtree(os.path.join(self.data_dir, f'{self.run_id}'), ignore_errors=True)
@@ -0,0 +1,99 @@
+import math
+
+from modelfuzz.fuzzer import Fuzzer
+from modelfuzz.fuzzer_type import FuzzerType
+from modelfuzz.schedule import schedule_key
+
+class Minimizer():
+    # Shrinks the executed schedule of a logged Error with ddmin (Zeller and
+    # Hildebrandt), then halves max_msgs where the error still shows up.
+    # Candidates run in parallel on the fuzzer's worker pool, each one several
+    # times since cluster runs are not deterministic.
+    def __init__(self, params, error) -> None:
+        self.params = params
+        self.name = error['name']
+        self.fuzzer_type = FuzzerType(error['fuzzer'])
+        self.schedule = error['schedule']
+        self.fuzzer = Fuzzer(params)
+        self.repetitions = max(1, params.minimize_repetitions)
+        self.reproductions = max(1, params.minimize_reproductions)
+        # schedule_key -> whether the candidate reproduced the error
+        self.tested = {}
+        self.runs = 0
+
+    def run(self) -> list[dict]:
+        executor = self.fuzzer.create_executor()
+        try:
+            if self.first_reproducing(executor, [self.schedule]) is None:
+                print(f'{self.name} did not reproduce in {self.repetitions} runs, keeping the schedule as it is')
+                return self.schedule
+            steps = self.ddmin(executor, list(self.schedule))
+            steps = self.shrink_messages(executor, steps)
+        finally:
+            executor.shutdown()
+        print(f'Minimized {self.name} from {len(self.schedule)} to {len(steps)} steps in {self.runs} runs')
+        return steps
+
+    def ddmin(self, executor, steps) -> list[dict]:
+        n = 2
+        while len(steps) >= 2:
+            size = math.ceil(len(steps) / n)
+            subsets = [steps[i:i+size] for i in range(0, len(steps), size)]
+            # With two chunks the complements are the subsets
+            complements = [steps[:i] + steps[i+size:] for i in range(0, len(steps), size)] if len(subsets) > 2 else []
+            found = self.first_reproducing(executor, subsets + complements)
+            if found is not None and found < len(subsets):
+                steps, n = subsets[found], 2
+            elif found is not None:
+                steps, n = complements[found - len(subsets)], max(len(subsets) - 1, 2)
+            elif len(subsets) >= len(steps):
+                break
+            else:
+                n = min(len(subsets) * 2, len(steps))
+                continue
+            print(f'{self.name} reproduces with {len(steps)} steps')
+        return steps
+
+    def shrink_messages(self, executor, steps) -> list[dict]:
+        while True:
+            candidates = [steps[:i] + [dict(step, max_msgs=step['max_msgs'] // 2)] + steps[i+1:]
+                          for i, step in enumerate(steps) if step['type'] == 'Schedule' and step['max_msgs'] > 1]
+            found = self.first_reproducing(executor, candidates)
+            if found is None:
+                return steps
+            steps = candidates[found]
+
+    def first_reproducing(self, executor, candidates) -> int:
+        # Index of the first candidate that reproduces the error, None if none
+        # does. A batch fills the workers, so later candidates are only run if
+        # the earlier ones did not reproduce.
+        batch_size = max(1, self.params.workers // self.repetitions)
+        for start in range(0, len(candidates), batch_size):
+            batch = candidates[start:start+batch_size]
+            self.test(executor, batch)
+            for i, candidate in enumerate(batch):
+                if self.tested[schedule_key(candidate)]:
+                    return start + i
+        return None
+
+    def test(self, executor, candidates) -> None:
+        keys = {}
+        for candidate in candidates:
+            key = schedule_key(candidate)
+            if key not in self.tested:
+                keys[key] = candidate
+        hits = {key: 0 for key in keys}
+        runs = [(key, candidate) for key, candidate in keys.items() for _ in range(self.repetitions)]
+        for start in range(0, len(runs), self.params.workers):
+            batch = runs[start:start+self.params.workers]
+            run_configs = [self.fuzzer.create_config(self.fuzzer_type, self.runs + slot, slot, candidate)
+                           for slot, (_, candidate) in enumerate(batch)]
+            self.runs += len(batch)
+            results = self.fuzzer.run_batch(executor, run_configs)
+            if results is None:
+                continue
+            for (key, _), (_, _, errors, _, _) in zip(batch, results):
+                if any(error.name == self.name for error in errors):
+                    hits[key] += 1
+        for key in keys:
+            self.tested[key] = hits[key] >= self.reproductions
@@ -1,6 +1,11 @@
+import copy
+import math
+import heapq
 import random
 
 from enum import Enum
+from itertools import count, islice
+from modelfuzz.schedule import Steps, FAULT_TYPES
 
 class MutatorType(Enum):
     ALL='all'
@@ -8,6 +13,9 @@ class MutatorType(Enum):
     SWAP_CRASH_NODES='swap_crash_nodes'
     SWAP_CRASH_STEPS='swap_crash_steps'
     SWAP_MAX_MESSAGES='swap_max_messages'
+    SWAP_FAULT_STEPS='swap_fault_steps'
+    SPLICE='splice'
+    BANDIT='bandit'
 
 class MutatorFactory:
     @staticmethod
@@ -22,157 +30,347 @@ class MutatorFactory:
             return SwapCrashStepsMutator(params)
         elif type == MutatorType.SWAP_MAX_MESSAGES:
             return SwapMaxMessagesMutator(params)
+        elif type == MutatorType.SWAP_FAULT_STEPS:
+            return SwapFaultStepsMutator(params)
+        elif type == MutatorType.SPLICE:
+            return SpliceMutator(params)
+        elif type == MutatorType.BANDIT:
+            return BanditMutator(params)
         else:
             return CombinedMutator(params)
 
 class Mutator:
-    def __init__(self, params) -> None:
+    def __init__(self, params, rng=None) -> None:
         self.params = params
+        # Own random stream, mutants only depend on the seed and the schedules
+        self.rng = rng if rng is not None else random.Random(params.seed)
 
-    def mutate(self, schedule) -> list[dict]:
+    def mutate(self, schedule) -> Steps:
+        # Returns a new schedule, the one passed in is left as it was. A mutant
+        # of Steps shares its index and unchanged steps, a list is indexed first.
+        if not isinstance(schedule, Steps):
+            schedule = Steps(schedule)
+        mutant = schedule.copy()
+        self.mutate_schedule(mutant)
+        return mutant
+
+    def mutate_schedule(self, schedule: Steps) -> None:
+        # Mutates a copy in place
+        pass
+
+    def add_parent(self, schedule: Steps, novelty) -> None:
+        # An executed schedule that found new states
+        pass
+
+    def update(self, origin, novelty, runtime) -> None:
+        # Feedback for a mutant whose Steps.origin is origin: its novelty and
+        # the seconds its cluster ran
         pass
 
+    def get_stats(self) -> dict:
+        return {}
+
 class SwapNodesMutator(Mutator):
-    def __init__(self, params) -> None:
-        super().__init__(params)
+    def __init__(self, params, rng=None) -> None:
+        super().__init__(params, rng)
 
-    def mutate(self, schedule) -> list[dict]:
+    def mutate_schedule(self, schedule: Steps) -> None:
+        count = schedule.schedule_count()
+        if count < 2:
+            return
         for _ in range(self.params.mutation_count):
-            first_idx = random.choice(list(range(self.params.steps)))
-            second_idx = random.choice([i for i in range(self.params.steps) if i != first_idx])
-
-            first_step = -1
-            second_step = -1
-            ctr = 0
-            for i, step in enumerate(schedule):
-                if step['type'] == 'Schedule':
-                    if ctr == first_idx:
-                        first_step = i
-                    elif ctr == second_idx:
-                        second_step = i
-                    ctr += 1
-            
-            # assert(first_step >= 0 and second_step >= 0)
-            schedule[first_step], schedule[second_step] = schedule[second_step], schedule[first_step]
-        return schedule
+            first_idx, second_idx = self.rng.sample(range(count), 2)
+            # Both are 'Schedule' steps, the indexes stay as they are
+            schedule.swap(schedule.schedule_position(first_idx), schedule.schedule_position(second_idx))
 
 class SwapCrashNodesMutator(Mutator):
-    def __init__(self, params) -> None:
-        super().__init__(params)
+    def __init__(self, params, rng=None) -> None:
+        super().__init__(params, rng)
     
-    def mutate(self, schedule) -> list[dict]:
-        for _ in range(self.params.mutation_count):
-            if self.params.crash_quota == 1:
-                for step in schedule:
-                    if step['type'] == 'Crash':
-                        step['node'] = random.choice([i for i in range(1, self.params.nodes+1, 1) if i != step['node']])
-            else:
-                first_idx = random.choice(list(range(self.params.crash_quota)))
-                second_idx = random.choice([i for i in range(self.params.crash_quota) if i != first_idx])
-
-                first_crash = -1
-                second_crash = -1
-                for i, step in enumerate(schedule):
-                    if step['type'] == 'Crash':
-                        if step['crash_id'] == first_idx:
-                            first_crash = i
-                        elif step['crash_id'] == second_idx:
-                            second_crash = i
-                
-                # assert(first_crash >= 0 and second_crash >= 0)
-                schedule[first_crash], schedule[second_crash] = schedule[second_crash], schedule[first_crash]
-                
-                # Repair restart order to ensure each crash has a restart
-                first_restart = -1
-                second_restart = -1
-                for i, step in enumerate(schedule):
-                    if step['type'] == 'Restart':
-                        if step['crash_id'] == first_idx:
-                            first_restart = i
-                        elif step['crash_id'] == second_idx:
-                            second_restart = i
-                
-                # assert(first_restart > 0 and second_restart > 0)
-                schedule[first_restart], schedule[second_restart] = schedule[second_restart], schedule[first_restart]
-        return schedule
+    def mutate_schedule(self, schedule: Steps) -> None:
+        rounds = self.params.mutation_count
+        crash_ids = list(schedule.ids['Crash'])
+        if self.params.crash_quota == 1:
+            for idx in crash_ids:
+                crash_step = schedule.position('Crash', idx)
+                node = schedule[crash_step]['node']
+                for _ in range(rounds):
+                    node = self.rng.choice([i for i in range(1, self.params.nodes+1, 1) if i != node])
+                schedule.update(crash_step, node=node)
+        elif len(crash_ids) >= 2:
+            for _ in range(rounds):
+                first_idx, second_idx = self.rng.sample(crash_ids, 2)
+                first_restart, second_restart = schedule.position('Restart', first_idx), schedule.position('Restart', second_idx)
+                if first_restart is None or second_restart is None:
+                    continue
+
+                # Swapping the restarts too keeps each restart behind its crash
+                schedule.swap(schedule.position('Crash', first_idx), schedule.position('Crash', second_idx))
+                schedule.swap(first_restart, second_restart)
     
 class SwapCrashStepsMutator(Mutator):
-    def __init__(self, params) -> None:
-        super().__init__(params)
+    def __init__(self, params, rng=None) -> None:
+        super().__init__(params, rng)
     
-    def mutate(self, schedule) -> list[dict]:
+    def mutate_schedule(self, schedule: Steps) -> None:
+        crash_ids = list(schedule.ids['Crash'])
+        if len(crash_ids) == 0:
+            return
         for _ in range(self.params.mutation_count):
-            idx = random.choice(list(range(self.params.crash_quota)))
-
-            crash_step = -1
-            for i, step in enumerate(schedule):
-                if step['type'] == 'Crash':
-                    if step['crash_id'] == idx:
-                        crash_step = i
-            
-            # assert(crash_step >= 0)
-            step = schedule.pop(crash_step)
-            schedule.insert(random.choice(list(range(len(schedule)+1))), step)
+            idx = self.rng.choice(crash_ids)
+
+            # Move the crash to a random place
+            step = schedule.pop(schedule.position('Crash', idx))
+            crash_step = self.rng.randint(0, len(schedule))
+            schedule.insert(crash_step, step)
 
             # Repair restart order to ensure each crash has a restart
-            restart_step = -1
-            for i, step in enumerate(schedule):
-                if step['type'] == 'Restart':
-                    if step['crash_id'] == idx:
-                        restart_step = i
-            
-            # assert(restart_step > 0)
-            step = schedule.pop(restart_step)
-            if crash_step < len(schedule):
-                schedule.insert(random.choice([i for i in range(len(schedule)+1) if i > crash_step]), step) 
-            else:
-                schedule.append(step)
-        return schedule
+            restart_step = schedule.position('Restart', idx)
+            if restart_step is not None:
+                step = schedule.pop(restart_step)
+                if restart_step < crash_step:
+                    crash_step -= 1
+                schedule.insert(self.rng.randint(crash_step+1, len(schedule)), step)
     
 class SwapMaxMessagesMutator(Mutator):
-    def __init__(self, params) -> None:
-        super().__init__(params)
+    def __init__(self, params, rng=None) -> None:
+        super().__init__(params, rng)
 
-    def mutate(self, schedule) -> list[dict]:
+    def mutate_schedule(self, schedule: Steps) -> None:
+        count = schedule.schedule_count()
+        if count < 2:
+            return
         for _ in range(self.params.mutation_count):
-            first_idx = random.choice(list(range(self.params.steps)))
-            second_idx = random.choice([i for i in range(self.params.steps) if i != first_idx])
-
-            first_step = 0
-            second_step = 0
-            ctr = 0
-            for i, step in enumerate(schedule):
-                if step['type'] == 'Schedule':
-                    if ctr == first_idx:
-                        first_step = i
-                    elif ctr == second_idx:
-                        second_step = i
-                    ctr += 1
-            
-            # assert(first_step >= 0 and second_step >= 0)
-            if 'max_msgs' in schedule[first_step].keys() and 'max_msgs' in schedule[second_step].keys():
-                schedule[first_step]['max_msgs'], schedule[second_step]['max_msgs'] = schedule[second_step]['max_msgs'], schedule[first_step]['max_msgs']
-        return schedule
+            first_idx, second_idx = self.rng.sample(range(count), 2)
+            first_step, second_step = schedule.schedule_position(first_idx), schedule.schedule_position(second_idx)
+            first_msgs = schedule[first_step].get('max_msgs')
+            second_msgs = schedule[second_step].get('max_msgs')
+            if first_msgs is not None and second_msgs is not None:
+                schedule.update(first_step, max_msgs=second_msgs)
+                schedule.update(second_step, max_msgs=first_msgs)
+
+class SwapFaultStepsMutator(Mutator):
+    FAULT_TYPES = FAULT_TYPES
+
+    def __init__(self, params, rng=None) -> None:
+        super().__init__(params, rng)
+
+    def mutate_schedule(self, schedule: Steps) -> None:
+        faults = schedule.fault_count()
+        if faults == 0:
+            return
+        nodes = list(range(1, self.params.nodes+1, 1))
+        for _ in range(self.params.mutation_count):
+            step = schedule.pop(schedule.fault_position(self.rng.randrange(faults)))
+            if 'to' in step:
+                # Re-target the fault at another link
+                node = self.rng.choice(nodes)
+                step = dict(step, node=node, to=self.rng.choice([i for i in nodes if i != node]))
+            fault_step = self.rng.randint(0, len(schedule))
+            schedule.insert(fault_step, step)
+
+            if step['type'] == 'Partition':
+                # Repair heal order to ensure each partition is healed after it starts
+                heal_step = schedule.position('Heal', step['partition_id'])
+                if heal_step is not None and heal_step < fault_step:
+                    heal = schedule.pop(heal_step)
+                    fault_step -= 1
+                    schedule.insert(self.rng.randint(fault_step+1, len(schedule)), heal)
 
 class CombinedMutator(Mutator):
-    def __init__(self, params) -> None:
-        super().__init__(params)
-        self.mutators: list[Mutator] = [SwapNodesMutator(self.params), 
-                         SwapCrashNodesMutator(self.params), 
-                         SwapCrashStepsMutator(self.params), 
-                         SwapMaxMessagesMutator(self.params)]
+    def __init__(self, params, rng=None) -> None:
+        super().__init__(params, rng)
+        # One random stream for all, so they do not draw the same numbers
+        self.mutators: list[Mutator] = [SwapNodesMutator(self.params, self.rng), 
+                         SwapCrashNodesMutator(self.params, self.rng), 
+                         SwapCrashStepsMutator(self.params, self.rng), 
+                         SwapMaxMessagesMutator(self.params, self.rng),
+                         SwapFaultStepsMutator(self.params, self.rng)]
     
-    def mutate(self, schedule) -> list[dict]:
+    def mutate_schedule(self, schedule: Steps) -> None:
+        # The index is built once and shared by all mutators
         for mutator in self.mutators:
-            try:
-                schedule = mutator.mutate(schedule)
-            finally:
-                schedule = schedule
-        return schedule
-                
-                
-    
-        
+            mutator.mutate_schedule(schedule)
+
+class SpliceMutator(Mutator):
+    # Joins a prefix of the schedule with a suffix of one of the schedules
+    # that found the most new states
+    CORPUS_SIZE = 32
+
+    def __init__(self, params, rng=None) -> None:
+        super().__init__(params, rng)
+        # Min-heap of (novelty, seq, schedule), the least novel is dropped first
+        self.corpus = []
+        self.seq = count()
+
+    def add_parent(self, schedule: Steps, novelty) -> None:
+        entry = (novelty, next(self.seq), schedule)
+        if len(self.corpus) < self.CORPUS_SIZE:
+            heapq.heappush(self.corpus, entry)
+        elif novelty > self.corpus[0][0]:
+            heapq.heapreplace(self.corpus, entry)
+
+    def mutate_schedule(self, schedule: Steps) -> None:
+        if len(self.corpus) == 0:
+            return
+        _, _, parent = self.rng.choices(self.corpus, weights=[novelty for (novelty, _, _) in self.corpus])[0]
+        schedule.replace(self.splice(schedule, parent))
+
+    def splice(self, first: Steps, second: Steps) -> list[dict]:
+        # Cut the second schedule after as many 'Schedule' steps as the first
+        # one has before its cut, so the suffix picks up at the same point in time
+        cut = self.rng.randint(0, len(first))
+        ordinal = first.schedule_rank(cut)
+        second_cut = second.schedule_position(ordinal) if ordinal < second.schedule_count() else len(second)
+
+        # Renumber crash and partition ids in order, drop restarts and heals
+        # whose crash or partition was cut off
+        steps = []
+        crash_ids, partition_ids = count(), count()
+        crashes, partitions = {}, {}
+        for side, part in enumerate([islice(first, cut), islice(second, second_cut, None)]):
+            for step in part:
+                type = step['type']
+                if type == 'Crash' or type == 'Partition':
+                    ids, opened, field = (crash_ids, crashes, 'crash_id') if type == 'Crash' else (partition_ids, partitions, 'partition_id')
+                    new_id = next(ids)
+                    opened[(side, step[field])] = (new_id, len(steps))
+                    steps.append(step if step[field] == new_id else dict(step, **{field: new_id}))
+                elif type == 'Restart' or type == 'Heal':
+                    opened, field = (crashes, 'crash_id') if type == 'Restart' else (partitions, 'partition_id')
+                    new_id, _ = opened.pop((side, step[field]), (None, None))
+                    if new_id is None:
+                        continue
+                    steps.append(step if step[field] == new_id else dict(step, **{field: new_id}))
+                else:
+                    steps.append(step)
+
+        # Crashes and partitions that lost their restart or heal get one behind
+        # them, latest first so that earlier positions stay valid
+        missing = [(pos, {'type': 'Restart', 'node': steps[pos]['node'], 'crash_id': new_id}) for (new_id, pos) in crashes.values()]
+        missing += [(pos, {'type': 'Heal', 'partition_id': new_id}) for (new_id, pos) in partitions.values()]
+        for pos, step in sorted(missing, key=lambda m: m[0], reverse=True):
+            steps.insert(self.rng.randint(pos + 1, len(steps)), step)
+        return steps
+
+class MutatorArm():
+    def __init__(self, mutator_type, mutation_count, mutator) -> None:
+        self.mutator_type = mutator_type
+        self.mutation_count = mutation_count
+        self.mutator = mutator
+        # Discounted observations of the yield (novelty per second of cluster time)
+        self.weight = 0.0
+        self.total = 0.0
+        self.squares = 0.0
+        self.mutants = 0
+        self.evaluated = 0
+        self.novelty = 0.0
+        self.runtime = 0.0
+
+    def mean(self) -> float:
+        return self.total / self.weight
+
+    def variance(self) -> float:
+        return max(0.0, self.squares / self.weight - self.mean() ** 2)
+
+    def decay(self, factor) -> None:
+        self.weight *= factor
+        self.total *= factor
+        self.squares *= factor
+
+    def get_stats(self) -> dict:
+        return {'mutator': self.mutator_type.value,
+                'mutation_count': self.mutation_count,
+                'mutants': self.mutants,
+                'evaluated': self.evaluated,
+                'novelty': self.novelty,
+                'runtime': self.runtime,
+                'yield': self.novelty / self.runtime if self.runtime > 0 else 0.0}
+
+class BanditMutator(Mutator):
+    # Picks an operator and intensity (mutation_count) per mutant by Thompson
+    # sampling over their yield, so cluster time goes to what finds new states.
+    # Old observations fade out since yields drop as coverage saturates.
+    OPERATORS = [MutatorType.SWAP_NODES, MutatorType.SWAP_CRASH_NODES, MutatorType.SWAP_CRASH_STEPS,
+                 MutatorType.SWAP_MAX_MESSAGES, MutatorType.SWAP_FAULT_STEPS, MutatorType.ALL, MutatorType.SPLICE]
+    DECAY = 0.995
+    # Smallest prior variance of a yield, so arms that only ever yielded the same stay uncertain
+    MIN_SPREAD = 1e-6
+
+    def __init__(self, params, rng=None) -> None:
+        super().__init__(params, rng)
+        counts = sorted(set([max(1, params.mutation_count // 4), max(1, params.mutation_count // 2),
+                             params.mutation_count, params.mutation_count * 2]))
+        self.arms: list[MutatorArm] = []
+        for mutator_type in self.OPERATORS:
+            # A splice does not repeat, one intensity is enough
+            for mutation_count in (counts if mutator_type != MutatorType.SPLICE else [params.mutation_count]):
+                arm_params = copy.copy(params)
+                arm_params.mutation_count = mutation_count
+                mutator = MutatorFactory.get_mutator(mutator_type, arm_params)
+                # One random stream for all arms
+                mutator.rng = self.rng
+                if isinstance(mutator, CombinedMutator):
+                    for m in mutator.mutators:
+                        m.rng = self.rng
+                self.arms.append(MutatorArm(mutator_type, mutation_count, mutator))
+
+    def choose(self, prior_mean, prior_spread) -> int:
+        # Normal-Gamma posterior per arm over its mean yield. The prior is worth
+        # one observation with the mean and spread of all arms, so an arm's mean
+        # is pulled towards the others' until it has observations of its own.
+        best, best_sample = 0, None
+        beta = max(prior_spread, self.MIN_SPREAD)
+        for i, arm in enumerate(self.arms):
+            if arm.evaluated == 0:
+                # Untried arms go first, in random order
+                sample = (1, self.rng.random())
+            else:
+                n, mean = arm.weight, arm.mean()
+                kappa = 1.0 + n
+                mu = (prior_mean + n * mean) / kappa
+                alpha = 1.0 + n / 2
+                rate = beta + (n * arm.variance() + n * (mean - prior_mean) ** 2 / kappa) / 2
+                precision = self.rng.gammavariate(alpha, 1.0 / rate)
+                sample = (0, self.rng.gauss(mu, 1.0 / math.sqrt(kappa * precision)))
+            # Equal samples are broken at random, not in favour of the first arm
+            sample += (self.rng.random(),)
+            if best_sample is None or sample > best_sample:
+                best, best_sample = i, sample
+        return best
+
+    def mutate(self, schedule) -> Steps:
+        # Mean and spread of yields over all arms, the prior of every arm
+        weight = sum(arm.weight for arm in self.arms)
+        mean, spread = 0.0, 0.0
+        if weight > 0:
+            mean = sum(arm.total for arm in self.arms) / weight
+            spread = max(0.0, sum(arm.squares for arm in self.arms) / weight - mean ** 2)
+
+        arm = self.choose(mean, spread)
+        mutant = self.arms[arm].mutator.mutate(schedule)
+        self.arms[arm].mutants += 1
+        mutant.origin = arm
+        return mutant
+
+    def add_parent(self, schedule: Steps, novelty) -> None:
+        for arm in self.arms:
+            arm.mutator.add_parent(schedule, novelty)
 
-        
+    def update(self, origin, novelty, runtime) -> None:
+        if origin is None or novelty is None:
+            return
+        runtime = max(runtime, 1e-3)
+        for arm in self.arms:
+            arm.decay(self.DECAY)
+        arm = self.arms[origin]
+        reward = novelty / runtime
+        arm.weight += 1
+        arm.total += reward
+        arm.squares += reward * reward
+        arm.evaluated += 1
+        arm.novelty += novelty
+        arm.runtime += runtime
 
+    def get_stats(self) -> dict:
+        return {'arms': [arm.get_stats() for arm in self.arms]}
@@ -4,15 +4,19 @@ import warnings
 # ignore RuntimeWarning from asyncio
 # warnings.filterwarnings('ignore')
 
+import copy
 import time
 import json
+import random
 import base64
 import asyncio
 import requests
 import traceback
 
+from collections import deque
 from aiohttp import web
-from threading import Thread, Lock
+from threading import Thread, Lock, Event
+from modelfuzz.trace import EventTrace
 
 
 class Message:
@@ -23,6 +27,10 @@ class Message:
         self.id = id
         self.data = data
         self.params = params
+        # Mapped TLC event params, filled in once by the EventMapper
+        self.event_params = None
+        # Request ids of coalesced requests that this message's reply answers too
+        self.coalesced = []
 
     def from_str(m) -> Message:
         if 'from' not in m or 'to' not in m or 'type' not in m or 'data' not in m:
@@ -32,49 +40,188 @@ class Message:
     def __str__(self) -> str:
         return f'fr: {self.fr}, to: {self.to}, type: {self.type}, msg: {self.data}, id: {self.id}, params: {self.params}'
 
-        
+    def is_request(self) -> bool:
+        return self.type.endswith('_request')
 
-class Network(Thread):
-    def __init__(self, port) -> None:
-        Thread.__init__(self)
-        # print('Initializing network')
-        self.port = port
-        self.event_mapper = EventMapper()
+    def get_request_id(self) -> str:
+        # data is the base64 of {"data": ..., "request_id": ...}, see InterceptorMessage
+        try:
+            return json.loads(base64.b64decode(self.data)).get('request_id', '')
+        except (ValueError, TypeError, AttributeError):
+            return ''
+
+    def with_request_id(self, request_id) -> Message:
+        data = json.loads(base64.b64decode(self.data))
+        data['request_id'] = request_id
+        return Message(self.fr, self.to, self.type, base64.b64encode(json.dumps(data).encode()).decode(), self.id, self.params)
 
+    def to_dict(self) -> dict:
+        return {'fr': self.fr, 'to': self.to, 'type': self.type, 'id': self.id,
+                'data': self.data, 'params': self.params, 'from': self.fr}
+
+        
+
+class NetworkHub(Thread):
+    def __init__(self) -> None:
+        Thread.__init__(self, daemon=True)
         self.app = web.Application()
         self.app.add_routes([web.post('/replica', self.handle_replica),
                              web.post('/message', self.handle_message),
                              web.post('/event', self.handle_event)])
         self.runner = web.AppRunner(self.app)
-        self.site = None
-        self.loop = None
+        self.loop = asyncio.new_event_loop()
+        self.ready = Event()
 
         self.lock = Lock()
-        self.replicas = {}
-        self.mailboxes = {}
-        self.event_trace = []
+        self.sites = {}
+        self.ports = {}
+        self.networks = {}
 
     def run(self) -> None:
-        # print('Starting network')
-        self.run_server()
-
-    def ask_exit(self):
-        for task in asyncio.Task.all_tasks():
-            task.cancel()
-
-    def run_server(self) -> None:
-        self.loop = asyncio.new_event_loop()
         asyncio.set_event_loop(self.loop)
         self.loop.run_until_complete(self.runner.setup())
-        self.site = web.TCPSite(self.runner, 'localhost', self.port)
-        self.loop.run_until_complete(self.site.start())
+        self.ready.set()
         self.loop.run_forever()
-        # asyncio.run(self.runner.cleanup())
+        self.loop.run_until_complete(self.runner.cleanup())
+        self.loop.close()
+
+    def register(self, cluster_id, port, network) -> None:
+        self.ready.wait()
+        if port not in self.sites:
+            asyncio.run_coroutine_threadsafe(self.open_site(port), self.loop).result()
+        with self.lock:
+            self.ports[port] = cluster_id
+            self.networks[cluster_id] = network
+
+    def deregister(self, cluster_id) -> None:
+        with self.lock:
+            self.networks.pop(cluster_id, None)
+            for port in [p for p, c in self.ports.items() if c == cluster_id]:
+                self.ports.pop(port)
+
+    def close(self) -> None:
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        self.join()
+
+    async def open_site(self, port) -> None:
+        site = web.TCPSite(self.runner, 'localhost', port)
+        await site.start()
+        self.sites[port] = site
+
+    def get_network(self, request) -> Network:
+        if request.transport is None:
+            return None
+        port = request.transport.get_extra_info('sockname')[1]
+        with self.lock:
+            cluster_id = self.ports.get(port)
+            network = self.networks.get(cluster_id)
+        # Nodes of an earlier run on the same port, killed but not yet gone
+        run_id = request.headers.get('Run-Id')
+        if network is not None and run_id is not None and run_id != str(network.run_id):
+            network.rejected_requests += 1
+            return None
+        return network
+
+    async def handle_replica(self, request) -> web.Response:
+        network = self.get_network(request)
+        if network is None:
+            return web.Response(body=json.dumps({'message': 'Ok'}))
+        return await network.handle_replica(request)
+
+    async def handle_message(self, request) -> web.Response:
+        network = self.get_network(request)
+        if network is None:
+            return web.Response(body=json.dumps({'message': 'Ok'}))
+        return await network.handle_message(request)
+
+    async def handle_event(self, request) -> web.Response:
+        network = self.get_network(request)
+        if network is None:
+            return web.Response(body=json.dumps({'message': 'Ok'}))
+        return await network.handle_event(request)
+
+
+_hub = None
+_hub_lock = Lock()
+
+def get_network_hub() -> NetworkHub:
+    global _hub
+    with _hub_lock:
+        if _hub is None or not _hub.is_alive():
+            _hub = NetworkHub()
+            _hub.start()
+        return _hub
+
+
+class MailboxPolicy():
+    ACCEPTED = 'accepted'
+    COALESCED = 'coalesced'
+    DROPPED = 'dropped'
+
+    def __init__(self, capacity=0, coalesce_heartbeats=False) -> None:
+        self.capacity = capacity
+        self.coalesce_heartbeats = coalesce_heartbeats
+        self.coalesced = 0
+        self.dropped = 0
+
+    def offer(self, mailbox, msg) -> str:
+        if self.coalesce_heartbeats and len(mailbox) > 0 and self.is_same_heartbeat(mailbox[-1], msg):
+            # The sender still waits for a reply, the queued request's reply is copied to it
+            request_id = msg.get_request_id()
+            if request_id != '':
+                mailbox[-1].coalesced.append(request_id)
+            self.coalesced += 1
+            return MailboxPolicy.COALESCED
+        if self.capacity > 0 and len(mailbox) >= self.capacity:
+            self.dropped += 1
+            return MailboxPolicy.DROPPED
+        mailbox.append(msg)
+        return MailboxPolicy.ACCEPTED
+
+    def is_heartbeat(self, msg) -> bool:
+        return msg.type == 'append_entries_request' and msg.params is not None and len(msg.params['entries']) == 0
+
+    def is_same_heartbeat(self, first, second) -> bool:
+        if not self.is_heartbeat(first) or not self.is_heartbeat(second):
+            return False
+        for key in ['term', 'prev_log_idx', 'prev_log_term', 'leader_commit']:
+            if first.params[key] != second.params[key]:
+                return False
+        return True
+
+    def get_stats(self) -> dict:
+        return {'coalesced': self.coalesced, 'dropped': self.dropped}
+
+
+class Network():
+    def __init__(self, port, cluster_id, mailbox_policy=None, run_id=None) -> None:
+        # print('Initializing network')
+        self.port = port
+        self.cluster_id = cluster_id
+        # Run id the nodes send with their requests, see NetworkHub.get_network
+        self.run_id = run_id if run_id is not None else cluster_id
+        self.rejected_requests = 0
+        self.event_mapper = EventMapper()
+        self.mailbox_policy = mailbox_policy if mailbox_policy is not None else MailboxPolicy()
+        self.hub = get_network_hub()
+
+        self.lock = Lock()
+        self.replicas = {}
+        self.mailboxes = {}
+        # partition_id -> node set cut off from the rest, partitions overlap until healed
+        self.partitions = {}
+        self.event_trace = EventTrace()
+        # Request id of a delivered request -> request ids coalesced into it
+        self.coalesced_requests = {}
+
+    def start(self) -> None:
+        # print('Starting network')
+        self.hub.register(self.cluster_id, self.port, self)
     
     def stop(self) -> None:
         # print('Stopping network')
-        asyncio.run(self.site.stop())
-        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.hub.deregister(self.cluster_id)
         # print('Network closed')
 
     async def handle_replica(self, request) -> web.Response:
@@ -97,19 +244,32 @@ class Network(Thread):
         if msg == None:
             return
         else:
+            offered = None
+            partitioned = False
             try:
                 self.lock.acquire()
-                key = f'{str(msg.fr)}_{str(msg.to)}'
-                if key not in self.mailboxes:
-                    self.mailboxes[key] = []
-                self.mailboxes[key].append(msg)
+                if not msg.is_request() and len(self.coalesced_requests) > 0:
+                    msg.coalesced = self.coalesced_requests.pop(msg.get_request_id(), [])
+                partitioned = self.is_partitioned(msg.fr, msg.to)
+                if not partitioned:
+                    key = f'{str(msg.fr)}_{str(msg.to)}'
+                    if key not in self.mailboxes:
+                        self.mailboxes[key] = deque()
+                    offered = self.mailbox_policy.offer(self.mailboxes[key], msg)
             except Exception as e:
                 traceback.print_exc()
             finally:
                 self.lock.release()
+            if offered == MailboxPolicy.DROPPED or partitioned:
+                # Fails the call at once instead of after the interceptor's reply timeout
+                await asyncio.get_running_loop().run_in_executor(None, self.fail_requests, msg)
+            if offered != MailboxPolicy.ACCEPTED and not partitioned:
+                return web.Response(body=json.dumps({'message': 'Ok'}))
             params = self.event_mapper.get_message_event_params(msg)
             params['node'] = params['from']
             self.add_event({'name': 'SendMessage', 'params': params})
+            if partitioned:
+                self.add_message_event('DropMessage', msg)
 
         return web.Response(body=json.dumps({'message': 'Ok'}))
 
@@ -136,30 +296,42 @@ class Network(Thread):
         key = f'{str(fr)}_{str(to)}'
         if key not in self.mailboxes.keys():
             return 0
-        for i, m in enumerate(self.mailboxes[key]):
-            try:
-                self.lock.acquire()
-                if i < max_msgs and len(self.mailboxes[key]) > 0:
-                    messages.append(self.mailboxes[key].pop(0))
-            except Exception as e:
-                traceback.print_exc()
-            finally:
-                self.lock.release()
+        partitioned = False
+        try:
+            self.lock.acquire()
+            mailbox = self.mailboxes[key]
+            while len(messages) < max_msgs and len(mailbox) > 0:
+                messages.append(mailbox.popleft())
+            partitioned = self.is_partitioned(fr, to)
+        except Exception as e:
+            traceback.print_exc()
+        finally:
+            self.lock.release()
+
+        if partitioned:
+            # Messages queued before the partition are lost once they try to cross it
+            for m in messages:
+                self.add_message_event('DropMessage', m)
+                self.fail_requests(m)
+            return 0
         
         addr = self.replicas[str(to)]
         for m in messages:
-            dict_ = m.__dict__
-            dict_['from'] = m.fr
-
             params = self.event_mapper.get_message_event_params(m)
             params['node'] = params['to']
             self.add_event({'name': 'DeliverMessage', 'params': params})
             if not to_crashed:
-                try:
-                    requests.post(f'http://{addr}', json=json.dumps(dict_))
-                except Exception as e:
-                    # traceback.print_exc()
-                    pass
+                if m.is_request() and len(m.coalesced) > 0:
+                    with self.lock:
+                        self.coalesced_requests[m.get_request_id()] = m.coalesced
+                # A reply goes out once more for every request coalesced into its request
+                posts = [m] + ([m.with_request_id(r) for r in m.coalesced] if not m.is_request() else [])
+                for p in posts:
+                    try:
+                        requests.post(f'http://{addr}', json=json.dumps(p.to_dict()))
+                    except Exception as e:
+                        # traceback.print_exc()
+                        pass
             else:
                 pass
                 # print('Network schedule_node: To crashed')
@@ -171,8 +343,9 @@ class Network(Thread):
         try:
             self.lock.acquire()
             msg = Message(0, 1, 'shutdown', base64.b64encode('shutting_down'))
+            dict_ = {'fr': msg.fr, 'to': msg.to, 'type': msg.type, 'id': msg.id, 'data': msg.data, 'params': msg.params}
             for addr in self.replicas.values():
-                requests.post(f'http://{addr}', json=json.dumps(msg.__dict__)) # /message may be required
+                requests.post(f'http://{addr}', json=json.dumps(dict_)) # /message may be required
         except Exception as e:
             traceback.print_exc()
         finally:
@@ -180,6 +353,22 @@ class Network(Thread):
                 self.lock.release()
     
 
+    def fail_requests(self, msg) -> None:
+        # Tells the node waiting on the dropped message that its call failed
+        waiting = msg.fr if msg.is_request() else msg.to
+        addr = self.replicas.get(str(waiting))
+        if addr is None:
+            return
+        for request_id in [msg.get_request_id()] + msg.coalesced:
+            if request_id == '':
+                continue
+            data = base64.b64encode(json.dumps({'data': '', 'request_id': request_id}).encode()).decode()
+            dropped = Message(msg.to, waiting, 'dropped', data)
+            try:
+                requests.post(f'http://{addr}', json=json.dumps(dropped.to_dict()))
+            except Exception as e:
+                pass
+
     def add_event(self, e) -> None:
         try:
             self.lock.acquire()
@@ -190,12 +379,76 @@ class Network(Thread):
     def get_num_replicas(self) -> int:
         return len(self.replicas)
     
-    def get_event_trace(self) -> list:
+    def get_event_trace(self) -> EventTrace:
         return self.event_trace
     
     def get_leader_id(self) -> int:
         return self.event_mapper.get_leader_id()
 
+    def add_message_event(self, name, msg) -> None:
+        params = self.event_mapper.get_message_event_params(msg)
+        params['node'] = params['to']
+        self.add_event({'name': name, 'params': params})
+
+    def is_partitioned(self, fr, to) -> bool:
+        for nodes in self.partitions.values():
+            if (str(fr) in nodes) != (str(to) in nodes):
+                return True
+        return False
+
+    def drop_messages(self, fr, to, count) -> int:
+        messages = []
+        key = f'{str(fr)}_{str(to)}'
+        with self.lock:
+            mailbox = self.mailboxes.get(key, deque())
+            while len(messages) < count and len(mailbox) > 0:
+                messages.append(mailbox.popleft())
+        for m in messages:
+            self.add_message_event('DropMessage', m)
+            self.fail_requests(m)
+        return len(messages)
+
+    def duplicate_message(self, fr, to) -> bool:
+        key = f'{str(fr)}_{str(to)}'
+        with self.lock:
+            mailbox = self.mailboxes.get(key, deque())
+            if len(mailbox) == 0:
+                return False
+            msg = copy.copy(mailbox[0])
+            msg.coalesced = list(msg.coalesced)
+            mailbox.insert(1, msg)
+        self.add_message_event('DuplicateMessage', msg)
+        return True
+
+    def reorder_messages(self, fr, to, count, seed) -> int:
+        key = f'{str(fr)}_{str(to)}'
+        with self.lock:
+            mailbox = self.mailboxes.get(key, deque())
+            count = min(count, len(mailbox))
+            prefix = [mailbox.popleft() for _ in range(count)]
+            random.Random(seed).shuffle(prefix)
+            mailbox.extendleft(reversed(prefix))
+        return count
+
+    def partition(self, nodes, partition_id=0) -> None:
+        with self.lock:
+            self.partitions[partition_id] = set(str(n) for n in nodes)
+        self.add_event({'name': 'Partition', 'params': {'nodes': sorted(nodes), 'node': 0}})
+
+    def heal(self, partition_id=None) -> None:
+        # Without an id every partition heals. The event names the healed
+        # side, ids are labels only.
+        with self.lock:
+            if partition_id is None:
+                healed = set().union(*self.partitions.values())
+                self.partitions.clear()
+            else:
+                healed = self.partitions.pop(partition_id, set())
+        self.add_event({'name': 'Heal', 'params': {'nodes': sorted(int(n) for n in healed), 'node': 0}})
+
+    def get_mailbox_stats(self) -> dict:
+        return dict(self.mailbox_policy.get_stats(), rejected=self.rejected_requests)
+
 
 class EventMapper:
     def __init__(self) -> None:
@@ -206,7 +459,15 @@ class EventMapper:
     def get_message_event_params(self, msg) -> dict:
         if msg is None:
             return {}
-        
+
+        # Params are mapped once per message (SendMessage) and reused for its
+        # DeliverMessage and its fault events. Message ids are not a key across
+        # messages, a restarted node draws the same ids again.
+        if msg.event_params is None:
+            msg.event_params = self.map_message_event_params(msg)
+        return dict(msg.event_params)
+
+    def map_message_event_params(self, msg) -> dict:
         params = {
             'from': int(msg.fr),
             'to': int(msg.to),
@@ -217,7 +478,7 @@ class EventMapper:
         if msg.type == 'append_entries_request':
             params['type'] = 'MsgApp'
             params['log_term'] = msg.params['prev_log_term']
-            params['entries'] = [{'Term': msg.params['entries'][key]['term'], 'Data': str(self.get_request_number(msg.params['entries'][key]['data']))} for key in msg.params['entries'].keys() if msg.params['entries'][key]['data'] != '']
+            params['entries'] = [{'Term': entry['term'], 'Data': str(self.get_request_number(entry['data']))} for entry in msg.params['entries'].values() if entry['data'] != '']
             params['index'] = int(msg.params['prev_log_idx'])
             params['commit'] = int(msg.params['leader_commit'])
             params['reject'] = False
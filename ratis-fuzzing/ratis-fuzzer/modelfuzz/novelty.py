@@ -0,0 +1,44 @@
+from array import array
+from modelfuzz.tlc import parse_tlc_state, split_state_parts
+
+class NoveltyScorer():
+    # Tracks how many known states carry each variable value (e.g. log = [..],
+    # commitIndex = [1, 0, 0]) and scores new states by their rarest value
+    def __init__(self) -> None:
+        # (variable, value) -> part id, and state count per part id
+        self.part_ids = {}
+        self.counts = array('I')
+        self.variables = {}
+        self.states = 0
+
+    def get_parts(self, repr) -> list[int]:
+        parts = []
+        for part in split_state_parts(parse_tlc_state(repr)):
+            if '=' not in part:
+                continue
+            variable, value = map(str.strip, part.split('=', 1))
+            part_id = self.part_ids.get((variable, value))
+            if part_id is None:
+                part_id = self.part_ids[(variable, value)] = len(self.counts)
+                self.counts.append(0)
+                self.variables[variable] = self.variables.get(variable, 0) + 1
+            parts.append(part_id)
+        return parts
+
+    def score(self, tla_state) -> float:
+        # Counts the state in, then returns 1 / (count of its rarest value): 1.0
+        # for a state with a value never seen before, close to 0 for a new
+        # combination of values that are all common
+        parts = self.get_parts(tla_state['state'])
+        self.states += 1
+        if len(parts) == 0:
+            return 1.0
+        rarest = None
+        for part_id in parts:
+            self.counts[part_id] += 1
+            if rarest is None or self.counts[part_id] < rarest:
+                rarest = self.counts[part_id]
+        return 1.0 / rarest
+
+    def get_stats(self) -> dict:
+        return {'states': self.states, 'values': dict(self.variables)}
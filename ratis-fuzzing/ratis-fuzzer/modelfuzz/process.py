@@ -0,0 +1,88 @@
+import os
+import time
+import signal
+import asyncio
+import threading
+
+from itertools import count
+
+def kill_group(pgid) -> None:
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+class ProcessRegistry():
+    # Process groups started by this process. Every JVM is exec'd without a
+    # shell and leads its own session, so killing its group reaches the JVM
+    # and anything it forked. Groups belong to an owner (a cluster) and a
+    # reaper thread kills those still alive after their owner released them.
+    #
+    # A group is only signalled while its leader has not been waited on: once
+    # it has, its pid may be reused by an unrelated process, so the group is
+    # dropped instead.
+    def __init__(self, interval=5) -> None:
+        self.interval = interval
+        self.lock = threading.Lock()
+        # pgid -> (owner, leader process)
+        self.groups = {}
+        # owner -> when it was released, kept a while for processes spawned late
+        self.released = {}
+        self.owners = count()
+        self.reaper = None
+        self.stopped = threading.Event()
+
+    def new_owner(self) -> int:
+        return next(self.owners)
+
+    async def spawn(self, args, owner, stdout=None, stderr=None) -> asyncio.subprocess.Process:
+        process = await asyncio.create_subprocess_exec(*args, stdout=stdout, stderr=stderr, start_new_session=True)
+        with self.lock:
+            self.groups[process.pid] = (owner, process)
+            if self.reaper is None:
+                self.reaper = threading.Thread(target=self.reap, daemon=True)
+                self.reaper.start()
+            released = owner in self.released
+        if released:
+            # Started after its cluster was stopped
+            self.kill(process)
+        return process
+
+    def kill(self, process) -> None:
+        if process is not None and process.returncode is None:
+            kill_group(process.pid)
+
+    def release(self, owner) -> None:
+        # Kills every group the owner started, the reaper retries stragglers
+        with self.lock:
+            self.released[owner] = time.time()
+            processes = [process for o, process in self.groups.values() if o == owner]
+        for process in processes:
+            self.kill(process)
+
+    def reap(self) -> None:
+        while not self.stopped.wait(self.interval):
+            with self.lock:
+                for pgid, (owner, process) in list(self.groups.items()):
+                    if process.returncode is not None:
+                        del self.groups[pgid]
+                        continue
+                    if owner in self.released:
+                        kill_group(pgid)
+                # Owners whose groups are all gone, released long enough ago
+                # that nothing of theirs is still being spawned
+                owners = set(owner for owner, _ in self.groups.values())
+                expired = time.time() - 2 * self.interval
+                for owner in [o for o, released in self.released.items() if released < expired and o not in owners]:
+                    del self.released[owner]
+
+    def close(self) -> None:
+        # Kills everything this process started
+        self.stopped.set()
+        with self.lock:
+            groups = list(self.groups.values())
+            self.groups.clear()
+        for _, process in groups:
+            self.kill(process)
+
+processes = ProcessRegistry()
@@ -0,0 +1,274 @@
+from hashlib import blake2b
+from itertools import chain, count
+
+FAULT_TYPES = ['Drop', 'Duplicate', 'Reorder', 'Partition']
+# Steps found by id, and the field holding it
+ID_FIELDS = {'Crash': 'crash_id', 'Restart': 'crash_id', 'Partition': 'partition_id', 'Heal': 'partition_id'}
+CHUNK_BITS = 5
+CHUNK_SIZE = 1 << CHUNK_BITS
+
+class Counts():
+    # Fenwick tree over per-chunk counts: updates, prefix sums and finding the
+    # chunk of the k-th counted element are O(log chunks)
+    def __init__(self, counts=()) -> None:
+        self.tree = [0] + list(counts)
+        for i in range(1, len(self.tree)):
+            j = i + (i & -i)
+            if j < len(self.tree):
+                self.tree[j] += self.tree[i]
+        # Highest power of two below the length of the tree, where find() starts
+        self.top = 1 << (len(self.tree) - 1).bit_length() >> 1
+
+    def copy(self) -> 'Counts':
+        counts = Counts.__new__(Counts)
+        counts.tree = list(self.tree)
+        counts.top = self.top
+        return counts
+
+    def add(self, c, delta) -> None:
+        tree, n = self.tree, len(self.tree)
+        c += 1
+        while c < n:
+            tree[c] += delta
+            c += c & -c
+
+    def prefix(self, c) -> int:
+        # Sum of the counts of the chunks before c
+        tree, total = self.tree, 0
+        while c > 0:
+            total += tree[c]
+            c -= c & -c
+        return total
+
+    def total(self) -> int:
+        return self.prefix(len(self.tree) - 1)
+
+    def find(self, k) -> tuple[int, int]:
+        # (chunk, r): the k-th counted element is the r-th one of chunk
+        tree, n = self.tree, len(self.tree)
+        c, step = 0, self.top
+        while step:
+            i = c + step
+            if i < n and tree[i] <= k:
+                c = i
+                k -= tree[i]
+            step >>= 1
+        return (c, k)
+
+class Steps():
+    # Persistent list of steps kept in chunks, with per-type indexes. copy()
+    # shares every chunk with the original and a chunk is only copied on its
+    # first write, so a mutant costs the chunks it changed. Step dicts are never
+    # written to, changed steps are replaced with new dicts.
+    #
+    # The indexes count lengths, 'Schedule' steps and fault steps per chunk and
+    # map crash and partition ids to the chunk holding their steps, so finding
+    # the k-th step of a type, inserting and popping are O(log n) and no
+    # position has to be shifted. They travel with the steps and their copies.
+    def __init__(self, steps=()) -> None:
+        # Which mutator produced these steps, for its feedback (see Mutator.update)
+        self.origin = None
+        self.replace(steps)
+
+    def replace(self, steps) -> None:
+        # Takes new steps and indexes them from scratch
+        steps = list(steps)
+        self.chunks = [steps[i:i+CHUNK_SIZE] for i in range(0, len(steps), CHUNK_SIZE)]
+        # Whether each chunk belongs to this Steps alone and may be written to
+        self.owned = [True] * len(self.chunks)
+        self.length = len(steps)
+        self.sizes = Counts(len(chunk) for chunk in self.chunks)
+        self.schedule_counts = Counts(sum(1 for s in chunk if s['type'] == 'Schedule') for chunk in self.chunks)
+        self.fault_counts = Counts(sum(1 for s in chunk if s['type'] in FAULT_TYPES) for chunk in self.chunks)
+        # type -> id -> chunk of the step
+        self.ids = {type: {} for type in ID_FIELDS}
+        for c, chunk in enumerate(self.chunks):
+            for step in chunk:
+                if step['type'] in ID_FIELDS:
+                    self.ids[step['type']][step[ID_FIELDS[step['type']]]] = c
+
+    def copy(self) -> 'Steps':
+        steps = Steps.__new__(Steps)
+        steps.origin = None
+        steps.chunks = list(self.chunks)
+        steps.owned = [False] * len(self.chunks)
+        steps.length = self.length
+        steps.sizes = self.sizes.copy()
+        steps.schedule_counts = self.schedule_counts.copy()
+        steps.fault_counts = self.fault_counts.copy()
+        steps.ids = {type: dict(ids) for type, ids in self.ids.items()}
+        self.owned = [False] * len(self.chunks)
+        return steps
+
+    def locate(self, i) -> tuple[int, int]:
+        if i < 0:
+            i += self.length
+        if i < 0 or i >= self.length:
+            raise IndexError('step index out of range')
+        return self.sizes.find(i)
+
+    def own(self, c) -> list[dict]:
+        if not self.owned[c]:
+            self.chunks[c] = list(self.chunks[c])
+            self.owned[c] = True
+        return self.chunks[c]
+
+    def index(self, c, step, delta) -> None:
+        # Counts the step in chunk c (delta 1) or takes it out again (delta -1)
+        type = step['type']
+        if type == 'Schedule':
+            self.schedule_counts.add(c, delta)
+        elif type in FAULT_TYPES:
+            self.fault_counts.add(c, delta)
+        if type in ID_FIELDS:
+            if delta > 0:
+                self.ids[type][step[ID_FIELDS[type]]] = c
+            else:
+                self.ids[type].pop(step[ID_FIELDS[type]], None)
+
+    def __getitem__(self, i) -> dict:
+        c, k = self.locate(i)
+        return self.chunks[c][k]
+
+    def __setitem__(self, i, step) -> None:
+        c, k = self.locate(i)
+        self.index(c, self.chunks[c][k], -1)
+        self.own(c)[k] = step
+        self.index(c, step, 1)
+
+    def swap(self, i, j) -> None:
+        if i == j:
+            return
+        (ci, ki), (cj, kj) = self.locate(i), self.locate(j)
+        first, second = self.chunks[ci][ki], self.chunks[cj][kj]
+        # Two 'Schedule' steps trading places leave every index as it was
+        if first['type'] != 'Schedule' or second['type'] != 'Schedule':
+            self.index(ci, first, -1)
+            self.index(cj, second, -1)
+            self.index(ci, second, 1)
+            self.index(cj, first, 1)
+        self.own(ci)[ki] = second
+        self.own(cj)[kj] = first
+
+    def update(self, pos, **fields) -> dict:
+        # Replaces the step with a changed copy, the original may be shared
+        step = dict(self[pos], **fields)
+        self[pos] = step
+        return step
+
+    def insert(self, i, step) -> None:
+        # Inserts before position i, at the end when i is the length
+        if len(self.chunks) == 0:
+            self.replace([step])
+            return
+        if i >= self.length:
+            c, k = len(self.chunks) - 1, len(self.chunks[-1])
+        else:
+            c, k = self.locate(i)
+        self.own(c).insert(k, step)
+        self.length += 1
+        self.sizes.add(c, 1)
+        self.index(c, step, 1)
+        if len(self.chunks[c]) >= 2 * CHUNK_SIZE:
+            # Rechunked once a chunk doubled, at least CHUNK_SIZE inserts apart
+            origin = self.origin
+            self.replace(self)
+            self.origin = origin
+
+    def pop(self, i) -> dict:
+        # Emptied chunks stay, so the chunks of the indexed ids never move
+        c, k = self.locate(i)
+        step = self.own(c).pop(k)
+        self.length -= 1
+        self.sizes.add(c, -1)
+        self.index(c, step, -1)
+        return step
+
+    def nth(self, counts, k, types) -> int:
+        c, r = counts.find(k)
+        for i, step in enumerate(self.chunks[c]):
+            if step['type'] in types:
+                if r == 0:
+                    return self.sizes.prefix(c) + i
+                r -= 1
+        raise IndexError('step index out of range')
+
+    def schedule_count(self) -> int:
+        return self.schedule_counts.total()
+
+    def schedule_position(self, k) -> int:
+        # Position of the k-th 'Schedule' step
+        return self.nth(self.schedule_counts, k, ('Schedule',))
+
+    def schedule_rank(self, pos) -> int:
+        # Number of 'Schedule' steps before position pos
+        if pos >= self.length:
+            return self.schedule_count()
+        c, k = self.locate(pos)
+        return self.schedule_counts.prefix(c) + sum(1 for s in self.chunks[c][:k] if s['type'] == 'Schedule')
+
+    def fault_count(self) -> int:
+        return self.fault_counts.total()
+
+    def fault_position(self, k) -> int:
+        # Position of the k-th fault step
+        return self.nth(self.fault_counts, k, FAULT_TYPES)
+
+    def position(self, type, id) -> int:
+        # Position of the step of the type with the crash or partition id, None if there is none
+        c = self.ids[type].get(id)
+        if c is None:
+            return None
+        for i, step in enumerate(self.chunks[c]):
+            if step['type'] == type and step[ID_FIELDS[type]] == id:
+                return self.sizes.prefix(c) + i
+        return None
+
+    def __iter__(self):
+        return chain.from_iterable(self.chunks)
+
+    def __len__(self) -> int:
+        return self.length
+
+def schedule_key(steps) -> int:
+    # 128-bit hash of what running the steps does. Ids that only pair steps up
+    # are left out, and so are steps the cluster skips: crashes of crashed
+    # nodes, restarts of running ones and scheduling of crashed nodes.
+    # Partitions are numbered in the order they open and a heal names the
+    # number of the partition it closes, whatever their partition ids.
+    parts = []
+    crashed = set()
+    # partition id -> number of the open partition with that id
+    partitions, numbers = {}, count()
+    for step in steps:
+        type = step['type']
+        if type == 'Schedule':
+            if step['node'] in crashed:
+                continue
+            parts.append(f"S{step['node']},{step['to']},{step['max_msgs']}")
+        elif type == 'Crash':
+            if step['node'] in crashed:
+                continue
+            crashed.add(step['node'])
+            parts.append(f"C{step['node']}")
+        elif type == 'Restart':
+            if step['node'] not in crashed:
+                continue
+            crashed.remove(step['node'])
+            parts.append(f"R{step['node']}")
+        elif type == 'ClientRequest':
+            parts.append('Q')
+        elif type == 'Partition':
+            # A partition with the id of an open one replaces it
+            number = next(numbers)
+            partitions[step.get('partition_id', 0)] = number
+            parts.append(f"P{number},{step['nodes']}")
+        elif type == 'Heal':
+            if step.get('partition_id') is None:
+                partitions.clear()
+                parts.append('H*')
+            else:
+                parts.append(f"H{partitions.pop(step['partition_id'], '')}")
+        else:
+            parts.append(f"{type}{step.get('node')},{step.get('to')},{step.get('count')},{step.get('seed')}")
+    return int.from_bytes(blake2b('\n'.join(parts).encode('utf-8'), digest_size=16).digest(), 'little')
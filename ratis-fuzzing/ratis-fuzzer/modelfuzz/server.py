@@ -2,6 +2,7 @@ import time
 import asyncio
 import traceback
 from threading import Thread
+from modelfuzz.process import processes
 
 class RatisServer(Thread):
     def __init__(self, config) -> None:
@@ -15,42 +16,48 @@ class RatisServer(Thread):
         self.restart_process = False
         self.wait = True
         self.error_flg = False
+        # A ClusterHost running this node in a shared JVM, None for a JVM of its own
+        self.host = self.config.get('host')
 
         self.stdout = self.config['stdout']
         self.stderr = self.config['stderr']
 
         self.log4j_config = '-Dlog4j.configuration=file:../ratis-examples/src/main/resources/log4j.properties' 
+        # enable assertions -ea
+        # Built once, restarts only flip the last argument
+        self.args = ['java'] + self.config['jvm_args'] + [self.log4j_config, '-cp', self.config['jar_path'],
+                     'org.apache.ratis.examples.counter.server.CounterServer',
+                     str(self.config['run_id']),
+                     str(self.config['fuzzer_port']),
+                     str(self.config['listener_port']),
+                     str(self.config['peer_index']),
+                     self.config['peer_addresses'],
+                     self.config['group_id']]
         self.cmd = self.get_cmd()
 
-    def get_cmd(self) -> str:
+    def get_cmd(self) -> list[str]:
         if not self.wait:
             return
         r = 1 if self.restart_flg else 0
-        # enable assertions -ea
-        cmd = 'java {} -cp {} org.apache.ratis.examples.counter.server.CounterServer {} {} {} {} {} {} {}'.format(
-            self.log4j_config,
-            self.config['jar_path'],
-            self.config['run_id'],
-            self.config['fuzzer_port'],
-            self.config['listener_port'],
-            self.config['peer_index'],
-            self.config['peer_addresses'],
-            self.config['group_id'],
-            r
-        )
-        return cmd
+        return self.args + [str(r)]
     
     def run(self) -> None:
         # print('Running server')
         if not self.wait:
             return
-        asyncio.run(self.run_server())
+        self.launch()
 
         while self.wait:
             time.sleep(0.1)
             if self.restart_process:
                 self.restart_process = False
-                asyncio.run(self.run_server())
+                self.launch()
+
+    def launch(self) -> None:
+        if self.host is None:
+            asyncio.run(self.run_server())
+        else:
+            self.run_hosted()
 
     
     async def run_server(self) -> None:
@@ -63,7 +70,7 @@ class RatisServer(Thread):
         else:
             self.cmd
 
-        self.process = await asyncio.create_subprocess_shell(self.cmd, stdout=self.stdout, stderr=self.stderr)
+        self.process = await processes.spawn(self.cmd, self.config['owner'], stdout=self.stdout, stderr=self.stderr)
         try:
             await asyncio.wait_for(self.process.wait(), self.config['timeout']+10) # CancellationException, TimeoutException
             self.returncode = self.process.returncode
@@ -82,22 +89,40 @@ class RatisServer(Thread):
         finally: 
             self.close()
         # print(f'Ratis server subprocess: {self.process}')
+
+    def run_hosted(self) -> None:
+        restart = self.restart_flg
+        self.restart_flg = False
+        self.returncode = self.host.run_node(self.config['peer_index'], restart, self.stderr, self.config['timeout']+10)
+        if self.returncode is None:
+            print(f'Timeout on: {self.config["run_id"]}-{self.config["peer_index"]}')
+            self.returncode = -1
+            self.error_flg = True
+        elif self.returncode != 0 and self.returncode != -9:
+            self.error_flg = True
+        if not self.restart_flg:
+            self.close()
             
     def kill(self) -> None:
         if not self.wait:
             return
-        try:
-            self.process.kill()
-        except ProcessLookupError as e:
-            pass
+        if self.host is None:
+            processes.kill(self.process)
+        else:
+            self.host.crash_node(self.config['peer_index'])
         if not self.error_flg:
             self.returncode=0
     
     def crash(self) -> None :
         if not self.wait:
             return
-        self.kill()
-        self.restart_flg = True
+        if self.host is None:
+            self.kill()
+            self.restart_flg = True
+        else:
+            # Set first, a hosted node seeing it when its server exits waits for its restart
+            self.restart_flg = True
+            self.kill()
     
     def restart(self) -> None:
         if not self.wait:
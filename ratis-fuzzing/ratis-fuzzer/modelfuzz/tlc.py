@@ -0,0 +1,366 @@
+import os
+import gzip
+import json
+import time
+import socket
+import asyncio
+import aiohttp
+import requests
+import subprocess
+
+from threading import Lock
+from requests.adapters import HTTPAdapter
+from modelfuzz.trace import EventTrace
+
+class TLCBackend():
+    def __init__(self, endpoint, process=None) -> None:
+        self.endpoint = endpoint
+        self.process = process
+        self.outstanding = 0
+        self.healthy = True
+        self.next_check = 0
+        self.failures = 0
+        self.requests = 0
+        self.restarts = 0
+
+class TLCBackendPool():
+    # Routes each request to the healthy backend with the least outstanding
+    # work. Failed backends are skipped until a health check finds them back.
+    def __init__(self, endpoints, check_interval=5, commands=None, cwd=None, max_restarts=3) -> None:
+        self.backends = [TLCBackend(endpoint) for endpoint in endpoints]
+        self.check_interval = check_interval
+        # Only set for backends launched by the pool, used to restart them
+        self.commands = commands
+        self.cwd = cwd
+        self.max_restarts = max_restarts
+        self.lock = Lock()
+
+    @staticmethod
+    def launch(params, count) -> 'TLCBackendPool':
+        # count TLC servers on consecutive ports from the base TLC port
+        spec = os.path.splitext(params.tlc_spec)[0]
+        ports = [params.base_tlc_port + i for i in range(count)]
+        commands = [['java', '-jar', params.tlc_jar, '-controlled', f'{spec}.tla', '-config', f'{spec}.cfg',
+                     '-mapperparams', params.tlc_mapper_params, '-serverport', str(port)] for port in ports]
+        pool = TLCBackendPool([f'127.0.0.1:{port}' for port in ports], commands=commands, cwd=params.tlc_dir)
+        for i in range(count):
+            pool.start_backend(i)
+        pool.wait_until_ready(params.tlc_startup_timeout)
+        return pool
+
+    def start_backend(self, i) -> None:
+        self.backends[i].process = subprocess.Popen(self.commands[i], cwd=self.cwd,
+                                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def wait_until_ready(self, timeout) -> None:
+        deadline = time.time() + timeout
+        pending = list(self.backends)
+        while len(pending) > 0 and time.time() < deadline:
+            pending = [b for b in pending if not self.probe(b)]
+            if len(pending) > 0:
+                time.sleep(0.5)
+        for backend in pending:
+            print(f'TLC backend {backend.endpoint} did not start within {timeout}s')
+            backend.healthy = False
+            backend.next_check = time.time() + self.check_interval
+
+    def probe(self, backend) -> bool:
+        host, port = backend.endpoint.rsplit(':', 1)
+        try:
+            with socket.create_connection((host, int(port)), timeout=1):
+                return True
+        except OSError:
+            return False
+
+    def check(self, backend) -> None:
+        # Called with the lock held, only once the backend's retry time has passed
+        if backend.process is not None and backend.process.poll() is not None:
+            i = self.backends.index(backend)
+            if backend.restarts < self.max_restarts:
+                print(f'TLC backend {backend.endpoint} exited with {backend.process.returncode}, restarting')
+                backend.restarts += 1
+                self.start_backend(i)
+            backend.next_check = time.time() + self.check_interval
+            return
+        if self.probe(backend):
+            backend.healthy = True
+        else:
+            backend.next_check = time.time() + self.check_interval
+
+    def acquire(self) -> TLCBackend:
+        # Returns None when every backend is down
+        with self.lock:
+            now = time.time()
+            for backend in self.backends:
+                if not backend.healthy and backend.next_check <= now:
+                    self.check(backend)
+            healthy = [b for b in self.backends if b.healthy]
+            if len(healthy) == 0:
+                return None
+            backend = min(healthy, key=lambda b: b.outstanding)
+            backend.outstanding += 1
+            backend.requests += 1
+            return backend
+
+    def release(self, backend, failed=False) -> None:
+        with self.lock:
+            backend.outstanding -= 1
+            if failed:
+                backend.failures += 1
+                if backend.healthy:
+                    print(f'TLC backend {backend.endpoint} failed, routing around it')
+                backend.healthy = False
+                backend.next_check = time.time() + self.check_interval
+
+    def healthy_count(self) -> int:
+        with self.lock:
+            return len([b for b in self.backends if b.healthy])
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {b.endpoint: {'requests': b.requests, 'failures': b.failures, 'restarts': b.restarts, 'healthy': b.healthy}
+                    for b in self.backends}
+
+    def close(self) -> None:
+        for backend in self.backends:
+            if backend.process is not None and backend.process.poll() is None:
+                backend.process.terminate()
+                try:
+                    backend.process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    backend.process.kill()
+
+class TLCClient():
+    def __init__(self, endpoints, retries=3, backoff=0.5, gzip_threshold=64*1024, timeout=60) -> None:
+        # endpoints is either a list of host:port or a shared TLCBackendPool
+        self.pool = endpoints if isinstance(endpoints, TLCBackendPool) else TLCBackendPool(endpoints)
+        self.retries = retries
+        self.backoff = backoff
+        self.gzip_threshold = gzip_threshold
+        self.timeout = timeout
+
+        # One keep-alive connection pool per endpoint, shared by all requests
+        backends = len(self.pool.backends)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=backends, pool_maxsize=max(4, backends))
+        self.session.mount('http://', adapter)
+
+        # Cleared once a server answers that it has no /execute_batch endpoint
+        self.batch_supported = True
+
+    def encode(self, event_trace) -> tuple[bytes, dict]:
+        # The reset is appended to the payload only, the caller's trace is left untouched
+        return self.compress(self.to_json(event_trace))
+
+    def encode_batch(self, event_traces) -> tuple[bytes, dict]:
+        # One flat event list, every trace terminated by its own reset
+        parts = [self.to_json(event_trace)[1:-1] for event_trace in event_traces]
+        return self.compress('[' + ','.join(parts) + ']')
+
+    def to_json(self, event_trace) -> str:
+        if isinstance(event_trace, EventTrace):
+            return event_trace.to_json(tail=[{'reset': True}])
+        return json.dumps(list(event_trace) + [{'reset': True}])
+
+    def compress(self, body) -> tuple[bytes, dict]:
+        body = body.encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        if len(body) > self.gzip_threshold:
+            body = gzip.compress(body, compresslevel=1)
+            headers['Content-Encoding'] = 'gzip'
+        return (body, headers)
+
+    def decode(self, response) -> list[dict]:
+        return [{'state': response['states'][i], 'key': response['keys'][i]} for i in range(len(response['states']))]
+
+    def execute(self, event_trace) -> list[dict]:
+        body, headers = self.encode(event_trace)
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                time.sleep(self.backoff * (2 ** (attempt - 1)))
+            backend = self.pool.acquire()
+            if backend is None:
+                # Keeps the failure that took the last backend down
+                error = error or 'no healthy backend'
+                continue
+            try:
+                r = self.session.post(f'http://{backend.endpoint}/execute', data=body, headers=headers, timeout=self.timeout)
+            except requests.ConnectionError as e:
+                # Fails over to another backend on the next attempt
+                self.pool.release(backend, failed=True)
+                error = e
+                continue
+            except requests.Timeout:
+                # A slow trace, not a dead backend, and as slow on any other
+                self.pool.release(backend)
+                raise TLCError(f'{backend.endpoint} did not answer within {self.timeout}s')
+            if r.status_code >= 500:
+                # A server error is the backend's failure, not the trace's
+                self.pool.release(backend, failed=True)
+                error = f'{backend.endpoint} answered {r.status_code}: {r.content}'
+                continue
+            self.pool.release(backend)
+            if not r.ok:
+                raise TLCError(f'Received error response from TLC, code {r.status_code}, text: {r.content}')
+            return self.decode(r.json())
+        raise TLCError(f'TLC unreachable after {self.retries + 1} attempts: {error}')
+
+    async def execute_async(self, session, event_trace) -> list[dict]:
+        body, headers = self.encode(event_trace)
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                await asyncio.sleep(self.backoff * (2 ** (attempt - 1)))
+            backend = self.pool.acquire()
+            if backend is None:
+                # Keeps the failure that took the last backend down
+                error = error or 'no healthy backend'
+                continue
+            try:
+                async with session.post(f'http://{backend.endpoint}/execute', data=body, headers=headers) as r:
+                    status = r.status
+                    text = await r.text()
+            except aiohttp.ClientConnectionError as e:
+                self.pool.release(backend, failed=True)
+                error = e
+                continue
+            except asyncio.TimeoutError:
+                self.pool.release(backend)
+                raise TLCError(f'{backend.endpoint} did not answer within {self.timeout}s')
+            if status >= 500:
+                self.pool.release(backend, failed=True)
+                error = f'{backend.endpoint} answered {status}: {text}'
+                continue
+            self.pool.release(backend)
+            if status != 200:
+                raise TLCError(f'Received error response from TLC, code {status}, text: {text}')
+            return self.decode(json.loads(text))
+        raise TLCError(f'TLC unreachable after {self.retries + 1} attempts: {error}')
+
+    async def execute_batch_async(self, session, event_traces) -> list[list[dict]]:
+        body, headers = self.encode_batch(event_traces)
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                await asyncio.sleep(self.backoff * (2 ** (attempt - 1)))
+            backend = self.pool.acquire()
+            if backend is None:
+                # Keeps the failure that took the last backend down
+                error = error or 'no healthy backend'
+                continue
+            try:
+                async with session.post(f'http://{backend.endpoint}/execute_batch', data=body, headers=headers) as r:
+                    status = r.status
+                    text = await r.text()
+            except aiohttp.ClientConnectionError as e:
+                self.pool.release(backend, failed=True)
+                error = e
+                continue
+            except asyncio.TimeoutError:
+                self.pool.release(backend)
+                raise TLCError(f'{backend.endpoint} did not answer within {self.timeout}s')
+            if status >= 500:
+                self.pool.release(backend, failed=True)
+                error = f'{backend.endpoint} answered {status}: {text}'
+                continue
+            self.pool.release(backend)
+            if status == 404:
+                raise BatchUnsupportedError(f'{backend.endpoint} has no /execute_batch endpoint')
+            if status != 200:
+                raise TLCError(f'Received error response from TLC, code {status}, text: {text}')
+            traces = json.loads(text)['traces']
+            if len(traces) != len(event_traces):
+                raise TLCError(f'TLC returned {len(traces)} traces for a batch of {len(event_traces)}')
+            return [self.decode(trace) for trace in traces]
+        raise TLCError(f'TLC unreachable after {self.retries + 1} attempts: {error}')
+
+    def execute_batch(self, event_traces) -> list:
+        # Sends the traces in one request per endpoint and splits the states
+        # back per trace. Falls back to one request per trace when the server
+        # does not know /execute_batch.
+        if not self.batch_supported:
+            return self.execute_many(event_traces)
+        return asyncio.run(self.execute_batches(event_traces))
+
+    async def execute_batches(self, event_traces) -> list:
+        event_traces = list(event_traces)
+        # One chunk per healthy backend, each lands on the least loaded one
+        chunks = min(max(1, self.pool.healthy_count()), len(event_traces))
+        if chunks == 0:
+            return []
+        bounds = [len(event_traces) * i // chunks for i in range(chunks + 1)]
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        connector = aiohttp.TCPConnector(limit=chunks)
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            async def execute_chunk(chunk):
+                try:
+                    return await self.execute_batch_async(session, chunk)
+                except BatchUnsupportedError as e:
+                    print(f'Batch evaluation unavailable, sending traces one by one: {e}')
+                    self.batch_supported = False
+                    return [await self.execute_one(session, asyncio.Semaphore(1), event_trace) for event_trace in chunk]
+                except TLCError as e:
+                    return [e for _ in chunk]
+            results = await asyncio.gather(*[execute_chunk(event_traces[bounds[i]:bounds[i+1]]) for i in range(chunks)])
+        return [states for chunk in results for states in chunk]
+
+    def execute_many(self, event_traces, concurrency=None) -> list:
+        # Evaluates the traces concurrently. Each result is either the list of
+        # states or the TLCError raised for that trace.
+        return asyncio.run(self.execute_all(event_traces, concurrency or max(1, self.pool.healthy_count())))
+
+    async def execute_all(self, event_traces, concurrency) -> list:
+        semaphore = asyncio.Semaphore(concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            return await asyncio.gather(*[self.execute_one(session, semaphore, t) for t in event_traces])
+
+    async def execute_one(self, session, semaphore, event_trace):
+        async with semaphore:
+            try:
+                return await self.execute_async(session, event_trace)
+            except TLCError as e:
+                return e
+
+    def get_stats(self) -> dict:
+        return self.pool.get_stats()
+
+    def close(self) -> None:
+        # A shared pool is closed by its owner
+        self.session.close()
+
+class TLCError(Exception):
+    pass
+
+class BatchUnsupportedError(TLCError):
+    pass
+
+def parse_tlc_state(repr) -> str:
+    # Same normalisation as parseTLCStateTrace in the Go fuzzer, the analysis
+    # scripts expect comma separated variables and [] sequences
+    repr = repr.replace('\n', ',')
+    repr = repr.replace('/\\', '')
+    repr = repr.replace('>>', ']')
+    repr = repr.replace('<<', '[')
+    return repr
+
+def split_state_parts(s) -> list[str]:
+    # Same splitting as analysis/unique_states.py, also aware of () functions
+    result = []
+    current = []
+    depth = 0
+    for char in s:
+        if char == ',' and depth == 0:
+            result.append(''.join(current).strip())
+            current = []
+        else:
+            current.append(char)
+            if char in '[{(':
+                depth += 1
+            elif char in ']})' and depth > 0:
+                depth -= 1
+    if current:
+        result.append(''.join(current).strip())
+    return result
@@ -0,0 +1,203 @@
+import sys
+import json
+import zlib
+
+from array import array
+
+# Event params that are (almost) always integers get their own column. Anything
+# else (message type, entries, reject flags, string indexes) is kept as-is in a
+# sparse per-event side table so the store stays lossless.
+INT_COLUMNS = ['node', 'from', 'to', 'term', 'index', 'log_term', 'commit',
+               'i', 'leader', 'request', 'replica', 'snapshot_index']
+
+RAW_EVENT = 0xFFFF
+# Range of the widest column type ('q'), ints outside it go to the side table
+INT_MIN, INT_MAX = -(1 << 63), (1 << 63) - 1
+
+class EventTrace():
+    def __init__(self, events=None) -> None:
+        self.names = []
+        self.name_ids = {}
+        self.keys = []
+        self.key_ids = {}
+
+        self.event_names = array('H')
+        self.masks = array('H')
+        self.columns = {column: array('i') for column in INT_COLUMNS}
+        self.column_bits = {column: 1 << i for i, column in enumerate(INT_COLUMNS)}
+        # Per event: (key order, ((key id, value), ...)) for params that are not int
+        # columns. Identical shapes are shared between events so they cost one pointer.
+        self.shapes = {}
+        self.extras = []
+
+        if events is not None:
+            self.extend(events)
+
+    def intern_name(self, name) -> int:
+        if name not in self.name_ids:
+            self.name_ids[name] = len(self.names)
+            self.names.append(sys.intern(name))
+        return self.name_ids[name]
+
+    def intern_key(self, key) -> int:
+        if key not in self.key_ids:
+            self.key_ids[key] = len(self.keys)
+            self.keys.append(sys.intern(key))
+        return self.key_ids[key]
+
+    def append(self, event) -> None:
+        if event.keys() != {'name', 'params'} or not isinstance(event['params'], dict):
+            self.event_names.append(RAW_EVENT)
+            self.masks.append(0)
+            for column in self.columns.values():
+                column.append(0)
+            self.extras.append(event)
+            return
+
+        self.event_names.append(self.intern_name(event['name']))
+        mask = 0
+        order = []
+        extra = []
+        for key, value in event['params'].items():
+            order.append(self.intern_key(key))
+            if key in self.columns and type(value) is int and INT_MIN <= value <= INT_MAX:
+                mask |= self.column_bits[key]
+            elif isinstance(value, (list, dict)):
+                # Containers (entries) are kept as their JSON text so the shape stays
+                # hashable and identical entry lists are shared
+                extra.append((-self.key_ids[key] - 1, sys.intern(json.dumps(value))))
+            else:
+                if isinstance(value, str):
+                    value = sys.intern(value)
+                extra.append((self.key_ids[key], value))
+        for key, column in self.columns.items():
+            value = event['params'][key] if mask & self.column_bits[key] else 0
+            try:
+                column.append(value)
+            except OverflowError:
+                column = self.columns[key] = array('q', column)
+                column.append(value)
+        self.masks.append(mask)
+        self.extras.append(self.intern_shape((tuple(order), tuple(extra))))
+
+    def intern_shape(self, shape) -> tuple:
+        try:
+            return self.shapes.setdefault(shape, shape)
+        except TypeError:
+            # Unhashable leftovers (e.g. sets) are stored unshared
+            return shape
+
+    def extend(self, events) -> None:
+        for e in events:
+            self.append(e)
+
+    def get_name(self, index) -> str:
+        name_id = self.event_names[index]
+        if name_id == RAW_EVENT:
+            return None
+        return self.names[name_id]
+
+    def get_param(self, index, key, default=None):
+        if key in self.columns and self.masks[index] & self.column_bits[key]:
+            return self.columns[key][index]
+        if self.event_names[index] == RAW_EVENT or key not in self.key_ids:
+            return default
+        key_id = self.key_ids[key]
+        for k, value in self.extras[index][1]:
+            if k == key_id:
+                return value
+            if k == -key_id - 1:
+                return json.loads(value)
+        return default
+
+    def materialize(self, index) -> dict:
+        if self.event_names[index] == RAW_EVENT:
+            return dict(self.extras[index])
+        order, packed = self.extras[index]
+        extra = {}
+        for k, value in packed:
+            if k < 0:
+                extra[-k - 1] = json.loads(value)
+            else:
+                extra[k] = value
+        mask = self.masks[index]
+        params = {}
+        for key_id in order:
+            key = self.keys[key_id]
+            if key in self.columns and mask & self.column_bits[key]:
+                params[key] = self.columns[key][index]
+            else:
+                params[key] = extra[key_id]
+        return {'name': self.names[self.event_names[index]], 'params': params}
+
+    def update_hash(self, h) -> None:
+        # Feeds the trace to a hashlib object straight from its columns. Equal
+        # traces built the same way intern alike and hash alike.
+        h.update(repr((self.names, self.keys, self.extras)).encode('utf-8'))
+        h.update(self.event_names.tobytes())
+        h.update(self.masks.tobytes())
+        for column in self.columns.values():
+            h.update(column.typecode.encode('utf-8'))
+            h.update(column.tobytes())
+
+    def to_list(self) -> list[dict]:
+        return [self.materialize(i) for i in range(len(self))]
+
+    def to_json(self, tail=None) -> str:
+        # Encodes one event at a time so the full list of dicts never exists at once
+        parts = [json.dumps(self.materialize(i)) for i in range(len(self))]
+        if tail is not None:
+            parts.extend(json.dumps(e) for e in tail)
+        return '[' + ','.join(parts) + ']'
+
+    def copy(self) -> 'EventTrace':
+        trace = EventTrace()
+        trace.__setstate__(self.__getstate__())
+        return trace
+
+    def __len__(self) -> int:
+        return len(self.event_names)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.materialize(i)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.materialize(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('event trace index out of range')
+        return self.materialize(index)
+
+    def __getstate__(self) -> dict:
+        # Only the columns that are actually used are shipped across processes
+        used = 0
+        for mask in self.masks:
+            used |= mask
+        return {
+            'names': self.names,
+            'keys': self.keys,
+            'event_names': zlib.compress(self.event_names.tobytes(), 1),
+            'masks': zlib.compress(self.masks.tobytes(), 1),
+            'columns': {key: (column.typecode, zlib.compress(column.tobytes(), 1))
+                        for key, column in self.columns.items() if used & self.column_bits[key]},
+            'extras': self.extras
+        }
+
+    def __setstate__(self, state) -> None:
+        self.__init__()
+        self.names = [sys.intern(n) for n in state['names']]
+        self.name_ids = {n: i for i, n in enumerate(self.names)}
+        self.keys = [sys.intern(k) for k in state['keys']]
+        self.key_ids = {k: i for i, k in enumerate(self.keys)}
+        self.event_names.frombytes(zlib.decompress(state['event_names']))
+        self.masks.frombytes(zlib.decompress(state['masks']))
+        for key in INT_COLUMNS:
+            if key in state['columns']:
+                typecode, data = state['columns'][key]
+                self.columns[key] = array(typecode, zlib.decompress(data))
+            else:
+                self.columns[key].extend([0] * len(self.event_names))
+        self.extras = [self.intern_shape(e) if isinstance(e, tuple) else e for e in state['extras']]
@@ -0,0 +1,130 @@
+import os
+import sys
+import glob
+import json
+import shutil
+import argparse
+import subprocess
+
+from modelfuzz.tlc import TLCClient, TLCBackendPool, TLCError
+
+# Builds the Ratis example jar and the TLC server jar, then fuzzes one
+# iteration end to end per scenario against a TLC server launched by the
+# fuzzer, and checks the stats of each run. Run from this directory.
+
+def build(args) -> bool:
+    steps = [(['mvn', 'clean', 'package', '-DskipTests'], args.ratis_dir),
+             (['ant', '-f', 'customBuild.xml', 'compile'], args.tlc_dir),
+             (['ant', '-f', 'customBuild.xml', 'compile-test'], args.tlc_dir),
+             (['ant', '-f', 'customBuild.xml', 'dist'], args.tlc_dir)]
+    for command, cwd in steps:
+        print(f'Running {" ".join(command)} in {cwd}')
+        if subprocess.run(command, cwd=cwd).returncode != 0:
+            print(f'{" ".join(command)} failed')
+            return False
+    return True
+
+def run_iteration(args, name, flags) -> tuple[dict, list[str]]:
+    # One worker, one iteration, one fuzzer. Returns its stats and the errors it logged.
+    output_dir = os.path.join(args.output_dir, name)
+    shutil.rmtree(output_dir, ignore_errors=True)
+    command = [sys.executable, 'main.py', '-f', 'modelfuzz', '-i', '1', '-w', '1', '-sf', '1', '-sp', '1',
+               '-st', str(args.steps), '-nts', '1', '-td', args.tlc_dir,
+               '-sd', os.path.join(output_dir, 'saved'), '-rd', os.path.join(output_dir, 'results'),
+               '-ed', os.path.join(output_dir, 'errors'), '-rdd', os.path.join(output_dir, 'data')] + flags
+    print(f'Running {name}: {" ".join(command)}')
+    try:
+        subprocess.run(command, timeout=args.run_timeout)
+    except subprocess.TimeoutExpired:
+        return (None, [f'no result within {args.run_timeout}s'])
+    errors = [os.path.basename(p) for p in glob.glob(os.path.join(output_dir, 'errors', '**', '*.json'), recursive=True)]
+    try:
+        with open(os.path.join(output_dir, 'results', 'experiment_stats.json')) as f:
+            stats = json.load(f)['0']['modelfuzz']
+    except (OSError, ValueError, KeyError):
+        return (None, errors + ['no readable experiment_stats.json'])
+    return (stats, errors)
+
+def check(name, stats, errors, expectations) -> list[str]:
+    # expectations: (description, predicate on the stats)
+    failures = [f'{name}: {e}' for e in errors]
+    if stats is not None:
+        failures += [f'{name}: expected {what}' for what, holds in expectations if not holds(stats)]
+    print(f'{name}: {"ok" if len(failures) == 0 else "FAILED"}')
+    for failure in failures:
+        print(f'  {failure}')
+    return failures
+
+def check_batch(args) -> list[str]:
+    # /execute_batch with gzipped bodies must give every trace the states /execute gives it
+    params = argparse.Namespace(tlc_spec=args.tlc_spec, tlc_jar=args.tlc_jar, tlc_mapper_params='name=raft',
+                                base_tlc_port=args.base_tlc_port, tlc_dir=args.tlc_dir, tlc_startup_timeout=120)
+    pool = TLCBackendPool.launch(params, 1)
+    client = TLCClient(pool, gzip_threshold=0)
+    failures = []
+    try:
+        traces = [[], []]
+        single = [client.execute(trace) for trace in traces]
+        batch = client.execute_batch(traces)
+        if not client.batch_supported:
+            failures.append('batch: TLC has no /execute_batch endpoint')
+        elif batch != single:
+            failures.append(f'batch: expected the states of /execute, got {batch}')
+    except TLCError as e:
+        failures.append(f'batch: {e}')
+    finally:
+        client.close()
+        pool.close()
+    print(f'batch: {"ok" if len(failures) == 0 else "FAILED"}')
+    for failure in failures:
+        print(f'  {failure}')
+    return failures
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-rtd', '--ratis-dir', type=str, default='..')
+    parser.add_argument('-td', '--tlc-dir', type=str, default='../../tlc-controlled-with-benchmarks/tlc-controlled')
+    parser.add_argument('-tj', '--tlc-jar', type=str, default='dist/tla2tools_server.jar') # Relative to the TLC dir
+    parser.add_argument('-tsp', '--tlc-spec', type=str, default='../tla-benchmarks/Raft/model/RAFT_3_3.tla')
+    parser.add_argument('-btp', '--base-tlc-port', type=int, default=2123) # Of the TLC server of the batch check
+    parser.add_argument('-sb', '--skip-build', action='store_true') # Use the jars of an earlier build
+    parser.add_argument('-st', '--steps', type=int, default=100)
+    parser.add_argument('-rt', '--run-timeout', type=int, default=600) # Seconds per scenario
+    parser.add_argument('-od', '--output-dir', type=str, default='./output/smoke')
+    return parser.parse_args()
+
+def main() -> None:
+    args = parse_args()
+    if not args.skip_build and not build(args):
+        sys.exit(1)
+
+    failures = []
+    # One JVM per node. Nodes register with the shared network hub and send
+    # their Run-Id, TLC evaluates the trace.
+    stats, errors = run_iteration(args, 'per-process', [])
+    failures += check('per-process', stats, errors, [
+        ('coverage', lambda s: len(s['coverage']) > 0 and s['coverage'][-1] > 0),
+        ('no lost traces', lambda s: s['lost_traces'] == 0)])
+
+    # One-message mailboxes and Drop/Partition faults: the waiting interceptor
+    # calls are answered with 'dropped' instead of running into their timeout
+    stats, errors = run_iteration(args, 'dropped', ['-mbc', '1', '-fq', '3'])
+    failures += check('dropped', stats, errors, [
+        ('dropped messages', lambda s: s['dropped_messages'] > 0),
+        ('coverage', lambda s: len(s['coverage']) > 0 and s['coverage'][-1] > 0)])
+
+    # All nodes of the cluster in one CounterClusterHost JVM, which needs --crash-quota 0
+    stats, errors = run_iteration(args, 'cluster-host', ['-chm', '-cq', '0', '-fq', '3'])
+    failures += check('cluster-host', stats, errors, [
+        ('coverage', lambda s: len(s['coverage']) > 0 and s['coverage'][-1] > 0),
+        ('no lost traces', lambda s: s['lost_traces'] == 0)])
+
+    failures += check_batch(args)
+
+    if len(failures) > 0:
+        print(f'{len(failures)} check(s) failed')
+        sys.exit(1)
+    print('All scenarios passed')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,21 @@
+import unittest
+
+from modelfuzz.schedule import schedule_key
+
+def partitions_then_heals(heal_order, ids=(0, 1)) -> list[dict]:
+    return [{'type': 'Partition', 'nodes': [1], 'partition_id': ids[0]},
+            {'type': 'Schedule', 'node': 2, 'to': 3, 'max_msgs': 1},
+            {'type': 'Partition', 'nodes': [2], 'partition_id': ids[1]},
+            {'type': 'Heal', 'partition_id': ids[heal_order[0]]},
+            {'type': 'Schedule', 'node': 1, 'to': 2, 'max_msgs': 1},
+            {'type': 'Heal', 'partition_id': ids[heal_order[1]]}]
+
+class ScheduleKeyTest(unittest.TestCase):
+    def test_heal_order_changes_the_key(self) -> None:
+        self.assertNotEqual(schedule_key(partitions_then_heals((0, 1))), schedule_key(partitions_then_heals((1, 0))))
+
+    def test_partition_ids_do_not_change_the_key(self) -> None:
+        self.assertEqual(schedule_key(partitions_then_heals((1, 0))), schedule_key(partitions_then_heals((1, 0), ids=(7, 3))))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,18 @@
+import pickle
+import unittest
+
+from modelfuzz.trace import EventTrace
+
+class EventTraceTest(unittest.TestCase):
+    def test_ints_beyond_int32_and_int64(self) -> None:
+        events = [{'name': 'SendMessage', 'params': {'node': 1, 'term': 2}},
+                  {'name': 'SendMessage', 'params': {'node': 1, 'term': 1 << 40}},
+                  {'name': 'SendMessage', 'params': {'node': 1, 'term': 1 << 70}},
+                  {'name': 'SendMessage', 'params': {'node': 1, 'term': -(1 << 64)}}]
+        trace = EventTrace(events)
+        self.assertEqual(trace.to_list(), events)
+        self.assertEqual(trace.get_param(2, 'term'), 1 << 70)
+        self.assertEqual(pickle.loads(pickle.dumps(trace)).to_list(), events)
+
+if __name__ == '__main__':
+    unittest.main()
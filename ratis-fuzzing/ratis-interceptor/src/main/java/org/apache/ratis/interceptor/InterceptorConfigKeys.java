@@ -52,6 +52,18 @@ public interface InterceptorConfigKeys {
         setBoolean(properties::setBoolean, ENABLE_REGISTER_KEY, enableRegister);
     }
 
+    // Sent with every request to the fuzzer, which drops requests of nodes left over from an earlier run
+    String RUN_ID_KEY = PREFIX + ".run_id";
+    String RUN_ID_DEFAULT = "";
+
+    static String runId(RaftProperties properties) {
+        return get(properties::get, RUN_ID_KEY, RUN_ID_DEFAULT, getDefaultLog());
+    }
+
+    static void setRunId(RaftProperties properties, String runId) {
+        set(properties::set, RUN_ID_KEY, runId);
+    }
+
     interface Server {
         Logger LOG = LoggerFactory.getLogger(Server.class);
 
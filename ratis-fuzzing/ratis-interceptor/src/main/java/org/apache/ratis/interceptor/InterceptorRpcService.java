@@ -127,7 +127,8 @@ public class InterceptorRpcService extends RaftServerRpcWithProxy<InterceptorRpc
         this.intercept = InterceptorConfigKeys.enabled(server.getProperties());
         TimeDuration replyWaitTimeout = InterceptorConfigKeys.replyWaitTimeout(server.getProperties());
         boolean enableRegister = InterceptorConfigKeys.enableRegister(server.getProperties());
-        this.iClient = this.intercept ? new InterceptorClient(server, this.serverAddress, this.iListenerAddress, replyWaitTimeout, this::handle, enableRegister) : null;
+        String runId = InterceptorConfigKeys.runId(server.getProperties());
+        this.iClient = this.intercept ? new InterceptorClient(server, this.serverAddress, this.iListenerAddress, replyWaitTimeout, this::handle, enableRegister, runId) : null;
 
         final ChannelInitializer<SocketChannel> initializer
             = new ChannelInitializer<SocketChannel>() {
@@ -50,6 +50,7 @@ public class InterceptorClient {
     private boolean shutdown;
     // private boolean crash;
     private boolean enableRegister;
+    private String runId;
 
     public InterceptorClient(
         RaftServer raftServer, 
@@ -57,7 +58,8 @@ public class InterceptorClient {
         InetSocketAddress listenAddress, 
         TimeDuration replyWaitTime,
         MessageHandler messageHandler,
-        boolean enableRegister
+        boolean enableRegister,
+        String runId
     ) {
         this.raftServer = raftServer;
         this.fuzzerAddress = fuzzerAddress;
@@ -70,6 +72,7 @@ public class InterceptorClient {
         this.shutdown = false;
         // this.crash = false;
         this.enableRegister = enableRegister;
+        this.runId = runId;
 
         try {
             this.listenServer = new InterceptorServer(listenAddress);
@@ -109,8 +112,7 @@ public class InterceptorClient {
         String registerString = gson.toJson(ob);
 
         MediaType JSON = MediaType.parse("application/json; charset=utf-8");
-        Request request = new Request.Builder()
-                .url("http://"+this.fuzzerAddress.toString()+"/replica")
+        Request request = newRequest("/replica")
                 .post(RequestBody.create(JSON, registerString))
                 .build();
 
@@ -120,6 +122,15 @@ public class InterceptorClient {
         }
     }
 
+    private Request.Builder newRequest(String path) {
+        Request.Builder builder = new Request.Builder()
+                .url("http://"+this.fuzzerAddress.toString()+path);
+        if (this.runId != null && !this.runId.isEmpty()) {
+            builder.header("Run-Id", this.runId);
+        }
+        return builder;
+    }
+
     public String getNewRequestId() {
         return this.raftServer.getId().toString() + "_" + Integer.toString(this.counter.getAndIncrement());
     }
@@ -135,8 +146,7 @@ public class InterceptorClient {
     private void sendMessageToServer(String message) throws IOException {
         LOG.debug("Sending message: "+message);
         MediaType JSON = MediaType.parse("application/json; charset=utf-8");
-        Request request = new Request.Builder()
-                .url("http://"+this.fuzzerAddress.toString()+"/message")
+        Request request = newRequest("/message")
                 .post(RequestBody.create(JSON, message))
                 .build();
 
@@ -179,8 +189,7 @@ public class InterceptorClient {
     public void sendEventToServer(String jsonEvent) throws IOException {
         LOG.debug("Sending event: "+jsonEvent);
         MediaType JSON = MediaType.parse("application/json; charset=utf-8");
-        Request request = new Request.Builder()
-                .url("http://"+this.fuzzerAddress.toString()+"/event")
+        Request request = newRequest("/event")
                 .post(RequestBody.create(JSON, jsonEvent))
                 .build();
 
@@ -268,7 +277,12 @@ public class InterceptorClient {
                             LOG.debug("Processing new message from " + message.getFrom() + " to " + message.getTo() + " of type " + message.getType());
                             String requestID = message.getRequestId();
                             CompletableFuture<InterceptorMessage> messageFuture = pendingRequests.get(requestID);
-                            if(messageFuture != null) {
+                            if(messageFuture != null && message.getType().equals("dropped")) {
+                                // The fuzzer dropped the request or its reply, fail the call like a lost RPC
+                                LOG.debug("request dropped by the fuzzer: "+requestID);
+                                messageFuture.completeExceptionally(new IOException("Dropped by the fuzzer: "+requestID));
+                                pendingRequests.remove(requestID);
+                            } else if(messageFuture != null) {
                                 // Then this is a reply message to a request that is sent
                                 LOG.debug("received a response for id: "+requestID);
                                 messageFuture.complete(message);
@@ -276,6 +290,9 @@ public class InterceptorClient {
                             } else {
                                 if (message.getType().equals("shutdown")) {
                                     this.iClient.setShutdown(true);
+                                } else if (message.getType().equals("dropped")) {
+                                    // The call already timed out
+                                    continue;
                                 } 
                                 // else if (message.getType().equals("crash")) {
                                 //     this.iClient.setCrash(true);
@@ -291,7 +291,7 @@ public class InterceptorMessage {
                 data = InterceptorMessageUtils.fromRaftClientReply(this.raftClientReply);
                 to = this.raftClientReply.getRpcReply().getRequestorId().toStringUtf8();
                 type = InterceptorMessageUtils.MessageType.RaftClientReply.toString();
-            } else if (this.mType.equals("shutdown") || this.mType.equals("crash")) {
+            } else if (this.mType.equals("shutdown") || this.mType.equals("crash") || this.mType.equals("dropped")) {
                 data = null;
                 to = null;
                 type = this.mType;
@@ -363,6 +363,9 @@ public class InterceptorMessage {
                     case Crash:
                         builder.setType("crash");
                         break;
+                    case Dropped:
+                        builder.setType("dropped");
+                        break;
                     default:
                         break;
                 }
@@ -34,6 +34,7 @@ public class InterceptorMessageUtils {
         RaftClientReply("raft_client_reply"),
         Shutdown("shutdown"),
         Crash("crash"),
+        Dropped("dropped"),
         None("");
 
         private String type;
@@ -71,6 +72,8 @@ public class InterceptorMessageUtils {
                     return Shutdown;
                 case "crash":
                     return Crash;
+                case "dropped":
+                    return Dropped;
                 default:
                     return None;
             }
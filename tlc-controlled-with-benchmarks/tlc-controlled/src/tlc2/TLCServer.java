@@ -1,6 +1,7 @@
 package tlc2;
 
 import java.io.IOException;
+import java.io.InputStream;
 import java.io.OutputStream;
 import java.net.InetSocketAddress;
 import java.nio.charset.StandardCharsets;
@@ -9,6 +10,7 @@ import java.util.ArrayList;
 import java.util.Arrays;
 import java.util.List;
 import java.util.Queue;
+import java.util.zip.GZIPInputStream;
 
 import com.google.gson.Gson;
 import com.sun.net.httpserver.*;
@@ -50,21 +52,40 @@ public class TLCServer extends TLC {
     }
 
     public List<TLCState> simulate(String input) throws Exception{
+		Queue<ActionWrapper> actionsToRun = new ArrayDeque<ActionWrapper>();
+        actionsToRun.addAll(this.mapper.mapListOfActions(input));
+        return simulate(actionsToRun);
+    }
+
+    // Simulates every reset-terminated trace in the input, one after another
+    public List<List<TLCState>> simulateBatch(String input) throws Exception{
+		Queue<ActionWrapper> actionsToRun = new ArrayDeque<ActionWrapper>();
+        actionsToRun.addAll(this.mapper.mapListOfActions(input));
+        List<List<TLCState>> traces = new ArrayList<List<TLCState>>();
+        while(!actionsToRun.isEmpty()) {
+            traces.add(simulate(actionsToRun));
+        }
+        return traces;
+    }
+
+    private List<TLCState> simulate(Queue<ActionWrapper> actionsToRun) throws Exception{
         
         StateVec initStates = computeInitStates(this.tool);
-		Queue<ActionWrapper> actionsToRun = new ArrayDeque<ActionWrapper>();
 		List<TLCState> statesVisited = new ArrayList<TLCState>();
 
         StateVec nextStates = new StateVec(1);
         TLCState curState = randomState(initStates);
 
         statesVisited.add(curState);
-        actionsToRun.addAll(this.mapper.mapListOfActions(input));
         while(true) {
             nextStates.clear();
             while(nextStates.empty()) {
                 ActionWrapper nextAction = actionsToRun.remove();
                 if(nextAction.isReset() || nextAction.isQuit() || nextAction.action.equals(Action.UNKNOWN)) {
+                    // Skip the rest of a trace that ended early so the next one starts at its own events
+                    while(!nextAction.isReset() && !actionsToRun.isEmpty()) {
+                        nextAction = actionsToRun.remove();
+                    }
                     return this.abstractor.doAbstraction(statesVisited);
                 }
                 nextStates = nextStates.addElements(tool.getNextStates(nextAction.action, curState));
@@ -158,6 +179,33 @@ public class TLCServer extends TLC {
             this.states = states;
             this.keys = keys;
         }
+
+        public ServerResponse(List<TLCState> trace) {
+            this.states = new ArrayList<>();
+            this.keys = new ArrayList<>();
+            for( TLCState state : trace) {
+                this.states.add(state.toString());
+                this.keys.add(state.fingerPrint());
+            }
+        }
+    }
+
+    public static class BatchResponse {
+        public List<ServerResponse> traces;
+
+        public BatchResponse(List<ServerResponse> traces) {
+            this.traces = traces;
+        }
+    }
+
+    private static String readRequest(HttpExchange t) throws IOException {
+        InputStream requestBody = t.getRequestBody();
+        String encoding = t.getRequestHeaders().getFirst("Content-Encoding");
+        if (encoding != null && encoding.equalsIgnoreCase("gzip")) {
+            requestBody = new GZIPInputStream(requestBody);
+        }
+        byte[] requestBytes = requestBody.readAllBytes();
+        return new String(requestBytes, StandardCharsets.UTF_8);
     }
 
     public static void main(String[] args) throws Exception {
@@ -199,8 +247,7 @@ public class TLCServer extends TLC {
                         return;
                     }
                     try {
-                        byte[] requestBytes = t.getRequestBody().readAllBytes();
-                        String request = new String(requestBytes, StandardCharsets.UTF_8);
+                        String request = readRequest(t);
                         List<TLCState> trace = tlcServer.simulate(request);
                         List<String> stringTrace = new ArrayList<>();
                         List<Long> fingerprintTrace = new ArrayList<>();
@@ -223,6 +270,33 @@ public class TLCServer extends TLC {
                     }
                 }
             });
+            httpServer.createContext("/execute_batch", new HttpHandler() {
+                public void handle(HttpExchange t) throws IOException {
+                    if(!t.getRequestMethod().equalsIgnoreCase("POST")) {
+                        t.sendResponseHeaders(405, -1);
+                        return;
+                    }
+                    try {
+                        String request = readRequest(t);
+                        List<ServerResponse> traces = new ArrayList<>();
+                        for (List<TLCState> trace : tlcServer.simulateBatch(request)) {
+                            traces.add(new ServerResponse(trace));
+                        }
+                        Gson gson = new Gson();
+                        byte[] response = gson.toJson(new BatchResponse(traces)).getBytes(StandardCharsets.UTF_8);
+                        t.sendResponseHeaders(200, response.length);
+                        OutputStream responseStream = t.getResponseBody();
+                        responseStream.write(response);
+                        responseStream.close();
+                    } catch (Exception e) {
+                        String errorMessage = String.valueOf(e.getMessage());
+                        t.sendResponseHeaders(500, errorMessage.length());
+                        OutputStream response = t.getResponseBody();
+                        response.write(errorMessage.getBytes());
+                        response.close();
+                    }
+                }
+            });
             httpServer.setExecutor(null);
             System.out.println("Server starts listening on port: "+Integer.toString(serverPort));
             httpServer.start();
@@ -5,6 +5,7 @@ import java.util.*;
 import tlc2.tool.Action;
 import tlc2.value.impl.BoolValue;
 import tlc2.value.impl.IntValue;
+import tlc2.value.impl.RecordValue;
 import tlc2.value.impl.Value;
 
 public class RaftActionMapper extends BaseActionMapper{
@@ -269,6 +270,50 @@ public class RaftActionMapper extends BaseActionMapper{
         return null;
     }
 
+    private static final Map<String, String> MESSAGE_TYPES = Map.of(
+        "MsgVote", "RequestVoteRequest",
+        "MsgVoteResp", "RequestVoteResponse",
+        "MsgApp", "AppendEntriesRequest",
+        "MsgAppResp", "AppendEntriesResponse"
+    );
+
+    private Value recordField(RecordValue record, String field) {
+        for (int k = 0; k < record.names.length; k++) {
+            if (record.names[k].toString().equals(field)) {
+                return record.values[k];
+            }
+        }
+        return null;
+    }
+
+    private boolean fieldEquals(RecordValue record, String field, String expected) {
+        Value value = this.recordField(record, field);
+        return value != null && value.toString().replace("\"", "").equals(expected);
+    }
+
+    // DropMessage(m) and DuplicateMessage(m) of specs that keep messages in flight
+    // (raft.tla). Specs without a message bag (raft_enhanced) have neither action,
+    // a dropped message is just never delivered there.
+    protected Action mapMessageFault(String name, String type, int from, int to, int term) {
+        if (!this.enabledActionMap.containsKey(name) || !MESSAGE_TYPES.containsKey(type)) {
+            return null;
+        }
+        for (Action a : this.enabledActionMap.get(name)) {
+            Value m = a.getParams().get("m");
+            if (!(m instanceof RecordValue)) {
+                continue;
+            }
+            RecordValue record = (RecordValue) m;
+            if (this.fieldEquals(record, "mtype", MESSAGE_TYPES.get(type))
+                    && this.fieldEquals(record, "msource", Integer.toString(from))
+                    && this.fieldEquals(record, "mdest", Integer.toString(to))
+                    && this.fieldEquals(record, "mterm", Integer.toString(term))) {
+                return a;
+            }
+        }
+        return null;
+    }
+
     public Action mapAction(AbstractAction abstractAction) {
         try {
             switch (abstractAction.name) {
@@ -305,6 +350,21 @@ public class RaftActionMapper extends BaseActionMapper{
                     return mapClientRequest(requestID.get().intValue(), leader.get().intValue());
                 case "SendMessage":
                     break;
+                case "DropMessage":
+                case "DuplicateMessage":
+                    Optional<String> faultType = this.getParam(abstractAction, "type");
+                    Optional<Double> faultFrom = this.getParam(abstractAction, "from");
+                    Optional<Double> faultTo = this.getParam(abstractAction, "to");
+                    Optional<Double> faultTerm = this.getParam(abstractAction, "term");
+                    if(faultType.isEmpty() || faultFrom.isEmpty() || faultTo.isEmpty() || faultTerm.isEmpty()) {
+                        return null;
+                    }
+                    return mapMessageFault(abstractAction.name, faultType.get(), faultFrom.get().intValue(),
+                        faultTo.get().intValue(), faultTerm.get().intValue());
+                case "Partition":
+                case "Heal":
+                    // No spec action, the messages a partition loses come as DropMessage
+                    return null;
                 case "DeliverMessage":
                     Optional<String> messageType = this.getParam(abstractAction, "type");
                     if(messageType.isEmpty()) {